@@ -18,3 +18,7 @@ ALTER TABLE lp_products ADD COLUMN IF NOT EXISTS tone_manner jsonb DEFAULT '{}';
 ALTER TABLE lp_products ADD COLUMN IF NOT EXISTS product_image_urls jsonb DEFAULT '[]';
 ALTER TABLE lp_products ADD COLUMN IF NOT EXISTS reference_lp_image_urls jsonb DEFAULT '[]';
 ALTER TABLE lp_products ADD COLUMN IF NOT EXISTS tone_manner_image_urls jsonb DEFAULT '[]';
+
+-- prompts テーブルの変更検知用（件数と最新の updated_at だけを確認して、変わった時だけ全件を読み直す）
+ALTER TABLE prompts ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_prompts_updated_at ON prompts (updated_at DESC);
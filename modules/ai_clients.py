@@ -0,0 +1,166 @@
+"""
+AI SDKクライアントのプロセス共有レジストリ
+プロバイダ×APIキーごとにクライアントを1つだけ生成し、HTTPコネクションプール（keep-alive）を使い回す
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# コネクションプール設定
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60.0  # 秒
+# 再試行はrate_limiterのスケジューラが担うため、SDK内蔵のリトライは無効化する
+SDK_MAX_RETRIES = 0
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str], Any] = {}
+_gemini_models: Dict[Tuple[str, str], Any] = {}
+_gemini_configured_key = None
+# 非同期クライアントはイベントループに紐づくため、ループごとに保持する
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], Any]]" = weakref.WeakKeyDictionary()
+
+
+def _httpx_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def _get_or_create(key: Tuple[str, str], factory):
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+
+def get_anthropic_client(api_key: str):
+    """共有のanthropic.Anthropicクライアントを取得"""
+    def factory():
+        import anthropic
+        return anthropic.Anthropic(
+            api_key=api_key,
+            max_retries=SDK_MAX_RETRIES,
+            http_client=anthropic.DefaultHttpxClient(limits=_httpx_limits())
+        )
+    return _get_or_create(("anthropic", api_key), factory)
+
+
+def get_openai_client(api_key: str):
+    """共有のOpenAIクライアントを取得"""
+    def factory():
+        import openai
+        return openai.OpenAI(
+            api_key=api_key,
+            max_retries=SDK_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=_httpx_limits())
+        )
+    return _get_or_create(("openai", api_key), factory)
+
+
+def _get_or_create_async(key: Tuple[str, str], factory):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.get(loop)
+        if per_loop is None:
+            per_loop = {}
+            _async_clients[loop] = per_loop
+        client = per_loop.get(key)
+        if client is None:
+            client = factory()
+            per_loop[key] = client
+        return client
+
+
+def get_async_anthropic_client(api_key: str):
+    """実行中イベントループ用の共有anthropic.AsyncAnthropicクライアントを取得"""
+    def factory():
+        import anthropic
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            max_retries=SDK_MAX_RETRIES,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=_httpx_limits())
+        )
+    return _get_or_create_async(("anthropic", api_key), factory)
+
+
+def get_async_openai_client(api_key: str):
+    """実行中イベントループ用の共有openai.AsyncOpenAIクライアントを取得"""
+    def factory():
+        import openai
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            max_retries=SDK_MAX_RETRIES,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_httpx_limits())
+        )
+    return _get_or_create_async(("openai", api_key), factory)
+
+
+async def close_async_clients():
+    """実行中イベントループ用の非同期クライアントを閉じて破棄（ループを終える前に呼ぶ）"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.pop(loop, None) or {}
+    for client in per_loop.values():
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"[DEBUG] async client close failed: {e}")
+
+
+def get_gemini_model(api_key: str, model_name: str):
+    """共有のgenai.GenerativeModelを取得（genai.configureはキーが変わった時だけ実行）"""
+    global _gemini_configured_key
+    import google.generativeai as genai
+
+    model = _gemini_models.get((api_key, model_name))
+    if model is not None and _gemini_configured_key == api_key:
+        return model
+    with _lock:
+        if _gemini_configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_configured_key = api_key
+            _gemini_models.clear()
+        model = _gemini_models.get((api_key, model_name))
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[(api_key, model_name)] = model
+        return model
+
+
+def get_http_session() -> requests.Session:
+    """画像取得などに使う共有requests.Session"""
+    def factory():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_KEEPALIVE_CONNECTIONS, pool_maxsize=MAX_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_or_create(("http", ""), factory)
+
+
+def reset_clients():
+    """全クライアントを破棄（APIキー変更時やテスト用）"""
+    global _gemini_configured_key
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
+        _async_clients.clear()
+        _gemini_models.clear()
+        _gemini_configured_key = None
@@ -1,19 +1,69 @@
 import os
-from typing import Dict, Any, List, Optional
+import asyncio
+import base64
+import uuid
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Union
 import json
 import streamlit as st
-from modules.usage_tracker import UsageTracker
+from modules.usage_tracker import get_usage_tracker
+from modules.ai_clients import (
+    get_anthropic_client, get_openai_client, get_gemini_model, get_http_session,
+    get_async_anthropic_client, get_async_openai_client
+)
+from modules.concurrency import DEFAULT_MAX_WORKERS, gather_limited, run_in_thread, run_sync
+from modules.response_cache import get_response_cache, make_cache_key, DEFAULT_BYPASS_TASKS
+from modules.rate_limiter import get_rate_limiter, estimate_tokens
+from modules.image_cache import get_image_cache
+from modules.budget import estimate_text_cost, estimate_image_cost
+
+# ask()がエラー時に返す文字列の接頭辞（キャッシュ対象外の判定に使用）
+ERROR_RESPONSE_PREFIXES = ("エラー:", "Anthropic APIエラー:", "OpenAI APIエラー:", "Gemini APIエラー:")
+
+def _sniff_mime_type(data: Union[bytes, bytearray, memoryview]) -> str:
+    """先頭バイトから画像のMIMEタイプを判定（不明ならJPEG扱い）"""
+    head = bytes(data[:12])
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+class StreamInterrupted(Exception):
+    """ストリーミング応答が途中で失敗した（エラー文はyield済み）"""
+
+
+class ResponseStream:
+    """ask_stream()の戻り値。応答の断片を順に返し、最後まで受信できたかを completed に持つ"""
+
+    def __init__(self):
+        self.completed = False
+        self._chunks: Iterator[str] = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
 
 class AIProvider:
-    def __init__(self, settings: Dict[str, Any]):
+    def __init__(self, settings: Dict[str, Any], product_id: str = None):
         self.settings = settings
+        # 使用量の製品別集計に使う（未指定なら選択中の製品）
+        self.product_id = product_id
+        # 一括処理の予算（BudgetRun）。設定中は実績コストを積算する
+        self.budget_run = None
         self.current_provider = settings.get("default_provider", "gemini")
         self.current_model = settings.get("default_model", "gemini-1.5-flash")
         self.anthropic_api_key = (os.getenv("ANTHROPIC_API_KEY") or "").strip().strip('"').strip("'")
         self.openai_api_key = (os.getenv("OPENAI_API_KEY") or "").strip().strip('"').strip("'")
         self.google_api_key = (os.getenv("GOOGLE_API_KEY") or "").strip().strip('"').strip("'")
     
-    def ask(self, prompt: str, task: str = "chat", images: List[Any] = None) -> str:
+    def _resolve_provider(self, images: List[Any] = None) -> Optional[str]:
+        """テキスト生成に使うプロバイダを決定（APIキーが無ければ利用可能なものにフォールバック）"""
         # タスク別プロバイダ対応
         task_models = self.settings.get("task_models", {})
         if images and "image_analysis_provider" in task_models:
@@ -21,127 +71,418 @@ class AIProvider:
         else:
             provider = self.settings.get("llm_provider", self.settings.get("provider", self.current_provider))
         
-        if provider == "anthropic" and self.anthropic_api_key:
-            return self._ask_anthropic(prompt, images)
-        elif provider == "openai" and self.openai_api_key:
-            return self._ask_openai(prompt, images)
-        elif provider == "gemini" and self.google_api_key:
-            return self._ask_gemini(prompt, images)
+        api_keys = {
+            "anthropic": self.anthropic_api_key,
+            "openai": self.openai_api_key,
+            "gemini": self.google_api_key
+        }
+        if api_keys.get(provider):
+            return provider
+        # フォールバック：利用可能なAPIを探す
+        for fallback in ["gemini", "anthropic", "openai"]:
+            if api_keys[fallback]:
+                return fallback
+        return None
+    
+    def _resolve_model(self, provider: str, images: List[Any] = None) -> str:
+        """プロバイダごとのテキスト生成モデル名"""
+        if provider == "anthropic":
+            return self.settings.get("model", "claude-3-5-sonnet-20241022")
+        elif provider == "openai":
+            return self.settings.get("model", "gpt-4o-mini")
+        # タスク別モデル選択
+        task_models = self.settings.get("task_models", {})
+        if images and "image_analysis" in task_models:
+            return task_models["image_analysis"]
+        return self.settings.get("llm_model", self.settings.get("model", "gemini-2.0-flash"))
+    
+    def _get_cache(self, task: str, use_cache: Optional[bool]):
+        """このリクエストで使うレスポンスキャッシュ（対象外ならNone）"""
+        if use_cache is False:
+            return None
+        cache = get_response_cache(self.settings)
+        if cache is None:
+            return None
+        bypass_tasks = self.settings.get("response_cache", {}).get("bypass_tasks", DEFAULT_BYPASS_TASKS)
+        if use_cache is None and task in bypass_tasks:
+            return None
+        return cache
+    
+    def _read_cache(self, cache, provider: str, prompt: str, task: str, images: List[Any] = None):
+        """キャッシュを引いて (キー, 応答 or None) を返し、ヒット/ミスを使用量ログに記録"""
+        cache_key = make_cache_key(provider, self._resolve_model(provider, images), prompt, images)
+        cached = cache.get(cache_key)
+        try:
+            get_usage_tracker().record_cache_event(task, cached is not None)
+        except Exception as e:
+            print(f"[DEBUG] record_cache_event error: {e}")
+        return cache_key, cached
+    
+    def ask(self, prompt: str, task: str = "chat", images: List[Any] = None, use_cache: Optional[bool] = None) -> str:
+        """プロンプトを送信して応答テキストを返す
+        use_cache: None=設定に従う / False=キャッシュを使わない / True=バイパス対象タスクでも使う"""
+        provider = self._resolve_provider(images)
+        if provider is None:
+            return "エラー: APIキーが設定されていません。設定画面でAPIキーを確認してください。"
+        
+        cache = self._get_cache(task, use_cache)
+        if cache:
+            cache_key, cached = self._read_cache(cache, provider, prompt, task, images)
+            if cached is not None:
+                return cached
+        
+        if provider == "anthropic":
+            response = self._ask_anthropic(prompt, images, task)
+        elif provider == "openai":
+            response = self._ask_openai(prompt, images, task)
         else:
-            # フォールバック：利用可能なAPIを探す
-            if self.google_api_key:
-                return self._ask_gemini(prompt, images)
-            elif self.anthropic_api_key:
-                return self._ask_anthropic(prompt, images)
-            elif self.openai_api_key:
-                return self._ask_openai(prompt, images)
-            else:
-                return "エラー: APIキーが設定されていません。設定画面でAPIキーを確認してください。"
+            response = self._ask_gemini(prompt, images, task)
+        
+        if cache and response and not response.startswith(ERROR_RESPONSE_PREFIXES):
+            cache.put(cache_key, response, task)
+        return response
+    
+    async def ask_async(self, prompt: str, task: str = "chat", images: List[Any] = None, use_cache: Optional[bool] = None) -> str:
+        """ask()の非同期版"""
+        provider = self._resolve_provider(images)
+        if provider is None:
+            return "エラー: APIキーが設定されていません。設定画面でAPIキーを確認してください。"
+        
+        cache = self._get_cache(task, use_cache)
+        if cache:
+            cache_key, cached = self._read_cache(cache, provider, prompt, task, images)
+            if cached is not None:
+                return cached
+        
+        if provider == "anthropic":
+            response = await self._ask_anthropic_async(prompt, images, task)
+        elif provider == "openai":
+            response = await self._ask_openai_async(prompt, images, task)
+        else:
+            # google.generativeaiの非同期クライアントは最初のイベントループに固定されるため、
+            # ページごとにループを作り直すStreamlitではスレッド実行の方が安全
+            response = await run_in_thread(self._ask_gemini, prompt, images, task)
+        
+        if cache and response and not response.startswith(ERROR_RESPONSE_PREFIXES):
+            cache.put(cache_key, response, task)
+        return response
+    
+    def ask_stream(self, prompt: str, task: str = "chat", images: List[Any] = None, use_cache: Optional[bool] = None) -> "ResponseStream":
+        """ask()のストリーミング版。応答テキストを受信した断片ごとに返す（st.write_streamにそのまま渡せる）
+        途中で失敗した場合は completed が False のまま（キャッシュにも保存しない）"""
+        result = ResponseStream()
+        result._chunks = self._stream_response(result, prompt, task, images, use_cache)
+        return result
+    
+    def _stream_response(self, result: "ResponseStream", prompt: str, task: str, images: List[Any], use_cache: Optional[bool]) -> Iterator[str]:
+        provider = self._resolve_provider(images)
+        if provider is None:
+            yield "エラー: APIキーが設定されていません。設定画面でAPIキーを確認してください。"
+            return
+        
+        cache = self._get_cache(task, use_cache)
+        if cache:
+            cache_key, cached = self._read_cache(cache, provider, prompt, task, images)
+            if cached is not None:
+                yield cached
+                result.completed = True
+                return
+        
+        if provider == "anthropic":
+            stream = self._ask_anthropic_stream(prompt, images, task)
+        elif provider == "openai":
+            stream = self._ask_openai_stream(prompt, images, task)
+        else:
+            stream = self._ask_gemini_stream(prompt, images, task)
+        
+        chunks = []
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        except StreamInterrupted as e:
+            # エラー文は表示済み。途中までの応答はキャッシュしない
+            print(f"[DEBUG] ask_stream interrupted: {e}")
+            return
+        
+        result.completed = True
+        response = "".join(chunks)
+        if cache and response and not response.startswith(ERROR_RESPONSE_PREFIXES):
+            cache.put(cache_key, response, task)
+    
+    async def ask_many_async(self, prompts: List[str], task: str = "chat", max_concurrency: int = DEFAULT_MAX_WORKERS, on_progress=None) -> List[str]:
+        """複数プロンプトを同時実行数を制限して並列に問い合わせ、入力順の結果を返す"""
+        return await gather_limited(
+            [self.ask_async(prompt, task) for prompt in prompts],
+            max_concurrency=max_concurrency,
+            on_progress=on_progress
+        )
+    
+    def ask_many(self, prompts: List[str], task: str = "chat", max_concurrency: int = DEFAULT_MAX_WORKERS, on_progress=None) -> List[str]:
+        """ask_many_asyncの同期ラッパー（Streamlitページから一括問い合わせする用）"""
+        return run_sync(self.ask_many_async(prompts, task, max_concurrency, on_progress))
+    
+    def _call_api(self, provider: str, model: str, func, prompt: str = "", image_count: int = 0):
+        """レート制限スケジューラ経由でAPIを呼び出す（429等は待機して再試行）"""
+        limiter = get_rate_limiter(self.settings)
+        return limiter.call(provider, model, func, estimate_tokens(prompt, image_count))
     
-    def _ask_anthropic(self, prompt: str, images: List[str] = None) -> str:
+    async def _call_api_async(self, provider: str, model: str, func, prompt: str = "", image_count: int = 0):
+        """_call_api()の非同期版（funcはコルーチンを返す関数）"""
+        limiter = get_rate_limiter(self.settings)
+        return await limiter.call_async(provider, model, func, estimate_tokens(prompt, image_count))
+    
+    def _ask_anthropic(self, prompt: str, images: List[str] = None, task: str = "chat") -> str:
         try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=self.anthropic_api_key)
+            client = get_anthropic_client(self.anthropic_api_key)
             
-            model = self.settings.get("model", "claude-3-5-sonnet-20241022")
+            model = self._resolve_model("anthropic", images)
             
-            message = client.messages.create(
+            message = self._call_api("anthropic", model, lambda: client.messages.create(
                 model=model,
                 max_tokens=2048,
                 messages=[
                     {"role": "user", "content": prompt}
                 ]
-            )
+            ), prompt)
             # トークン使用量を記録
             input_tokens = message.usage.input_tokens
             output_tokens = message.usage.output_tokens
-            self._record_usage("claude", input_tokens, output_tokens)
+            self._record_usage("claude", input_tokens, output_tokens, model, task)
             
             return message.content[0].text
         except Exception as e:
             return f"Anthropic APIエラー: {str(e)}"
     
-    def _ask_openai(self, prompt: str, images: List[str] = None) -> str:
+    def _ask_openai(self, prompt: str, images: List[str] = None, task: str = "chat") -> str:
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            client = get_openai_client(self.openai_api_key)
             
-            model = self.settings.get("model", "gpt-4o-mini")
+            model = self._resolve_model("openai", images)
             
-            response = client.chat.completions.create(
+            response = self._call_api("openai", model, lambda: client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=2048
-            )
+            ), prompt)
             # トークン使用量を記録
             if hasattr(response, 'usage') and response.usage:
                 input_tokens = response.usage.prompt_tokens
                 output_tokens = response.usage.completion_tokens
-                self._record_usage("gpt", input_tokens, output_tokens)
+                self._record_usage("gpt", input_tokens, output_tokens, model, task)
             
             return response.choices[0].message.content
         except Exception as e:
             return f"OpenAI APIエラー: {str(e)}"
     
-    def _ask_gemini(self, prompt: str, images: List[Any] = None) -> str:
+    async def _ask_anthropic_async(self, prompt: str, images: List[str] = None, task: str = "chat") -> str:
         try:
-            import google.generativeai as genai
-            import base64
-            genai.configure(api_key=self.google_api_key)
-            
-            # タスク別モデル選択
-            task_models = self.settings.get("task_models", {})
-            if images and "image_analysis" in task_models:
-                model_name = task_models["image_analysis"]
-            else:
-                model_name = self.settings.get("llm_model", self.settings.get("model", "gemini-2.0-flash"))
-            model = genai.GenerativeModel(model_name)
-            
-            if images:
-                # 画像付きリクエスト
-                parts = [prompt]
-                for img_item in images:
-                    # img_itemは base64文字列 または {'data': ..., 'mime_type': ...} の辞書
-                    mime_type = "image/jpeg"
-                    img_data = img_item
-                    
-                    if isinstance(img_item, dict):
-                        img_data = img_item.get('data')
-                        mime_type = img_item.get('mime_type', "image/jpeg")
-                    
-                    # base64データを画像パートに変換（inline_data形式）
-                    parts.append({
-                        "inline_data": {
-                            "mime_type": mime_type,
-                            "data": img_data
-                        }
-                    })
-                response = model.generate_content(parts)
-            else:
-                response = model.generate_content(prompt)
+            client = get_async_anthropic_client(self.anthropic_api_key)
+            
+            model = self._resolve_model("anthropic", images)
+            
+            message = await self._call_api_async("anthropic", model, lambda: client.messages.create(
+                model=model,
+                max_tokens=2048,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            ), prompt)
+            # トークン使用量を記録
+            self._record_usage("claude", message.usage.input_tokens, message.usage.output_tokens, model, task)
+            
+            return message.content[0].text
+        except Exception as e:
+            return f"Anthropic APIエラー: {str(e)}"
+    
+    async def _ask_openai_async(self, prompt: str, images: List[str] = None, task: str = "chat") -> str:
+        try:
+            client = get_async_openai_client(self.openai_api_key)
+            
+            model = self._resolve_model("openai", images)
+            
+            response = await self._call_api_async("openai", model, lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=2048
+            ), prompt)
+            # トークン使用量を記録
+            if hasattr(response, 'usage') and response.usage:
+                self._record_usage("gpt", response.usage.prompt_tokens, response.usage.completion_tokens, model, task)
+            
+            return response.choices[0].message.content
+        except Exception as e:
+            return f"OpenAI APIエラー: {str(e)}"
+    
+    def _ask_anthropic_stream(self, prompt: str, images: List[str] = None, task: str = "chat") -> Iterator[str]:
+        try:
+            client = get_anthropic_client(self.anthropic_api_key)
+            model = self._resolve_model("anthropic", images)
+            
+            # 429等は接続開始時に発生するため、ストリームのオープンをスケジューラ経由にする
+            manager = client.messages.stream(
+                model=model,
+                max_tokens=2048,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            stream = self._call_api("anthropic", model, manager.__enter__, prompt)
+            try:
+                for text in stream.text_stream:
+                    yield text
+                message = stream.get_final_message()
+            finally:
+                manager.__exit__(None, None, None)
+            # トークン使用量を記録
+            self._record_usage("claude", message.usage.input_tokens, message.usage.output_tokens, model, task)
+        except Exception as e:
+            yield f"Anthropic APIエラー: {str(e)}"
+            raise StreamInterrupted(str(e)) from e
+    
+    def _ask_openai_stream(self, prompt: str, images: List[str] = None, task: str = "chat") -> Iterator[str]:
+        try:
+            client = get_openai_client(self.openai_api_key)
+            model = self._resolve_model("openai", images)
+            
+            stream = self._call_api("openai", model, lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=2048,
+                stream=True,
+                stream_options={"include_usage": True}
+            ), prompt)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # トークン使用量は最後のチャンクに含まれる
+                if getattr(chunk, 'usage', None):
+                    self._record_usage("gpt", chunk.usage.prompt_tokens, chunk.usage.completion_tokens, model, task)
+        except Exception as e:
+            yield f"OpenAI APIエラー: {str(e)}"
+            raise StreamInterrupted(str(e)) from e
+    
+    def _ask_gemini_stream(self, prompt: str, images: List[Any] = None, task: str = "chat") -> Iterator[str]:
+        try:
+            model_name = self._resolve_model("gemini", images)
+            model = get_gemini_model(self.google_api_key, model_name)
+            parts = self._gemini_parts(prompt, images)
+            response = self._call_api("gemini", model_name, lambda: model.generate_content(parts, stream=True),
+                                      prompt, len(images or []))
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # テキストを含まないチャンク（安全性フィルタ等）は読み飛ばす
+                    continue
+                if text:
+                    yield text
+            # トークン使用量を記録（ストリーム完了後に確定する）
+            if hasattr(response, 'usage_metadata'):
+                input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
+                output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
+                self._record_usage("gemini", input_tokens, output_tokens, model_name, task)
+        except Exception as e:
+            yield f"Gemini APIエラー: {str(e)}"
+            raise StreamInterrupted(str(e)) from e
+    
+    def _gemini_parts(self, prompt: str, images: List[Any] = None):
+        """Gemini用のリクエストコンテンツを構築"""
+        if not images:
+            return prompt
+        # 画像付きリクエスト
+        parts = [prompt]
+        for img_item in images:
+            # img_itemは base64文字列 または {'data': ..., 'mime_type': ...} の辞書
+            mime_type = "image/jpeg"
+            img_data = img_item
+            
+            if isinstance(img_item, dict):
+                img_data = img_item.get('data')
+                mime_type = img_item.get('mime_type', "image/jpeg")
+            
+            # base64データを画像パートに変換（inline_data形式）
+            parts.append({
+                "inline_data": {
+                    "mime_type": mime_type,
+                    "data": img_data
+                }
+            })
+        return parts
+    
+    def _ask_gemini(self, prompt: str, images: List[Any] = None, task: str = "chat") -> str:
+        try:
+            model_name = self._resolve_model("gemini", images)
+            model = get_gemini_model(self.google_api_key, model_name)
+            
+            parts = self._gemini_parts(prompt, images)
+            response = self._call_api("gemini", model_name, lambda: model.generate_content(parts),
+                                      prompt, len(images or []))
             # トークン使用量を記録（Geminiはusage_metadataから取得）
             if hasattr(response, 'usage_metadata'):
                 input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
                 output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-                self._record_usage("gemini", input_tokens, output_tokens)
+                self._record_usage("gemini", input_tokens, output_tokens, model_name, task)
             
             return response.text
         except Exception as e:
             return f"Gemini APIエラー: {str(e)}"
     
-    def _record_usage(self, provider: str, input_tokens: int, output_tokens: int, model: str = None):
-        """API使用量を記録"""
+    def _record_usage(self, provider: str, input_tokens: int, output_tokens: int, model: str = None, task: str = None):
+        """API使用量を記録（タスク名と製品IDも記録して集計に使う）"""
         try:
-            tracker = UsageTracker()
-            usage = tracker.record_usage(provider, input_tokens, output_tokens, "api_call", model)
+            tracker = get_usage_tracker()
+            usage = tracker.record_usage(provider, input_tokens, output_tokens, task or "api_call", model,
+                                         product_id=self._usage_product_id())
+            if usage and self.budget_run is not None:
+                self.budget_run.add_cost(usage.get("cost_jpy", 0))
             # session_stateに最後の使用量を保存
             if usage:
                 st.session_state['last_api_usage'] = usage
         except Exception as e:
             print(f"[DEBUG] _record_usage error: {e}")  # デバッグ用
     
+    def _record_image_generation(self, model: str, size: str, quality: str = "standard"):
+        """1枚単価の画像生成を記録（一括処理の予算にも積算する）"""
+        try:
+            usage = get_usage_tracker().record_image_generation(model, size, quality, product_id=self._usage_product_id())
+            if usage and self.budget_run is not None:
+                self.budget_run.add_cost(usage.get("cost_jpy", 0))
+            if usage:
+                st.session_state['last_api_usage'] = usage
+        except Exception as e:
+            print(f"[DEBUG] _record_image_generation error: {e}")
+    
+    def _usage_product_id(self) -> Optional[str]:
+        if self.product_id:
+            return self.product_id
+        try:
+            return st.session_state.get('current_product_id')
+        except Exception:
+            return None
+    
+    def estimate_text_cost(self, prompts: List[str], images_per_prompt: int = 0) -> float:
+        """ask()で問い合わせた場合の概算コスト（円）"""
+        provider = self._resolve_provider([None] * images_per_prompt)
+        if provider is None:
+            return 0.0
+        return estimate_text_cost(provider, self._resolve_model(provider, [None] * images_per_prompt), prompts, images_per_prompt)
+    
+    def estimate_image_cost(self, prompts: List[str], reference_images: int = 0, size: str = "1024x1024") -> float:
+        """generate_image()で生成した場合の概算コスト（円）"""
+        provider, model = self._resolve_image_provider()
+        if provider is None:
+            return 0.0
+        if provider == "openai":
+            return estimate_image_cost("openai", "dall-e-3", prompts, 0, size)
+        return estimate_image_cost(provider, model, prompts, reference_images, size)
+    
     def get_available_models(self, provider: str) -> List[str]:
         models_map = {
             "gemini": ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro"],
@@ -150,85 +491,110 @@ class AIProvider:
         }
         return models_map.get(provider, [])
     
-    def generate_image(self, prompt: str, size: str = "1024x1024", reference_image_path: str = None) -> dict:
-        """画像を生成してローカルに保存"""
+    def _resolve_image_provider(self):
+        """画像生成に使う (プロバイダ, モデル) を決定"""
         # 設定から画像生成プロバイダを取得（複数の設定形式に対応）
         image_settings = self.settings.get("image_generation", {})
         provider = self.settings.get("image_provider") or image_settings.get("provider", "gemini")
         model = self.settings.get("image_model") or image_settings.get("model", "gemini-3-pro-image-preview")
         
         if provider == "gemini" and self.google_api_key:
-            return self._generate_image_gemini(prompt, model, reference_image_path)
+            return "gemini", model
         elif provider == "openai" and self.openai_api_key:
+            return "openai", model
+        # フォールバック
+        if self.google_api_key:
+            return "gemini", model
+        elif self.openai_api_key:
+            return "openai", model
+        return None, model
+    
+    def generate_image(self, prompt: str, size: str = "1024x1024", reference_image_path: str = None) -> dict:
+        """画像を生成してローカルに保存"""
+        provider, model = self._resolve_image_provider()
+        if provider == "gemini":
+            return self._generate_image_gemini(prompt, model, reference_image_path)
+        elif provider == "openai":
             return self._generate_image_dalle(prompt, size)
-        else:
-            # フォールバック
-            if self.google_api_key:
-                return self._generate_image_gemini(prompt, model, reference_image_path)
-            elif self.openai_api_key:
-                return self._generate_image_dalle(prompt, size)
-            else:
-                return {"error": "画像生成用のAPIキーが設定されていません"}
+        return {"error": "画像生成用のAPIキーが設定されていません"}
+    
+    async def generate_image_async(self, prompt: str, size: str = "1024x1024", reference_image_path: str = None) -> dict:
+        """generate_image()の非同期版"""
+        provider, model = self._resolve_image_provider()
+        if provider == "gemini":
+            return await run_in_thread(self._generate_image_gemini, prompt, model, reference_image_path)
+        elif provider == "openai":
+            return await self._generate_image_dalle_async(prompt, size)
+        return {"error": "画像生成用のAPIキーが設定されていません"}
     
     def _generate_image_dalle(self, prompt: str, size: str) -> dict:
         try:
-            from openai import OpenAI
-            import requests
-            import uuid
-            from pathlib import Path
-            
-            client = OpenAI(api_key=self.openai_api_key)
+            client = get_openai_client(self.openai_api_key)
             
-            response = client.images.generate(
+            response = self._call_api("openai", "dall-e-3", lambda: client.images.generate(
                 model="dall-e-3",
                 prompt=prompt,
                 size=size,
                 quality="standard",
                 n=1
-            )
+            ), prompt)
+            return self._save_dalle_result(response, size)
+        except Exception as e:
+            return {"error": f"DALL-E APIエラー: {str(e)}"}
+    
+    async def _generate_image_dalle_async(self, prompt: str, size: str) -> dict:
+        try:
+            client = get_async_openai_client(self.openai_api_key)
             
-            image_url = response.data[0].url
-            
-            # 画像をダウンロードして保存
-            img_response = requests.get(image_url)
-            if img_response.status_code == 200:
-                save_dir = Path("data/generated_images")
-                save_dir.mkdir(parents=True, exist_ok=True)
-                
-                filename = f"{uuid.uuid4().hex[:8]}.png"
-                save_path = save_dir / filename
-                
-                with open(save_path, "wb") as f:
-                    f.write(img_response.content)
-                
-                # トークン使用量を記録
-                if hasattr(response, 'usage') and response.usage:
-                    input_tokens = getattr(response.usage, 'prompt_tokens', 0)
-                    output_tokens = getattr(response.usage, 'completion_tokens', 0)
-                    self._record_usage("gpt", input_tokens, output_tokens)
-                
-                return {"path": str(save_path), "url": image_url}
-            else:
-                return {"error": f"画像ダウンロード失敗: {img_response.status_code}"}
-        
+            response = await self._call_api_async("openai", "dall-e-3", lambda: client.images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size=size,
+                quality="standard",
+                n=1
+            ), prompt)
+            return await run_in_thread(self._save_dalle_result, response, size)
         except Exception as e:
             return {"error": f"DALL-E APIエラー: {str(e)}"}
     
-    def _get_image_info(self, source: str) -> Optional[dict]:
-        """画像ソース（パスまたはURL）からデータとMIMEタイプを取得"""
-        import base64
-        import requests
-        from pathlib import Path
-
+    def _save_dalle_result(self, response, size: str = "1024x1024") -> dict:
+        """DALL-Eの生成結果をダウンロードしてローカルに保存"""
+        image_url = response.data[0].url
+        
+        # 画像をダウンロードして保存
+        img_response = get_http_session().get(image_url, timeout=60)
+        if img_response.status_code == 200:
+            save_dir = Path("data/generated_images")
+            save_dir.mkdir(parents=True, exist_ok=True)
+            
+            filename = f"{uuid.uuid4().hex[:8]}.png"
+            save_path = save_dir / filename
+            
+            with open(save_path, "wb") as f:
+                f.write(img_response.content)
+            
+            # DALL-Eはトークン使用量を返さないため、1枚単価で記録する
+            self._record_image_generation("dall-e-3", size, "standard")
+            
+            return {"path": str(save_path), "url": image_url}
+        else:
+            return {"error": f"画像ダウンロード失敗: {img_response.status_code}"}
+    
+    def _get_image_info(self, source: Union[str, bytes, bytearray, memoryview], mime_type: str = None) -> Optional[dict]:
+        """画像ソース（パス・URL・バイト列）からデータとMIMEタイプを取得"""
         try:
-            if source.startswith("http"):
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                # メモリ上の画像はディスクを経由せずそのままエンコードする
+                return {
+                    "mime_type": mime_type or _sniff_mime_type(source),
+                    "data": base64.b64encode(source).decode()
                 }
-                response = requests.get(source, headers=headers, timeout=30)
-                response.raise_for_status()
-                image_bytes = response.content
-                content_type = response.headers.get("Content-Type", "image/jpeg")
+            if source.startswith("http"):
+                cached = get_image_cache().fetch(source, timeout=30)
+                if not cached:
+                    return None
+                image_bytes = cached["content"]
+                content_type = cached["content_type"] or "image/jpeg"
                 mime_type = "image/png" if "png" in content_type else "image/jpeg"
                 if "gif" in content_type: mime_type = "image/gif"
             else:
@@ -245,20 +611,13 @@ class AIProvider:
                 "data": base64.b64encode(image_bytes).decode()
             }
         except Exception as e:
-            print(f"Error loading image {source}: {e}")
+            print(f"Error loading image {source if isinstance(source, str) else '<bytes>'}: {e}")
             return None
 
     def _generate_image_gemini(self, prompt: str, model: str = "nano-banana-pro-preview", reference_image_path: str = None) -> dict:
         """Gemini/Imagen系で画像生成（参照画像対応）"""
         try:
-            import google.generativeai as genai
-            import uuid
-            from pathlib import Path
-            import base64
-            
-            genai.configure(api_key=self.google_api_key)
-            
-            gen_model = genai.GenerativeModel(model)
+            gen_model = get_gemini_model(self.google_api_key, model)
             
             # コンテンツを構築
             contents = []
@@ -271,7 +630,8 @@ class AIProvider:
             
             contents.append(prompt)
             
-            response = gen_model.generate_content(contents)
+            response = self._call_api("gemini", model, lambda: gen_model.generate_content(contents),
+                                      prompt, len(contents) - 1)
             
             # 画像データを取得して保存
             if response.candidates and response.candidates[0].content.parts:
@@ -292,7 +652,7 @@ class AIProvider:
                         if hasattr(response, 'usage_metadata'):
                             input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
                             output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-                            self._record_usage("gemini", input_tokens, output_tokens, model)
+                            self._record_usage("gemini", input_tokens, output_tokens, model, "image_generation")
                         
                         return {"path": str(save_path)}
             
@@ -308,12 +668,51 @@ class AIProvider:
             self.google_api_key
         ])
 
-    def analyze_image(self, image_path: str, prompt: str) -> str:
+    def analyze_image(self, image_path: str, prompt: str, task: str = "image_analysis") -> str:
         """画像を分析（Vision API）- ローカルパスまたはURL対応"""
         img_info = self._get_image_info(image_path)
         if not img_info:
             return f"画像分析エラー: 画像の読み込みに失敗しました ({image_path})"
+        return self._analyze_image_info(img_info, prompt, task)
+    
+    def analyze_image_bytes(self, data: Union[bytes, bytearray, memoryview], prompt: str, mime_type: str = None, task: str = "image_analysis") -> str:
+        """メモリ上の画像データを分析（Vision API）- 一時ファイルを経由しない"""
+        img_info = self._get_image_info(data, mime_type)
+        if not img_info:
+            return "画像分析エラー: 画像データの読み込みに失敗しました"
+        return self._analyze_image_info(img_info, prompt, task)
+    
+    def _analyze_image_info(self, img_info: dict, prompt: str, task: str = "image_analysis") -> str:
+        image_data = img_info["data"]
+        mime_type = img_info["mime_type"]
+        
+        provider = self.settings.get("llm_provider", "gemini")
         
+        try:
+            if provider == "gemini":
+                return self._analyze_image_gemini(image_data, mime_type, prompt, task)
+            elif provider == "openai":
+                return self._analyze_image_openai(image_data, mime_type, prompt, task)
+            elif provider == "anthropic":
+                return self._analyze_image_anthropic(image_data, mime_type, prompt, task)
+        except Exception as e:
+            return f"画像分析エラー: {e}"
+    
+    async def analyze_image_async(self, image_path: str, prompt: str, task: str = "image_analysis") -> str:
+        """analyze_image()の非同期版"""
+        img_info = await run_in_thread(self._get_image_info, image_path)
+        if not img_info:
+            return f"画像分析エラー: 画像の読み込みに失敗しました ({image_path})"
+        return await self._analyze_image_info_async(img_info, prompt, task)
+    
+    async def analyze_image_bytes_async(self, data: Union[bytes, bytearray, memoryview], prompt: str, mime_type: str = None, task: str = "image_analysis") -> str:
+        """analyze_image_bytes()の非同期版"""
+        img_info = self._get_image_info(data, mime_type)
+        if not img_info:
+            return "画像分析エラー: 画像データの読み込みに失敗しました"
+        return await self._analyze_image_info_async(img_info, prompt, task)
+    
+    async def _analyze_image_info_async(self, img_info: dict, prompt: str, task: str = "image_analysis") -> str:
         image_data = img_info["data"]
         mime_type = img_info["mime_type"]
         
@@ -321,20 +720,19 @@ class AIProvider:
         
         try:
             if provider == "gemini":
-                return self._analyze_image_gemini(image_data, mime_type, prompt)
+                return await run_in_thread(self._analyze_image_gemini, image_data, mime_type, prompt, task)
             elif provider == "openai":
-                return self._analyze_image_openai(image_data, mime_type, prompt)
+                return await self._analyze_image_openai_async(image_data, mime_type, prompt, task)
             elif provider == "anthropic":
-                return self._analyze_image_anthropic(image_data, mime_type, prompt)
+                return await self._analyze_image_anthropic_async(image_data, mime_type, prompt, task)
         except Exception as e:
             return f"画像分析エラー: {e}"
     
-    def _analyze_image_gemini(self, image_data: str, mime_type: str, prompt: str) -> str:
-        import google.generativeai as genai
+    def _analyze_image_gemini(self, image_data: str, mime_type: str, prompt: str, task: str = "image_analysis") -> str:
         # タスク別モデル設定を優先
         task_models = self.settings.get("task_models", {})
         model_name = task_models.get("image_analysis", self.settings.get("llm_model", "gemini-2.0-flash"))
-        model = genai.GenerativeModel(model_name)
+        model = get_gemini_model(self.google_api_key, model_name)
         
         # inline_data形式で構築
         parts = [prompt]
@@ -345,74 +743,98 @@ class AIProvider:
             }
         })
         
-        response = model.generate_content(parts)
+        response = self._call_api("gemini", model_name, lambda: model.generate_content(parts), prompt, 1)
         
         # トークン使用量を記録
         if hasattr(response, 'usage_metadata'):
             input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
             output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-            self._record_usage("gemini", input_tokens, output_tokens)
+            self._record_usage("gemini", input_tokens, output_tokens, model_name, task)
         return response.text
     
-    def _analyze_image_openai(self, image_data: str, mime_type: str, prompt: str) -> str:
-        from openai import OpenAI
-        client = OpenAI()
-        response = client.chat.completions.create(
-            model=self.settings.get("llm_model", "gpt-4o"),
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_data}"}}
-                ]
-            }]
-        )
+    def _analyze_image_openai(self, image_data: str, mime_type: str, prompt: str, task: str = "image_analysis") -> str:
+        client = get_openai_client(self.openai_api_key)
+        model = self.settings.get("llm_model", "gpt-4o")
+        response = self._call_api("openai", model, lambda: client.chat.completions.create(
+            model=model,
+            messages=self._openai_vision_messages(image_data, mime_type, prompt)
+        ), prompt, 1)
         # トークン使用量を記録
         if hasattr(response, 'usage') and response.usage:
             input_tokens = response.usage.prompt_tokens
             output_tokens = response.usage.completion_tokens
-            self._record_usage("gpt", input_tokens, output_tokens)
+            self._record_usage("gpt", input_tokens, output_tokens, model, task)
+        return response.choices[0].message.content
+    
+    async def _analyze_image_openai_async(self, image_data: str, mime_type: str, prompt: str, task: str = "image_analysis") -> str:
+        client = get_async_openai_client(self.openai_api_key)
+        model = self.settings.get("llm_model", "gpt-4o")
+        response = await self._call_api_async("openai", model, lambda: client.chat.completions.create(
+            model=model,
+            messages=self._openai_vision_messages(image_data, mime_type, prompt)
+        ), prompt, 1)
+        # トークン使用量を記録
+        if hasattr(response, 'usage') and response.usage:
+            self._record_usage("gpt", response.usage.prompt_tokens, response.usage.completion_tokens, model, task)
         return response.choices[0].message.content
     
-    def _analyze_image_anthropic(self, image_data: str, mime_type: str, prompt: str) -> str:
-        import anthropic
-        client = anthropic.Anthropic()
-        response = client.messages.create(
-            model=self.settings.get("llm_model", "claude-3-5-sonnet-20241022"),
+    def _openai_vision_messages(self, image_data: str, mime_type: str, prompt: str) -> list:
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_data}"}}
+            ]
+        }]
+    
+    def _analyze_image_anthropic(self, image_data: str, mime_type: str, prompt: str, task: str = "image_analysis") -> str:
+        client = get_anthropic_client(self.anthropic_api_key)
+        model = self.settings.get("llm_model", "claude-3-5-sonnet-20241022")
+        response = self._call_api("anthropic", model, lambda: client.messages.create(
+            model=model,
             max_tokens=4096,
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "image", "source": {"type": "base64", "media_type": mime_type, "data": image_data}},
-                    {"type": "text", "text": prompt}
-                ]
-            }]
-        )
+            messages=self._anthropic_vision_messages(image_data, mime_type, prompt)
+        ), prompt, 1)
         # トークン使用量を記録
         input_tokens = response.usage.input_tokens
         output_tokens = response.usage.output_tokens
-        self._record_usage("claude", input_tokens, output_tokens)
+        self._record_usage("claude", input_tokens, output_tokens, model, task)
         return response.content[0].text
+    
+    async def _analyze_image_anthropic_async(self, image_data: str, mime_type: str, prompt: str, task: str = "image_analysis") -> str:
+        client = get_async_anthropic_client(self.anthropic_api_key)
+        model = self.settings.get("llm_model", "claude-3-5-sonnet-20241022")
+        response = await self._call_api_async("anthropic", model, lambda: client.messages.create(
+            model=model,
+            max_tokens=4096,
+            messages=self._anthropic_vision_messages(image_data, mime_type, prompt)
+        ), prompt, 1)
+        # トークン使用量を記録
+        self._record_usage("claude", response.usage.input_tokens, response.usage.output_tokens, model, task)
+        return response.content[0].text
+    
+    def _anthropic_vision_messages(self, image_data: str, mime_type: str, prompt: str) -> list:
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "image", "source": {"type": "base64", "media_type": mime_type, "data": image_data}},
+                {"type": "text", "text": prompt}
+            ]
+        }]
+    
     def generate_wireframe(self, image_path_or_url, prompt=None):
         """Generate a wireframe version of an existing image"""
         try:
-            import google.generativeai as genai
-            import uuid
-            from pathlib import Path
-            import base64
-            
             api_key = self.google_api_key
             if not api_key:
                 print("[ERROR] No Gemini API key for wireframe generation")
                 return None
             
-            genai.configure(api_key=api_key)
-            
             # 既存の画像生成と同じモデルを使用
             image_settings = self.settings.get("image_generation", {})
             model_name = self.settings.get("image_model") or image_settings.get("model", "gemini-3-pro-image-preview")
             
-            gen_model = genai.GenerativeModel(model_name)
+            gen_model = get_gemini_model(api_key, model_name)
             
             # デフォルトのワイヤーフレーム用プロンプト
             if not prompt:
@@ -433,7 +855,7 @@ class AIProvider:
             # 注意: モダリティ指定が必要なモデルの場合は以下を追加検討
             # generation_config=genai.GenerationConfig(response_modalities=["image", "text"])
             # ただし、_generate_image_geminiが使用していないため、まずはなしで試す
-            response = gen_model.generate_content(contents)
+            response = self._call_api("gemini", model_name, lambda: gen_model.generate_content(contents), prompt, 1)
             
             # 画像データを取得して保存（_generate_image_geminiと同じパターン）
             if response.candidates and response.candidates[0].content.parts:
@@ -456,7 +878,7 @@ class AIProvider:
                         if hasattr(response, 'usage_metadata'):
                             input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
                             output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-                            self._record_usage("gemini", input_tokens, output_tokens, model_name)
+                            self._record_usage("gemini", input_tokens, output_tokens, model_name, "wireframe_generation")
                         
                         return {
                             "local_path": str(save_path),
@@ -213,6 +213,7 @@ def render_chat_panel():
     
     # 会話エリア（大きめ）
     chat_container = st.container(height=500)
+    stream_placeholder = None
     with chat_container:
         if not st.session_state.ai_sidebar_messages:
             st.markdown("""
@@ -243,7 +244,9 @@ def render_chat_panel():
             
             if st.session_state.ai_generating:
                 with st.chat_message("assistant"):
-                    st.markdown("**考え中...**")
+                    # 応答はこの枠にストリーミング表示する
+                    stream_placeholder = st.empty()
+                    stream_placeholder.markdown("**考え中...**")
     
     # 編集提案カード
     if 'active_proposals' in st.session_state and st.session_state.active_proposals:
@@ -364,7 +367,7 @@ def render_chat_panel():
         if 'pending_user_input' in st.session_state: del st.session_state.pending_user_input
         if 'pending_user_images' in st.session_state: del st.session_state.pending_user_images
         
-        generate_ai_response(user_msg, context, user_images)
+        generate_ai_response(user_msg, context, user_images, stream_placeholder=stream_placeholder)
         st.session_state.ai_generating = False
         st.rerun()
 
@@ -401,7 +404,7 @@ def get_product_context():
     except:
         return None
 
-def generate_ai_response(user_input, context, images=None):
+def generate_ai_response(user_input, context, images=None, stream_placeholder=None):
     product_info = "製品未選択"
     structure_info = ""
     
@@ -531,8 +534,11 @@ def generate_ai_response(user_input, context, images=None):
         ai_provider = AIProvider(settings)
         
         # 画像がある場合は、画像付きリクエストを送信
-        if images:
-            # imagesは [{'data': '...', 'mime_type': '...'}] の形式を想定
+        # imagesは [{'data': '...', 'mime_type': '...'}] の形式を想定
+        if stream_placeholder is not None:
+            with stream_placeholder.container():
+                response = st.write_stream(ai_provider.ask_stream(prompt, "chat", images=images or None))
+        elif images:
             response = ai_provider.ask(prompt, "chat", images=images)
         else:
             response = ai_provider.ask(prompt, "chat")
@@ -0,0 +1,170 @@
+"""
+一括処理の予算管理
+実行前にプロンプトのトークン数と画像枚数から概算コストを見積もり、実行中は実績コストを積算して
+製品別（今月）・1日・1回の実行あたりの上限（と1回の実行の所要時間の上限）に達したら以降の処理を始めない
+"""
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+from modules.pricing import normalize_provider
+from modules.rate_limiter import estimate_tokens
+from modules.usage_ledger import get_usage_ledger
+from modules.usage_tracker import get_usage_tracker
+
+# テキスト生成の出力トークンの見積もり（AIProviderのmax_tokens）
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 2048
+# トークン課金の画像生成モデルで画像1枚あたりに見込む出力トークン
+IMAGE_OUTPUT_TOKENS = 1290
+# settings["budget"] の既定値（0は無制限）
+DEFAULT_BUDGET_LIMITS = {
+    "per_run_jpy": 0,
+    "per_day_jpy": 0,
+    "per_product_month_jpy": 0,
+    "per_run_seconds": 0
+}
+
+
+def get_budget_limits(settings: Dict[str, Any]) -> Dict[str, float]:
+    """設定から予算の上限を取得"""
+    limits = dict(DEFAULT_BUDGET_LIMITS)
+    limits.update({k: v for k, v in (settings.get("budget") or {}).items() if k in DEFAULT_BUDGET_LIMITS})
+    return limits
+
+
+def estimate_text_cost(provider: str, model: str, prompts: List[str], images_per_prompt: int = 0,
+                       output_tokens: int = DEFAULT_EXPECTED_OUTPUT_TOKENS) -> float:
+    """テキスト生成の概算コスト（円）"""
+    tracker = get_usage_tracker()
+    provider_key = normalize_provider(provider)
+    return round(sum(
+        tracker.calculate_cost(provider_key, estimate_tokens(prompt, images_per_prompt), output_tokens, model)
+        for prompt in prompts
+    ), 2)
+
+
+def estimate_image_cost(provider: str, model: str, prompts: List[str], reference_images: int = 0,
+                        size: str = "1024x1024") -> float:
+    """画像生成の概算コスト（円）。1枚単価の料金があればそれを、無ければトークン課金で見積もる"""
+    tracker = get_usage_tracker()
+    provider_key = normalize_provider(provider)
+    per_image = tracker.calculate_image_cost(model, size)
+    if per_image > 0:
+        return round(per_image * len(prompts), 2)
+    total = 0.0
+    for prompt in prompts:
+        total += tracker.calculate_cost(provider_key, estimate_tokens(prompt, reference_images), IMAGE_OUTPUT_TOKENS, model)
+    return round(total, 2)
+
+
+class BudgetRun:
+    """1回の一括処理の予算（スレッドセーフ）
+
+    処理を1件始める前に reserve() で見積額を確保し、終わったら release() で戻す。
+    実績コストは AIProvider から add_cost() で積算される（AIProvider.budget_run に設定する）。
+    上限に達した以降の reserve() は False を返し、stopped_reason に理由が残る。
+    """
+
+    def __init__(self, settings: Dict[str, Any], product_id: str = None, label: str = "", ledger=None):
+        self.limits = get_budget_limits(settings)
+        self.product_id = product_id
+        self.label = label
+        self.ledger = ledger or get_usage_ledger()
+        self.started_at = time.time()
+        self.spent_jpy = 0.0
+        self.completed = 0
+        self.skipped = 0
+        self.stopped_reason: Optional[str] = None
+        self._reserved = 0.0
+        self._lock = threading.Lock()
+        # 開始時点の今日・今月の実績は1回だけ読み、以降は spent_jpy を足して判定する（reserve()ごとに台帳を引かない）
+        self._day_spent_at_start = self._day_spent() if self.limits["per_day_jpy"] else 0.0
+        self._product_spent_at_start = (
+            self._product_spent() if self.limits["per_product_month_jpy"] and self.product_id else 0.0
+        )
+
+    def _day_spent(self) -> float:
+        today = date.today().isoformat()
+        rows = self.ledger.query(today, today)
+        return rows[0]["cost_jpy"] if rows else 0.0
+
+    def _product_spent(self) -> float:
+        today = date.today()
+        rows = self.ledger.query(today.replace(day=1).isoformat(), today.isoformat(), product_id=self.product_id)
+        return rows[0]["cost_jpy"] if rows else 0.0
+
+    def _exceeded(self, estimate_jpy: float) -> Optional[str]:
+        """estimate_jpyを追加すると超える上限（超えなければNone）"""
+        limits = self.limits
+        pending = self._reserved + estimate_jpy
+        if limits["per_run_seconds"] and time.time() - self.started_at >= limits["per_run_seconds"]:
+            return f"実行時間の上限（{limits['per_run_seconds']}秒）"
+        if limits["per_run_jpy"] and self.spent_jpy + pending > limits["per_run_jpy"]:
+            return f"1回の実行の上限（¥{limits['per_run_jpy']:,}）"
+        if limits["per_day_jpy"] and self._day_spent_at_start + self.spent_jpy + pending > limits["per_day_jpy"]:
+            return f"1日の上限（¥{limits['per_day_jpy']:,}）"
+        if (limits["per_product_month_jpy"] and self.product_id
+                and self._product_spent_at_start + self.spent_jpy + pending > limits["per_product_month_jpy"]):
+            return f"製品ごとの今月の上限（¥{limits['per_product_month_jpy']:,}）"
+        return None
+
+    def check_estimate(self, estimate_jpy: float) -> Optional[str]:
+        """実行前の見積もりが上限を超えるか（超える場合はその上限の説明）"""
+        with self._lock:
+            return self._exceeded(estimate_jpy)
+
+    def reserve(self, estimate_jpy: float) -> bool:
+        """1件分の見積額を確保（上限を超える場合はFalseで、以降も止めたまま）"""
+        with self._lock:
+            if self.stopped_reason is None:
+                self.stopped_reason = self._exceeded(estimate_jpy)
+            if self.stopped_reason:
+                self.skipped += 1
+                return False
+            self._reserved += estimate_jpy
+            return True
+
+    def release(self, estimate_jpy: float):
+        with self._lock:
+            self._reserved = max(0.0, self._reserved - estimate_jpy)
+            self.completed += 1
+
+    def add_cost(self, cost_jpy: float):
+        with self._lock:
+            self.spent_jpy += cost_jpy or 0.0
+
+    def call(self, estimate_jpy: float, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """予算内なら func を実行（上限に達していれば実行せずNone）"""
+        if not self.reserve(estimate_jpy):
+            return None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.release(estimate_jpy)
+
+    async def call_async(self, estimate_jpy: float, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """call()の非同期版（funcはコルーチンを返す関数）"""
+        if not self.reserve(estimate_jpy):
+            return None
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.release(estimate_jpy)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "spent_jpy": round(self.spent_jpy, 2),
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(time.time() - self.started_at, 1),
+            "stopped_reason": self.stopped_reason
+        }
+
+    def message(self) -> str:
+        """実行結果の説明（上限で止まった場合は理由と未実行の件数）"""
+        text = f"{self.label}: 実績 ¥{self.spent_jpy:,.2f}（{self.completed}件）"
+        if self.stopped_reason:
+            text += f" — {self.stopped_reason}に達したため残り{self.skipped}件は実行していません"
+        return text
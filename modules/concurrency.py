@@ -0,0 +1,136 @@
+"""
+並列実行ユーティリティ
+LLM呼び出しなどI/O待ちが支配的な処理をスレッドプールで並列化する
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+DEFAULT_MAX_WORKERS = 4
+# 画像生成はレート制限（IPM）が厳しいため、テキスト生成より少なめにする
+DEFAULT_IMAGE_MAX_WORKERS = 2
+
+
+def _get_script_run_ctx():
+    """呼び出し元のStreamlitスクリプトコンテキストを取得（Streamlit外ではNone）"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx()
+    except Exception:
+        return None
+
+
+def _attach_script_run_ctx(ctx):
+    """ワーカースレッドにコンテキストを付与（st.error等をワーカーから呼べるようにする）"""
+    if ctx is None:
+        return
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx
+        add_script_run_ctx(threading.current_thread(), ctx)
+    except Exception:
+        pass
+
+
+def run_parallel(
+    func: Callable[[Any], Any],
+    items: Sequence[Any],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    on_progress: Optional[Callable[[int, int, int, Any], None]] = None,
+) -> List[Any]:
+    """itemsの各要素にfuncを並列適用し、入力順に並んだ結果リストを返す
+
+    on_progress(done, total, index, result) は呼び出し元スレッドで完了順に呼ばれる。
+    funcが例外を送出した要素の結果はNoneになる。
+    """
+    items = list(items)
+    total = len(items)
+    if total == 0:
+        return []
+
+    results: List[Any] = [None] * total
+    workers = max(1, min(int(max_workers or 1), total))
+    ctx = _get_script_run_ctx()
+
+    def _run(index):
+        _attach_script_run_ctx(ctx)
+        return func(items[index])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run, i): i for i in range(total)}
+        done = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                print(f"[ERROR] run_parallel task {index}: {e}")
+                results[index] = None
+            done += 1
+            if on_progress:
+                on_progress(done, total, index, results[index])
+
+    return results
+
+
+async def run_in_thread(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """同期関数をスレッドで実行して待機（Streamlitコンテキストを引き継ぐ）"""
+    ctx = _get_script_run_ctx()
+
+    def _run():
+        _attach_script_run_ctx(ctx)
+        return func(*args, **kwargs)
+
+    return await asyncio.to_thread(_run)
+
+
+async def gather_limited(
+    coros: Sequence[Awaitable[Any]],
+    max_concurrency: int = DEFAULT_MAX_WORKERS,
+    on_progress: Optional[Callable[[int, int, int, Any], None]] = None,
+) -> List[Any]:
+    """コルーチン群を同時実行数を制限して実行し、入力順に並んだ結果リストを返す
+
+    on_progressの呼ばれ方と例外時の扱いはrun_parallelと同じ。
+    """
+    coros = list(coros)
+    total = len(coros)
+    results: List[Any] = [None] * total
+    semaphore = asyncio.Semaphore(max(1, int(max_concurrency or 1)))
+    done = 0
+
+    async def _run(index, coro):
+        nonlocal done
+        async with semaphore:
+            try:
+                results[index] = await coro
+            except Exception as e:
+                print(f"[ERROR] gather_limited task {index}: {e}")
+                results[index] = None
+        done += 1
+        if on_progress:
+            on_progress(done, total, index, results[index])
+
+    await asyncio.gather(*(_run(i, c) for i, c in enumerate(coros)))
+    return results
+
+
+async def _run_and_close_clients(coro: Awaitable[Any]) -> Any:
+    """コルーチンを実行し、このループで作られた非同期SDKクライアントを閉じる"""
+    from modules.ai_clients import close_async_clients
+    try:
+        return await coro
+    finally:
+        # ループはrun_syncごとに破棄されるため、紐づくクライアント（コネクション）もここで閉じる
+        await close_async_clients()
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """同期コード（Streamlitページ等）からコルーチンを実行して結果を返す"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_run_and_close_clients(coro))
+    # 既にイベントループ内にいる場合は別スレッドの新しいループで実行する
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, _run_and_close_clients(coro)).result()
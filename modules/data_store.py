@@ -1,16 +1,297 @@
-import json
+import copy
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import traceback
-from urllib.parse import unquote
+from urllib.parse import quote, unquote
 from supabase import create_client, Client
+from modules.concurrency import run_parallel
+from modules.local_store import get_local_json_store
+from modules.product_sync import get_sync_queue
 
 # Supabase設定
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
+# 製品キャッシュ設定
+# 同一プロセス内の書き込みは即時無効化される。別プロセスからの更新はTTLで反映、
+# PRODUCT_CACHE_VALIDATE有効時は毎回 updated_at だけを問い合わせて検証する
+PRODUCT_CACHE_TTL_SECONDS = float(os.environ.get("PRODUCT_CACHE_TTL_SECONDS", "300"))
+PRODUCT_CACHE_VALIDATE = os.environ.get("PRODUCT_CACHE_VALIDATE", "").lower() in ("1", "true", "yes")
+# 製品の保存をローカルで確定させ、Supabaseへはバックグラウンドでまとめて書き込む（ライトビハインド）
+SUPABASE_WRITE_BEHIND = os.environ.get("SUPABASE_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+
+# Supabase REST API の接続設定（接続タイムアウト, 読み込みタイムアウト）
+REST_TIMEOUT = (5, 30)
+REST_MAX_RETRIES = 3
+
+_shared_lock = threading.Lock()
+_rest_session = None
+_supabase_clients = {}
+# 存在確認済みのStorageバケット
+_known_buckets = set()
+# Storageへの同時アップロード数
+STORAGE_MAX_WORKERS = 6
+# Storageの一括削除で1リクエストに含めるパス数
+STORAGE_DELETE_CHUNK_SIZE = 100
+# バックグラウンドで実行するStorage削除用
+_background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage-cleanup")
+
+
+def _get_rest_session() -> requests.Session:
+    """Supabase REST API用のプロセス共有セッション（keep-alive・再試行・gzip）"""
+    global _rest_session
+    with _shared_lock:
+        if _rest_session is None:
+            retry = Retry(
+                total=REST_MAX_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                # upsert(merge-duplicates)・PATCH・DELETEはいずれも冪等なので再送してよい
+                allowed_methods=["GET", "POST", "PATCH", "DELETE"],
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            _rest_session = session
+        return _rest_session
+
+
+def _get_supabase_client(url: str, key: str) -> Client:
+    """Supabaseクライアントをプロセス内で共有（Storage/テーブル操作のコネクションを使い回す）"""
+    with _shared_lock:
+        client = _supabase_clients.get((url, key))
+        if client is None:
+            client = create_client(url, key)
+            _supabase_clients[(url, key)] = client
+        return client
+
+# 製品一覧で取得するカラム
+PRODUCT_SUMMARY_COLUMNS = ["id", "name", "description", "created_at", "updated_at"]
+
+# 製品データのうち重いサブドキュメント（本体とは別に保存し、初回アクセス時に読み込む）
+# ローカルでは data/products/<id>/<セクション名>.json に保存する
+PRODUCT_SECTIONS = (
+    "lp_analyses", "lp_analyses_dict", "page_contents",
+    "generated_versions", "competitor_analysis_v2", "review_sheet_data"
+)
+# DBスキーマに存在しないローカル専用フィールド（随時追加。DBカラムにあるものは除外しない）
+LOCAL_ONLY_KEYS = ["review_sheet_data"]
+# Supabaseの値が空の場合にローカルの値で補完するフィールド
+# (Supabaseのスキーマ変更などが間に合っていない場合への対策、ローカルパスも補完)
+LOCAL_MERGE_KEYS = [
+    "lp_analyses", "lp_analyses_dict", "review_sheet_data", "tone_manner",
+    "reference_lp_images", "tone_manner_images",
+    "product_images", "model_images", "model_prompts",
+    "reference_lp_image_urls", "tone_manner_image_urls", "product_image_urls",
+    "designer_instruction"
+]
+# Noneの場合に[]に変換するリスト型フィールド
+LIST_KEYS = ["reference_lp_images", "reference_lp_image_urls", "lp_analyses", "tone_manner_images", "tone_manner_image_urls"]
+
+# Supabaseのlp_productsのカラム名（最初の全カラム取得時に覚える。未取得ならNone）
+_product_columns = None
+
+
+def _remember_product_columns(columns, learned: bool = False):
+    """lp_productsのカラム名を記録（learned=Trueなら全カラム取得の結果で置き換え）"""
+    global _product_columns
+    with _shared_lock:
+        if learned:
+            _product_columns = set(columns)
+        elif _product_columns is not None:
+            _product_columns |= set(columns)
+
+
+class LazyProduct(dict):
+    """重いセクションを初回アクセス時に読み込む製品データ
+
+    未読込のセクションは keys() / items() / copy() などには現れない。
+    そのまま update_product() に渡すと、読み込んだ（または設定した）セクションだけが保存される。
+    """
+
+    def __init__(self, data: dict, loader, pending=()):
+        super().__init__(data)
+        self._loader = loader
+        self._pending = {section for section in pending if not dict.__contains__(self, section)}
+
+    @property
+    def pending_sections(self) -> set:
+        """まだ読み込んでいないセクション"""
+        return set(self._pending)
+
+    def load_sections(self, sections=None):
+        """セクションを読み込む（省略時は未読込の全セクション）"""
+        sections = [s for s in (sections or PRODUCT_SECTIONS) if s in self._pending]
+        if not sections:
+            return self
+        values = self._loader(sections) or {}
+        self._pending.difference_update(sections)
+        for section, value in values.items():
+            if not dict.__contains__(self, section):
+                dict.__setitem__(self, section, value)
+        return self
+
+    def _ensure(self, key):
+        if key in self._pending:
+            self.load_sections([key])
+
+    def __getitem__(self, key):
+        self._ensure(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self._ensure(key)
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self._ensure(key)
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self._ensure(key)
+        return super().setdefault(key, default)
+
+    def pop(self, key, *args):
+        self._ensure(key)
+        return super().pop(key, *args)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._ensure(key)
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        changes = dict(*args, **kwargs)
+        self._pending.difference_update(changes)
+        super().update(changes)
+
+    def copy(self):
+        return LazyProduct(dict(self), self._loader, self._pending)
+
+    def __deepcopy__(self, memo):
+        return LazyProduct(copy.deepcopy(dict(self), memo), self._loader, self._pending)
+
+
+class ProductCache:
+    """get_product()の結果をプロセス内に保持するキャッシュ（製品ID＋updated_atで管理）"""
+
+    def __init__(self, ttl_seconds: float = PRODUCT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        # 無効化の世代番号（読み込み中に書き込まれた場合、古い読み込み結果を格納しない）
+        self._generations = {}
+        self._epoch = 0
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+
+    def get(self, product_id: str, updated_at: str = None, validated: bool = False):
+        """キャッシュを取得（validated=Trueならupdated_atの一致で鮮度を判定、それ以外はTTL）
+
+        戻り値: (製品データ, 読み込み済みのセクション) / 未キャッシュならNone
+        """
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if validated:
+                fresh = updated_at is not None and entry["updated_at"] == updated_at
+            else:
+                fresh = time.time() - entry["cached_at"] < self.ttl_seconds
+            if not fresh:
+                del self._entries[product_id]
+                self.stats["stale"] += 1
+                self.stats["misses"] += 1
+                return None
+            entry["cached_at"] = time.time()
+            self.stats["hits"] += 1
+            product = entry["product"]
+            sections = set(entry["sections"])
+        # 呼び出し側が書き換えてもキャッシュが汚れないようコピーを返す
+        return copy.deepcopy(product), sections
+
+    def generation(self, product_id: str):
+        with self._lock:
+            return (self._epoch, self._generations.get(product_id, 0))
+
+    def put(self, product_id: str, product: dict, generation: tuple = None, sections=()):
+        entry = {
+            "product": copy.deepcopy(dict(product)),
+            "sections": set(sections),
+            "updated_at": product.get("updated_at"),
+            "cached_at": time.time()
+        }
+        with self._lock:
+            if generation is not None and (self._epoch, self._generations.get(product_id, 0)) != generation:
+                return
+            self._entries[product_id] = entry
+
+    def patch(self, product_id: str, changes: dict):
+        """キャッシュ済みの製品にトップレベルの変更を反映（未キャッシュなら何もしない）"""
+        changes = copy.deepcopy(changes)
+        with self._lock:
+            # 読み込み中の古い内容で上書きされないよう世代を進める
+            self._generations[product_id] = self._generations.get(product_id, 0) + 1
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return
+            entry["product"].update(changes)
+            entry["sections"].update(key for key in changes if key in PRODUCT_SECTIONS)
+            entry["updated_at"] = entry["product"].get("updated_at")
+            entry["cached_at"] = time.time()
+
+    def add_sections(self, product_id: str, values: dict, sections, generation: tuple):
+        """遅延読み込みしたセクションをキャッシュ済みの製品に追加（読み込み中に書き込まれていれば何もしない）"""
+        values = copy.deepcopy(values)
+        with self._lock:
+            if (self._epoch, self._generations.get(product_id, 0)) != generation:
+                return
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return
+            for section in sections:
+                if section not in entry["sections"] and section in values:
+                    entry["product"][section] = values[section]
+            entry["sections"].update(sections)
+
+    def invalidate(self, product_id: str = None):
+        """指定製品（省略時は全件）のキャッシュを破棄"""
+        with self._lock:
+            if product_id is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                self._entries.pop(product_id, None)
+                self._generations[product_id] = self._generations.get(product_id, 0) + 1
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": self.stats["hits"] / total if total else 0.0
+            }
+
+
+_product_cache = ProductCache()
+
 class DataStore:
     def __init__(self, data_dir: str = "data/products"):
         self.data_dir = Path(data_dir)
@@ -19,9 +300,12 @@ class DataStore:
         self.use_supabase = False
         self.headers = {}
         self.base_url = ""
+        self.supabase_url = ""
         self.supabase: Client = None
         self.service_key = os.environ.get("SUPABASE_SERVICE_KEY")
         self.last_error = None  # 詳細エラー保持用
+        self.cache_validate = PRODUCT_CACHE_VALIDATE  # キャッシュ利用時にupdated_atを問い合わせて検証するか
+        self.write_behind = SUPABASE_WRITE_BEHIND  # Supabaseへの保存をバックグラウンドで行うか
         
         # 環境変数から設定を取得
         base_url = os.environ.get("SUPABASE_URL")
@@ -31,8 +315,9 @@ class DataStore:
             try:
                 # サービスキーがあれば優先的に使用（RLS回避用）
                 key_to_use = self.service_key if self.service_key else api_key
-                self.supabase = create_client(base_url, key_to_use)
+                self.supabase = _get_supabase_client(base_url, key_to_use)
                 self.use_supabase = True
+                self.supabase_url = base_url.rstrip("/")
                 self.base_url = f"{base_url}/rest/v1"
                 
                 # ヘッダー情報を取得（手動構築ではなくクライアントから取得）
@@ -53,17 +338,31 @@ class DataStore:
                 print(f"Supabase connection/init error: {e}")
                 self.use_supabase = False
                 self.supabase = None
+        
+        if self._write_behind():
+            self._sync_queue().attach(self)
+
+    def _get_from_supabase(self, product_id: str, columns: list = None, core_only: bool = False):
+        """Supabaseから取得 (REST API)
 
-    def _get_from_supabase(self, product_id: str):
-        """Supabaseから取得 (REST API)"""
+        columns: 取得するカラム（省略時は全カラム）
+        core_only: セクション（PRODUCT_SECTIONS）を除いた本体だけを取得（カラム名が未取得の間は全カラム）
+        """
         if not self.use_supabase:
             return None
         try:
-            url = f"{self.base_url}/lp_products?id=eq.{product_id}"
-            response = requests.get(url, headers=self.headers)
+            select = "*"
+            if columns:
+                select = ",".join(columns)
+            elif core_only and _product_columns:
+                select = ",".join(sorted(c for c in _product_columns if c not in PRODUCT_SECTIONS))
+            url = f"{self.base_url}/lp_products?id=eq.{product_id}&select={select}"
+            response = _get_rest_session().get(url, headers=self.headers, timeout=REST_TIMEOUT)
             if response.status_code == 200:
                 data = response.json()
                 if data and len(data) > 0:
+                    if select == "*":
+                        _remember_product_columns(data[0].keys(), learned=True)
                     return data[0]
         except Exception as e:
             print(f"Supabase get error: {e}")
@@ -77,90 +376,240 @@ class DataStore:
             url = f"{self.base_url}/lp_products"
             headers = {**self.headers, "Prefer": "resolution=merge-duplicates"}
             
-            # スキーマに存在しないローカル専用フィールドを除外
-            data_to_save = product.copy()
-            exclude_keys = ["review_sheet_data"] # 随時追加。DBカラムにあるものは除外しない
-            for key in exclude_keys:
-                if key in data_to_save:
-                    del data_to_save[key]
+            # スキーマに存在しないローカル専用フィールドを除外（未読込のセクションは送らない）
+            data_to_save = self._db_payload(product)
             
-            response = requests.post(url, headers=headers, json=data_to_save)
+            response = _get_rest_session().post(url, headers=headers, json=data_to_save, timeout=REST_TIMEOUT)
             
             if response.status_code not in [200, 201]:
                 self.last_error = f"Status: {response.status_code}, Body: {response.text}"
                 print(f"Supabase save failed: {self.last_error}")
                 return False
-                
+            
+            _remember_product_columns(data_to_save)
             return True
         except Exception as e:
             self.last_error = str(e)
             print(f"Supabase save error: {e}")
         return False
     
+    def _patch_supabase(self, product_id: str, changes: dict):
+        """Supabaseの指定カラムだけを更新 (REST API - PATCH)
+
+        戻り値: True=更新成功 / False=失敗 / None=対象行が存在しない
+        """
+        if not self.use_supabase:
+            return False
+        try:
+            url = f"{self.base_url}/lp_products?id=eq.{product_id}&select=id"
+            headers = {**self.headers, "Prefer": "return=representation"}
+            response = _get_rest_session().patch(url, headers=headers, json=changes, timeout=REST_TIMEOUT)
+            if response.status_code not in [200, 204]:
+                self.last_error = f"Status: {response.status_code}, Body: {response.text}"
+                print(f"Supabase patch failed: {self.last_error}")
+                return False
+            if response.status_code == 200 and not response.json():
+                return None
+            _remember_product_columns(changes)
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Supabase patch error: {e}")
+        return False
+    
     def _delete_from_supabase(self, product_id: str):
         """Supabaseから削除 (REST API)"""
         if self.use_supabase:
             try:
                 url = f"{self.base_url}/lp_products?id=eq.{product_id}"
-                response = requests.delete(url, headers=self.headers)
+                response = _get_rest_session().delete(url, headers=self.headers, timeout=REST_TIMEOUT)
                 if response.status_code in [200, 204]:
                     return True
             except Exception as e:
                 print(f"Supabase delete error: {e}")
         return False
     
-    def _get_all_from_supabase(self):
-        """Supabaseから全製品を取得 (REST API)"""
+    def _get_updated_at_from_supabase(self, product_id: str):
+        """Supabaseから updated_at だけを取得（キャッシュ検証用の軽量な問い合わせ）"""
+        if not self.use_supabase:
+            return None
+        try:
+            url = f"{self.base_url}/lp_products?id=eq.{product_id}&select=updated_at"
+            response = _get_rest_session().get(url, headers=self.headers, timeout=REST_TIMEOUT)
+            if response.status_code == 200:
+                data = response.json()
+                if data:
+                    return data[0].get("updated_at")
+        except Exception as e:
+            print(f"Supabase get updated_at error: {e}")
+        return None
+    
+    def _get_updated_at_many(self, product_ids: list):
+        """複数製品のupdated_atをまとめて取得（戻り値: {id: updated_at}、失敗時はNone）"""
+        if not self.use_supabase:
+            return None
+        try:
+            ids = ",".join(f'"{product_id}"' for product_id in product_ids)
+            params = {"select": "id,updated_at", "id": f"in.({ids})"}
+            url = f"{self.base_url}/lp_products"
+            response = _get_rest_session().get(url, headers=self.headers, params=params, timeout=REST_TIMEOUT)
+            if response.status_code == 200:
+                return {row["id"]: row.get("updated_at") for row in response.json()}
+            print(f"Supabase get updated_at failed: Status: {response.status_code}, Body: {response.text}")
+        except Exception as e:
+            print(f"Supabase get updated_at error: {e}")
+        return None
+    
+    def _upsert_products(self, rows: list):
+        """複数製品をまとめてupsert（全行のキーが同じであること。戻り値: (成功したか, エラー内容)）"""
+        try:
+            url = f"{self.base_url}/lp_products"
+            headers = {**self.headers, "Prefer": "resolution=merge-duplicates"}
+            response = _get_rest_session().post(url, headers=headers, json=rows, timeout=REST_TIMEOUT)
+            if response.status_code not in [200, 201]:
+                return False, f"Status: {response.status_code}, Body: {response.text}"
+            _remember_product_columns(rows[0])
+            return True, None
+        except Exception as e:
+            return False, str(e)
+    
+    def _get_all_from_supabase(self, params: dict = None):
+        """Supabaseから製品一覧を取得 (REST API、paramsでselect/order/limit等を指定)"""
         if not self.use_supabase:
             return None
         try:
             url = f"{self.base_url}/lp_products"
-            response = requests.get(url, headers=self.headers)
+            response = _get_rest_session().get(url, headers=self.headers, params=params, timeout=REST_TIMEOUT)
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             print(f"Supabase get all error: {e}")
         return None
     
-    def get_product(self, product_id: str) -> dict:
+    def get_product(self, product_id: str, use_cache: bool = True, sections=None) -> dict:
+        """製品を取得（プロセス内キャッシュ経由）
+
+        重いセクション（PRODUCT_SECTIONS）は初回アクセス時に読み込む。
+        sections: 先に読み込んでおくセクションのリスト（"all"で全セクション）
+        """
+        loaded = ()
+        if not use_cache:
+            product = self._load_product(product_id)
+            if product is not None:
+                loaded = [section for section in PRODUCT_SECTIONS if section in product]
+        else:
+            validate = getattr(self, "cache_validate", PRODUCT_CACHE_VALIDATE) and getattr(self, "use_supabase", False)
+            if validate:
+                cached = _product_cache.get(product_id, self._get_updated_at_from_supabase(product_id), validated=True)
+            else:
+                cached = _product_cache.get(product_id)
+            if cached is not None:
+                product, loaded = cached
+            else:
+                generation = _product_cache.generation(product_id)
+                product = self._load_product(product_id)
+                if product is not None:
+                    # カラム名が未取得で全カラムを取得した場合は、そのセクションも読み込み済みとして扱う
+                    loaded = [section for section in PRODUCT_SECTIONS if section in product]
+                    _product_cache.put(product_id, product, generation, sections=loaded)
+        if product is None:
+            return None
+        
+        pending = [section for section in PRODUCT_SECTIONS if section not in loaded]
+        product = LazyProduct(product, partial(self._load_sections, product_id), pending)
+        if sections:
+            product.load_sections(PRODUCT_SECTIONS if sections == "all" else sections)
+        return product
+    
+    def get_cache_stats(self) -> dict:
+        """製品キャッシュのヒット・ミス統計"""
+        return _product_cache.get_stats()
+    
+    def _write_behind(self) -> bool:
+        return getattr(self, "write_behind", False) and self.use_supabase
+    
+    def _sync_queue(self):
+        return get_sync_queue(self.data_dir / ".sync" / "pending.json")
+    
+    def _db_payload(self, product: dict) -> dict:
+        """Supabaseに送る内容（ローカル専用フィールドと未読込のセクションを除く）"""
+        return {k: v for k, v in dict.items(product) if k not in LOCAL_ONLY_KEYS}
+    
+    def get_sync_status(self):
+        """Supabaseへの同期状況（ライトビハインドでなければNone）"""
+        if not self._write_behind():
+            return None
+        return self._sync_queue().get_status()
+    
+    def flush_sync(self):
+        """未同期の保存をすぐにSupabaseへ書き込む"""
+        if self._write_behind():
+            self._sync_queue().flush()
+    
+    def retry_failed_sync(self):
+        """同期に失敗した保存を再試行する"""
+        if self._write_behind():
+            self._sync_queue().retry_failed()
+    
+    def _read_local_product(self, product_id: str):
+        """ローカルの製品全体を読み込む（同期用。ローカル専用フィールドは除く）"""
+        try:
+            product = self._read_local_core(product_id)
+        except Exception as e:
+            print(f"Local file read error: {e}")
+            return None
+        if product is None:
+            return None
+        product.update(self._read_local_sections(product_id, PRODUCT_SECTIONS))
+        return self._db_payload(product)
+    
+    def _on_sync_conflict(self, product_id: str):
+        """同期時にSupabase側の方が新しかった製品はキャッシュを破棄して読み直させる"""
+        _product_cache.invalidate(product_id)
+    
+    def _load_product(self, product_id: str) -> dict:
+        """Supabaseとローカルファイルから製品の本体（セクション以外）を読み込んでマージ
+
+        カラム名が未取得で全カラムを取得した場合は、取得済みのセクションも_load_sectionsと同じ規則でマージして含める
+        （同じセクションを後でもう一度ダウンロードしないように）
+        """
         product_data = None
         
         # Supabase Cloudを優先（Streamlit Cloud対応）
         if self.use_supabase:
-            product_data = self._get_from_supabase(product_id)
+            product_data = self._get_from_supabase(product_id, core_only=True)
         
         # ローカルファイルからデータを取得（バックアップまたは補完用）
         local_data = None
-        file_path = self.data_dir / f"{product_id}.json"
-        if file_path.exists():
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    local_data = json.load(f)
-            except Exception as e:
-                print(f"Local file read error: {e}")
+        try:
+            local_data = self._read_local_core(product_id)
+        except Exception as e:
+            print(f"Local file read error: {e}")
 
         # Supabaseデータがある場合でも、ローカルデータで特定のフィールドを補完する
-        # (Supabaseのスキーマ変更などが間に合っていない場合への対策)
         if product_data:
+            pending = self._sync_queue().pending_changes(product_id) if self._write_behind() else {}
+            fetched_sections = [section for section in PRODUCT_SECTIONS if section in product_data]
+            section_values = {}
+            if fetched_sections:
+                local_sections = self._read_local_sections(product_id, fetched_sections)
+                section_values = self._merge_sections(fetched_sections, product_data, local_sections, pending)
+            
+            product_data = {k: v for k, v in product_data.items() if k not in PRODUCT_SECTIONS}
             if local_data:
-                # 補完したいフィールド（Supabaseに無い可能性があるもの、またはローカルパス）
-                merge_keys = [
-                    "lp_analyses", "lp_analyses_dict", "review_sheet_data", "tone_manner",
-                    "reference_lp_images", "tone_manner_images", # ローカルパスも補完
-                    "product_images", "model_images", "model_prompts",
-                    "reference_lp_image_urls", "tone_manner_image_urls", "product_image_urls",
-                    "designer_instruction"
-                ]
-                for key in merge_keys:
+                for key in LOCAL_MERGE_KEYS:
                     if (key not in product_data or not product_data[key]) and (key in local_data and local_data[key]):
                         product_data[key] = local_data[key]
             
+            # 未同期の保存があればSupabaseの古い値より優先する
+            product_data.update({k: v for k, v in pending.items() if k not in PRODUCT_SECTIONS})
+            
             # None対策: リスト型フィールドがNoneの場合は[]に変換
-            list_keys = ["reference_lp_images", "reference_lp_image_urls", "lp_analyses", "tone_manner_images", "tone_manner_image_urls"]
-            for key in list_keys:
+            for key in LIST_KEYS:
                 if key in product_data and product_data[key] is None:
                     product_data[key] = []
 
+            product_data.update(section_values)
             return product_data
         
         # Supabaseになければローカルデータを返す
@@ -169,8 +618,141 @@ class DataStore:
             
         return None
     
+    def _load_sections(self, product_id: str, sections) -> dict:
+        """セクションを読み込む（LazyProductの初回アクセス時に呼ばれる。マージ規則は_load_productと同じ）"""
+        generation = _product_cache.generation(product_id)
+        db_data = None
+        if self.use_supabase:
+            if _product_columns is None:
+                db_data = self._get_from_supabase(product_id)
+            else:
+                columns = [section for section in sections if section in _product_columns]
+                if columns:
+                    db_data = self._get_from_supabase(product_id, columns=columns)
+        local_data = self._read_local_sections(product_id, sections)
+        pending = self._sync_queue().pending_changes(product_id) if self._write_behind() else {}
+        
+        values = self._merge_sections(sections, db_data, local_data, pending)
+        _product_cache.add_sections(product_id, values, sections, generation)
+        return values
+    
+    def _merge_sections(self, sections, db_data, local_data: dict, pending: dict) -> dict:
+        """Supabase・ローカル・未同期の保存からセクションの値を決める"""
+        values = {}
+        for section in sections:
+            if db_data:
+                if section in db_data:
+                    values[section] = db_data[section]
+                if not values.get(section) and section in LOCAL_MERGE_KEYS and local_data.get(section):
+                    values[section] = local_data[section]
+                if section in pending:
+                    values[section] = pending[section]
+                if section in LIST_KEYS and section in values and values[section] is None:
+                    values[section] = []
+            elif section in local_data:
+                values[section] = local_data[section]
+        return values
+    
+    def _section_dir(self, product_id: str) -> Path:
+        return self.data_dir / product_id
+    
+    def _write_json(self, path: Path, data, immediate: bool = False):
+        """ローカルJSONを保存（アトミックに置き換え、連続した保存はまとめて書き込む）
+
+        immediate=Trueならすぐに書き込み、書き込めなければOSErrorを送出する
+        """
+        get_local_json_store().write(path, data, immediate=immediate)
+    
+    def _read_local_core(self, product_id: str):
+        """ローカルの本体ファイルを読み込む（無ければNone、読めなければ例外）
+
+        旧形式（全セクションを含む1ファイル）の場合は、セクションを別ファイルに分割して移行する
+        （既にあるセクションファイルの方が新しいので上書きしない）
+        """
+        file_path = self.data_dir / f"{product_id}.json"
+        store = get_local_json_store()
+        if not store.exists(file_path):
+            return None
+        data = store.read(file_path)
+        legacy = {section: data.pop(section) for section in PRODUCT_SECTIONS if section in data}
+        if legacy:
+            try:
+                section_dir = self._section_dir(product_id)
+                section_dir.mkdir(parents=True, exist_ok=True)
+                for section, value in legacy.items():
+                    section_path = section_dir / f"{section}.json"
+                    if not store.exists(section_path):
+                        self._write_json(section_path, value)
+                self._write_json(file_path, data)
+            except Exception as e:
+                # 移行できなくても旧形式のまま読めるので続行する
+                print(f"Local section migration error: {e}")
+        return data
+    
+    def _read_local_sections(self, product_id: str, sections) -> dict:
+        """ローカルのセクションファイルを読み込む（無いセクションは旧形式の本体ファイルから読む）"""
+        store = get_local_json_store()
+        values = {}
+        missing = []
+        for section in sections:
+            path = self._section_dir(product_id) / f"{section}.json"
+            if not store.exists(path):
+                missing.append(section)
+                continue
+            try:
+                values[section] = store.read(path)
+            except Exception as e:
+                print(f"Local section read error ({section}): {e}")
+        if missing:
+            file_path = self.data_dir / f"{product_id}.json"
+            try:
+                if store.exists(file_path):
+                    legacy = store.read(file_path)
+                    values.update({section: legacy[section] for section in missing if section in legacy})
+            except Exception as e:
+                print(f"Local file read error: {e}")
+        return values
+    
+    def _write_local(self, product_id: str, product: dict, immediate: bool = False):
+        """ローカルに保存（本体と、読み込み済みまたは設定済みのセクションを別ファイルに書く）
+
+        immediate=Trueなら書き込めなかった場合にOSErrorを送出する
+        """
+        core = {}
+        sections = {}
+        for key, value in dict.items(product):
+            if key in PRODUCT_SECTIONS:
+                sections[key] = value
+            else:
+                core[key] = value
+        
+        file_path = self.data_dir / f"{product_id}.json"
+        section_dir = self._section_dir(product_id)
+        if get_local_json_store().exists(file_path) and not section_dir.exists():
+            # 旧形式なら先に分割し、今回書かないセクションを失わないようにする
+            try:
+                self._read_local_core(product_id)
+            except Exception as e:
+                print(f"Local file read error: {e}")
+        if sections:
+            section_dir.mkdir(parents=True, exist_ok=True)
+            for section, value in sections.items():
+                self._write_json(section_dir / f"{section}.json", value, immediate)
+        self._write_json(file_path, core, immediate)
+    
+    def _save_local(self, product_id: str, product: dict) -> bool:
+        """save/update/patch用のローカル保存（ローカルが唯一の保存先なら書き込みを待ち、失敗したらFalse）"""
+        try:
+            self._write_local(product_id, product, immediate=not self.use_supabase)
+            return True
+        except OSError as e:
+            self.last_error = f"ローカル保存エラー: {e}"
+            print(f"Local save error ({product_id}): {e}")
+            _product_cache.invalidate(product_id)
+            return False
+    
     def create_product(self, name: str) -> dict:
-        """新規製品を作成"""
+        """新規製品を作成（保存できなかった場合はNone）"""
         import uuid
         product_id = f"prod_{uuid.uuid4().hex[:8]}"
         product = {
@@ -179,10 +761,10 @@ class DataStore:
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         }
-        self.save_product(product)
-        return product
+        return product if self.save_product(product) else None
 
     def save_product(self, product: dict) -> str:
+        """製品を保存して製品IDを返す（保存できなかった場合はNone）"""
         if 'id' not in product:
             product['id'] = f"prod_{os.urandom(4).hex()}"
         if 'created_at' not in product:
@@ -192,14 +774,17 @@ class DataStore:
         product_id = product['id']
         
         # Supabase DBに保存（Streamlit Cloud対応）
-        if self.use_supabase:
+        if self._write_behind():
+            self._sync_queue().enqueue(self, product_id, self._db_payload(product), product['updated_at'], full=True)
+        elif self.use_supabase:
             self._save_to_supabase(product)
         
         # ローカルファイルにも保存（バックアップ）
-        file_path = self.data_dir / f"{product_id}.json"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(product, f, ensure_ascii=False, indent=2, default=str)
+        if not self._save_local(product_id, product):
+            return None
         
+        # 書き込み後に破棄（書き込み中に読み込まれた古い内容を残さない）
+        self._refresh_cache_after_write(product_id, product)
         return product_id
     
     def update_product(self, product_id: str, product: dict) -> bool:
@@ -208,30 +793,80 @@ class DataStore:
             product['id'] = product_id
         
         # Supabase DBに保存（Streamlit Cloud対応）
-        if self.use_supabase:
+        if self._write_behind():
+            self._sync_queue().enqueue(self, product_id, self._db_payload(product), product['updated_at'], full=True)
+        elif self.use_supabase:
             if not self._save_to_supabase(product):
                 return False
         
         # ローカルファイルにも保存（バックアップ）
-        file_path = self.data_dir / f"{product_id}.json"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(product, f, ensure_ascii=False, indent=2, default=str)
+        if not self._save_local(product_id, product):
+            return False
+        
+        self._refresh_cache_after_write(product_id, product)
+        return True
+    
+    def _refresh_cache_after_write(self, product_id: str, product: dict):
+        """保存後のキャッシュ更新（ライトビハインドでは保存した内容が最新なのでそのまま格納する）"""
+        _product_cache.invalidate(product_id)
+        if self._write_behind():
+            loaded = [section for section in PRODUCT_SECTIONS if dict.__contains__(product, section)]
+            _product_cache.put(product_id, product, _product_cache.generation(product_id), sections=loaded)
+
+    def patch_product(self, product_id: str, changes: dict) -> bool:
+        """変更したトップレベルのフィールドだけを保存（製品全体は送らない）"""
+        changes = {**changes, "updated_at": datetime.now().isoformat()}
+        
+        # Supabase DBに保存（スキーマに存在しないローカル専用フィールドは除外）
+        if self._write_behind():
+            self._sync_queue().enqueue(self, product_id, self._db_payload(changes), changes["updated_at"])
+        elif self.use_supabase:
+            db_changes = self._db_payload(changes)
+            result = self._patch_supabase(product_id, db_changes)
+            if result is False:
+                return False
+            if result is None:
+                # DBにまだ行が無い（ローカルのみの）製品は全体をupsertして作成する
+                product = self.get_product(product_id)
+                if product is None:
+                    return False
+                product.update(changes)
+                return self.update_product(product_id, product)
+        
+        # ローカルファイルも差分だけ反映（バックアップ、セクションは該当ファイルだけ書き換える）
+        local_data = {"id": product_id}
+        local_ok = True
+        try:
+            local_data = self._read_local_core(product_id) or local_data
+        except Exception as e:
+            # 読めないファイルを差分だけで上書きするとデータを失うため書き込まない
+            print(f"Local file read error: {e}")
+            local_ok = False
+        if local_ok:
+            local_data.update(changes)
+            if not self._save_local(product_id, local_data):
+                return False
+        elif not self.use_supabase:
+            _product_cache.invalidate(product_id)
+            return False
+        
+        _product_cache.patch(product_id, changes)
         return True
 
     def duplicate_product(self, product_id):
         """製品を複製して新しい製品を作成"""
         import uuid
         
-        # 元の製品を取得
-        original = self.get_product(product_id)
+        # 元の製品を取得（全セクションを含めて複製する）
+        original = self.get_product(product_id, sections="all")
         if not original:
             return None
         
         # 新しい製品IDを生成
         new_product_id = f"prod_{uuid.uuid4().hex[:8]}"
         
-        # 複製データを作成
-        new_product = original.copy()
+        # 複製データを作成（競合データは入れ子のため個別にコピー）
+        new_product = dict(original)
         new_product['id'] = new_product_id
         new_product['name'] = f"{original.get('name', '')}のコピー"
         new_product['created_at'] = datetime.now().isoformat()
@@ -239,36 +874,36 @@ class DataStore:
         
         # 画像をコピー（Supabase使用時）
         if self.use_supabase:
-            # 製品画像をコピー
-            new_product['product_image_urls'] = self._copy_images_to_new_product(
-                original.get('product_image_urls') or [],
-                new_product_id,
-                'product_images'
-            )
+            competitor_data = dict(new_product.get('competitor_analysis_v2') or {})
+            competitors = [dict(comp) for comp in competitor_data.get('competitors') or []]
             
-            # 参考LP画像をコピー
-            new_product['reference_lp_image_urls'] = self._copy_images_to_new_product(
-                original.get('reference_lp_image_urls') or [],
-                new_product_id,
-                'reference_lp'
-            )
+            # 製品画像・参考LP画像・トンマナ画像・競合画像をまとめて1回のバッチでコピー
+            groups = [
+                (new_product, 'product_image_urls', 'product_images'),
+                (new_product, 'reference_lp_image_urls', 'reference_lp'),
+                (new_product, 'tone_manner_image_urls', 'tone_manner'),
+            ] + [(comp, 'file_urls', f'competitors/{i}') for i, comp in enumerate(competitors)]
             
-            # トンマナ画像をコピー
-            new_product['tone_manner_image_urls'] = self._copy_images_to_new_product(
-                original.get('tone_manner_image_urls') or [],
-                new_product_id,
-                'tone_manner'
-            )
+            jobs = []
+            for owner, key, folder in groups:
+                for url in owner.get(key) or []:
+                    jobs.append((url, f"{new_product_id}/{folder}"))
             
-            # 競合画像をコピー
-            competitor_data = new_product.get('competitor_analysis_v2') or {}
-            competitors = competitor_data.get('competitors') or []
-            for i, comp in enumerate(competitors):
-                comp['file_urls'] = self._copy_images_to_new_product(
-                    comp.get('file_urls') or [],
-                    new_product_id,
-                    f'competitors/{i}'
-                )
+            copied = self.copy_storage_images(jobs)
+            failed = [url for (url, _), new_url in zip(jobs, copied) if url and not new_url]
+            if failed:
+                # 一部だけ元のURLを指す不整合な複製は作らない（コピー済みの分は片付ける）
+                self.delete_storage_files([new_url for new_url in copied if new_url])
+                self.last_error = f"画像のコピーに失敗しました（{len(failed)}/{len(jobs)}件）: {failed[0]}"
+                print(f"Duplicate product error: {self.last_error}")
+                return None
+            
+            position = 0
+            for owner, key, folder in groups:
+                count = len(owner.get(key) or [])
+                owner[key] = copied[position:position + count]
+                position += count
+            competitor_data['competitors'] = competitors
             new_product['competitor_analysis_v2'] = competitor_data
             
             # ローカルパスは空にする
@@ -278,83 +913,139 @@ class DataStore:
         
         # 新しい製品を保存
         if self.use_supabase:
-            data_to_save = new_product.copy()
-            exclude_keys = ["review_sheet_data"]
-            for key in exclude_keys:
-                if key in data_to_save:
-                    del data_to_save[key]
+            data_to_save = {k: v for k, v in new_product.items() if k not in LOCAL_ONLY_KEYS}
             
             result = self.supabase.table("lp_products").insert(data_to_save).execute()
             return result.data[0] if result.data else None
         else:
-            self.save_product(new_product)
-            return new_product
+            return new_product if self.save_product(new_product) else None
+
+    def copy_storage_images(self, jobs, bucket_name: str = "lp-generator-images", max_workers: int = STORAGE_MAX_WORKERS) -> list:
+        """画像を別フォルダに並列コピーし、入力順に新しいURLのリストを返す
 
-    def _copy_images_to_new_product(self, image_urls, new_product_id, folder):
-        """画像を新しい製品フォルダにコピー"""
+        jobs: [(元のURL, コピー先フォルダ), ...]
+        同じバケット内のStorage画像はサーバー側でコピーし、それ以外（外部URL・別バケット・
+        コピーAPIの失敗）はダウンロードして再アップロードする。失敗した要素はNone（空のURLはそのまま）。
+        """
         import uuid
-        import requests
+        from modules.image_cache import get_image_cache
+        
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        if not self.supabase:
+            return [None if url else url for url, _ in jobs]
+        self._ensure_bucket(bucket_name)
         
-        new_urls = []
-        for url in image_urls:
+        def _copy(job):
+            url, folder = job
+            if not url:
+                return url
+            extension = url.split('.')[-1].split('?')[0]
+            if len(extension) > 5 or '/' in extension: # 拡張子がおかしい場合はjpgにフォールバック
+                extension = 'jpg'
+            new_path = f"{folder}/{uuid.uuid4().hex[:12]}.{extension}"
+            
+            source = self._parse_storage_url(url)
+            if source and source[0] == bucket_name:
+                try:
+                    self.supabase.storage.from_(bucket_name).copy(source[1], new_path)
+                    return self.get_public_url(new_path, bucket_name)
+                except Exception as e:
+                    print(f"Storage copy error ({source[1]}), falling back to re-upload: {e}")
+            
+            content = get_image_cache().fetch_bytes(url, timeout=30)
+            if content is None:
+                return None
             try:
-                # 画像をダウンロード
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    # 新しいファイル名を生成
-                    extension = url.split('.')[-1].split('?')[0]
-                    if len(extension) > 5: # 拡張子がおかしい場合はjpgにフォールバック
-                        extension = 'jpg'
-                    new_filename = f"{uuid.uuid4().hex[:12]}.{extension}"
-                    new_path = f"{new_product_id}/{folder}/{new_filename}"
-                    
-                    # 新しい場所にアップロード
-                    new_url = self.upload_image(
-                        response.content,
-                        new_path,
-                        bucket_name="lp-generator-images"
-                    )
-                    if new_url:
-                        new_urls.append(new_url)
-                    else:
-                        # アップロード失敗時は元のURLを使用（フォールバック）
-                        new_urls.append(url)
-                else:
-                    new_urls.append(url)
+                return self._upload_to_storage(content, new_path, bucket_name)
             except Exception as e:
                 print(f"画像コピーエラー: {e}")
-                new_urls.append(url)
+                return None
         
-        return new_urls
+        return run_parallel(_copy, jobs, max_workers=max_workers)
+
+    def _parse_storage_url(self, url: str):
+        """Storageの公開URLから (バケット名, パス) を取り出す（Storage以外のURLはNone）"""
+        marker = "/storage/v1/object/public/"
+        if not url or marker not in url:
+            return None
+        supabase_url = getattr(self, "supabase_url", "")
+        if supabase_url and not url.startswith(supabase_url):
+            return None
+        bucket_and_path = unquote(url.split(marker, 1)[1].split('?')[0])
+        if '/' not in bucket_and_path:
+            return None
+        bucket, path = bucket_and_path.split('/', 1)
+        return bucket, path
 
     def delete_product(self, product_id: str) -> bool:
-        # Supabaseから削除
+        # Supabaseから削除（未同期の保存で復活しないよう先に破棄）
+        if self._write_behind():
+            self._sync_queue().discard(product_id)
         self._delete_from_supabase(product_id)
+        _product_cache.invalidate(product_id)
         
         # ファイルからも削除
-        file_path = self.data_dir / f"{product_id}.json"
-        if file_path.exists():
-            file_path.unlink()
-            return True
-        return False
+        store = get_local_json_store()
+        store.delete_tree(self._section_dir(product_id))
+        return store.delete(self.data_dir / f"{product_id}.json")
     
-    def list_products(self) -> list:
+    def list_products(self, columns: list = None, order_by: str = None, descending: bool = True,
+                      limit: int = None, offset: int = None, updated_before: str = None) -> list:
+        """製品一覧を取得
+
+        columns: 取得するカラム（省略時は全カラム）
+        order_by: 並び替えるカラム（descendingで降順）
+        limit / offset: ページング
+        updated_before: updated_atがこの値より古いものだけを取得（updated_at降順のキーセットページング用）
+        """
         # Supabaseから取得を試みる（Streamlit Cloud対応）
         if self.use_supabase:
-            db_products = self._get_all_from_supabase()
+            params = {"select": ",".join(columns) if columns else "*"}
+            if order_by:
+                params["order"] = f"{order_by}.{'desc' if descending else 'asc'}.nullslast"
+            if updated_before:
+                params["updated_at"] = f"lt.{updated_before}"
+            if limit is not None:
+                params["limit"] = int(limit)
+            if offset:
+                params["offset"] = int(offset)
+            db_products = self._get_all_from_supabase(params)
             if db_products:
                 return db_products  # リストをそのまま返す
+            if db_products is not None and (offset or updated_before):
+                return []  # 2ページ目以降が空なのは正常（ローカルにはフォールバックしない）
         
-        # フォールバック：ファイルから取得
+        # フォールバック：ファイルから取得（未書き込みの保存を先に書き出す）
+        store = get_local_json_store()
+        store.flush()
         products = []
         for file_path in self.data_dir.glob("*.json"):
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    product = json.load(f)
-                    products.append(product)
+                product = store.read(file_path)
+                if columns:
+                    product = {key: product.get(key) for key in columns}
+                products.append(product)
             except Exception:
                 continue
-        return products
+        if updated_before:
+            products = [p for p in products if (p.get("updated_at") or "") < updated_before]
+        if order_by:
+            products.sort(key=lambda p: p.get(order_by) or "", reverse=descending)
+        start = int(offset or 0)
+        end = start + int(limit) if limit is not None else None
+        return products[start:end]
+    
+    def list_product_summaries(self, limit: int = None, offset: int = None, updated_before: str = None) -> list:
+        """一覧表示用の軽量な製品リスト（id・名前・説明・日時のみ、更新日時の新しい順）"""
+        return self.list_products(
+            columns=PRODUCT_SUMMARY_COLUMNS,
+            order_by="updated_at",
+            limit=limit,
+            offset=offset,
+            updated_before=updated_before
+        )
 
     def upload_image(self, file_data, file_name: str, bucket_name: str = "lp-generator-images") -> str:
         """画像をSupabase Storageにアップロードし、公開URLを返す"""
@@ -362,44 +1053,75 @@ class DataStore:
             return None
         
         try:
-            # バケットの存在確認と作成
-            buckets = self.supabase.storage.list_buckets()
-            bucket_exists = any(b.name == bucket_name for b in buckets)
-            if not bucket_exists:
-                self.supabase.storage.create_bucket(bucket_name, options={"public": True})
-            
-            file_options = {"upsert": "true", "content-type": "image/jpeg"}
-            if file_name.lower().endswith(".png"):
-                file_options["content-type"] = "image/png"
-            elif file_name.lower().endswith(".webp"):
-                file_options["content-type"] = "image/webp"
-            
-            # 1. アップロード処理
-            self.supabase.storage.from_(bucket_name).upload(
-                path=file_name,
-                file=file_data,
-                file_options=file_options
-            )
-            
-            # 2. 公開URLを取得
-            url_result = self.supabase.storage.from_(bucket_name).get_public_url(file_name)
-            
-            # URLの抽出
-            url = None
-            if isinstance(url_result, str):
-                url = url_result
-            elif isinstance(url_result, dict):
-                url = url_result.get('publicUrl') or url_result.get('public_url')
-            elif hasattr(url_result, 'public_url'):
-                url = url_result.public_url
-            
-            return url
-            
+            self._ensure_bucket(bucket_name)
+            return self._upload_to_storage(file_data, file_name, bucket_name)
         except Exception as e:
             # 失敗しても続行（URL取得は試みる価値がある場合もあるが、ここではメソッド全体で例外処理）
             print(f"Supabase storage upload error: {e}")
             return None
 
+    def upload_images(self, batch, bucket_name: str = "lp-generator-images", max_workers: int = STORAGE_MAX_WORKERS) -> list:
+        """複数画像を並列でアップロードし、入力順に公開URLのリストを返す
+
+        batch: [(file_data, file_name), ...]
+        失敗した要素はNoneになる。
+        """
+        batch = list(batch)
+        if not self.supabase or not batch:
+            return [None] * len(batch)
+        
+        try:
+            self._ensure_bucket(bucket_name)
+        except Exception as e:
+            print(f"Supabase storage bucket error: {e}")
+            return [None] * len(batch)
+        
+        def _upload(item):
+            file_data, file_name = item
+            try:
+                return self._upload_to_storage(file_data, file_name, bucket_name)
+            except Exception as e:
+                print(f"Supabase storage upload error ({file_name}): {e}")
+                return None
+        
+        return run_parallel(_upload, batch, max_workers=max_workers)
+
+    def _ensure_bucket(self, bucket_name: str):
+        """バケットの存在確認と作成（確認はプロセスごとに1回だけ）"""
+        if bucket_name in _known_buckets:
+            return
+        with _shared_lock:
+            if bucket_name in _known_buckets:
+                return
+            buckets = self.supabase.storage.list_buckets()
+            if not any(b.name == bucket_name for b in buckets):
+                self.supabase.storage.create_bucket(bucket_name, options={"public": True})
+            _known_buckets.add(bucket_name)
+
+    def _upload_to_storage(self, file_data, file_name: str, bucket_name: str) -> str:
+        """1ファイルをアップロードして公開URLを返す（例外は呼び出し元で処理）"""
+        from modules.image_cache import get_image_cache
+        file_options = {"upsert": "true", "content-type": "image/jpeg"}
+        if file_name.lower().endswith(".png"):
+            file_options["content-type"] = "image/png"
+        elif file_name.lower().endswith(".webp"):
+            file_options["content-type"] = "image/webp"
+        
+        self.supabase.storage.from_(bucket_name).upload(
+            path=file_name,
+            file=file_data,
+            file_options=file_options
+        )
+        url = self.get_public_url(file_name, bucket_name)
+        # 同じパスへの上書きで古い画像を返さないよう、手元のキャッシュを破棄する
+        get_image_cache().invalidate(url)
+        return url
+
+    def get_public_url(self, file_name: str, bucket_name: str = "lp-generator-images") -> str:
+        """公開バケットのURLをローカルで組み立てる（APIは呼ばない）"""
+        supabase_url = getattr(self, "supabase_url", "") or self.base_url.rsplit("/rest/v1", 1)[0]
+        return f"{supabase_url}/storage/v1/object/public/{bucket_name}/{quote(file_name.lstrip('/'), safe='/')}"
+
     def delete_image(self, file_path: str, bucket_name: str = "lp-generator-images") -> bool:
         """Supabase Storageからファイルを削除する"""
         if not self.supabase:
@@ -438,13 +1160,49 @@ class DataStore:
             print(f"Storage削除エラー: {e}")
         return False
 
-    def delete_storage_files(self, file_urls, bucket_name: str = "lp-generator-images"):
-        """複数ファイルを削除"""
-        if not file_urls:
-            return
-        for url in file_urls:
-            if url:
-                self.delete_storage_file(url, bucket_name)
+    def delete_storage_files(self, file_urls, bucket_name: str = "lp-generator-images", background: bool = False):
+        """複数ファイルをバケットごとにまとめて削除し、URLごとの結果 {url: bool} を返す
+
+        background=Trueの場合はバックグラウンドで実行し、結果を返すFutureを返す。
+        """
+        urls = [url for url in dict.fromkeys(file_urls or []) if url]
+        if background:
+            return _background_executor.submit(self._delete_storage_batch, urls, bucket_name)
+        return self._delete_storage_batch(urls, bucket_name)
+
+    def _delete_storage_batch(self, urls, bucket_name: str) -> dict:
+        report = {url: False for url in urls}
+        if not self.supabase or not urls:
+            return report
+        
+        # バケットごとにパスをまとめる
+        by_bucket = {}
+        for url in urls:
+            parsed = self._parse_storage_url(url)
+            if parsed:
+                bucket, path = parsed
+            elif f'{bucket_name}/' in url:
+                bucket, path = bucket_name, unquote(url.split(f'{bucket_name}/', 1)[1].split('?')[0])
+            else:
+                print(f"Storage削除対象外のURL: {url}")
+                continue
+            by_bucket.setdefault(bucket, []).append((path, url))
+        
+        for bucket, entries in by_bucket.items():
+            for start in range(0, len(entries), STORAGE_DELETE_CHUNK_SIZE):
+                chunk = entries[start:start + STORAGE_DELETE_CHUNK_SIZE]
+                try:
+                    removed = self.supabase.storage.from_(bucket).remove([path for path, _ in chunk])
+                    removed_names = {item.get("name") for item in removed or [] if isinstance(item, dict)}
+                    for path, url in chunk:
+                        report[url] = path in removed_names
+                except Exception as e:
+                    print(f"Storage削除エラー ({bucket}, {len(chunk)}件): {e}")
+        
+        failed = [url for url, ok in report.items() if not ok]
+        if failed:
+            print(f"Storage削除: {len(urls) - len(failed)}/{len(urls)}件削除（未削除: {failed[:3]}...）")
+        return report
 
     def get_presets(self, preset_type):
         """プリセット一覧を取得"""
@@ -486,13 +1244,12 @@ class DataStore:
 
     def delete_preset_with_images(self, preset_id, preset_images):
         """プリセットとその画像を削除"""
-        # Storage内のプリセット画像を削除
+        # Storage内のプリセット画像をまとめて削除
         if preset_images:
-            for img_url in preset_images:
-                try:
-                    self.delete_storage_file(img_url)
-                except Exception as e:
-                    print(f"Error deleting storage file during preset deletion: {e}")
+            try:
+                self.delete_storage_files(preset_images)
+            except Exception as e:
+                print(f"Error deleting storage file during preset deletion: {e}")
         
         # DBからプリセットを削除
         return self.delete_preset(preset_id)
@@ -582,6 +1339,36 @@ class DataStore:
             print(f"[ERROR] get_employee_feedback: {e}")
             return []
 
+    def get_employee_feedback_batch(self, employee_ids, limit=20):
+        """複数メンバーの直近フィードバックを1クエリでまとめて取得 ({employee_id: [feedback, ...]})"""
+        employee_ids = list(employee_ids)
+        feedback_map = {emp_id: [] for emp_id in employee_ids}
+        if not employee_ids:
+            return feedback_map
+        columns = "employee_id,ai_evaluation,user_feedback,created_at"
+        try:
+            # 全体でも limit × 人数 件までに抑える（フィードバックの多いメンバーで転送量が膨らまないように）
+            max_rows = limit * len(employee_ids)
+            result = self.supabase.table("employee_feedback").select(columns).in_(
+                "employee_id", employee_ids
+            ).order("created_at", desc=True).limit(max_rows).execute()
+            data = result.data or []
+            for row in data:
+                rows = feedback_map.setdefault(row.get("employee_id"), [])
+                if len(rows) < limit:
+                    rows.append(row)
+            if len(data) >= max_rows:
+                # 上限で打ち切られた場合、件数が足りないメンバーは個別に取り直す
+                for emp_id in employee_ids:
+                    if len(feedback_map[emp_id]) < limit:
+                        result = self.supabase.table("employee_feedback").select(columns).eq(
+                            "employee_id", emp_id
+                        ).order("created_at", desc=True).limit(limit).execute()
+                        feedback_map[emp_id] = result.data or []
+        except Exception as e:
+            print(f"[ERROR] get_employee_feedback_batch: {e}")
+        return feedback_map
+
     def add_employee_feedback(self, data):
         """Add employee feedback"""
         try:
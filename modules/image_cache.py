@@ -0,0 +1,252 @@
+"""
+画像取得キャッシュ
+Supabase Storage等の画像URLをURL＋ETagでローカルに保存し、同じ画像の再ダウンロードを防ぐ
+（ディスク上はサイズ上限つきLRU、プロセス内はメモリのホット層、期限切れは条件付きGETで再検証）
+Supabase Storageへのアップロード時はinvalidate()で古いエントリを捨てる（アップロード先はuuid名なので上書きされない）
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from modules.ai_clients import get_http_session
+
+DEFAULT_CACHE_DIR = "data/image_cache"
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+HOT_TIER_MAX_BYTES = 64 * 1024 * 1024
+# Cache-Controlが無いレスポンスは毎回条件付きGETで再検証する
+DEFAULT_MAX_AGE_SECONDS = 0
+# headers省略時のリクエストヘッダー（UAが無いと画像を返さないサイトがある）
+DEFAULT_FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+
+def _max_age(headers) -> int:
+    """Cache-Control: max-age を秒で取得"""
+    cache_control = headers.get("Cache-Control", "") or ""
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE_SECONDS
+
+
+class ImageBlobCache:
+    """URL単位の画像キャッシュ（インデックスはSQLite、本体はファイル）"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, hot_max_bytes: int = HOT_TIER_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hot_bytes = 0
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "revalidated": 0, "downloads": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, "index.sqlite3")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    max_age INTEGER NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_accessed ON blobs(last_accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=10)
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def fetch(self, url: str, headers: Dict[str, str] = None, timeout: float = 30) -> Optional[Dict[str, Any]]:
+        """画像を取得（戻り値: {"content": bytes, "content_type": str}、失敗時はNone）"""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        now = time.time()
+        entry = self._get_entry(key)
+        content = self._read_content(key) if entry else None
+        if entry and content is None:
+            entry = None
+
+        # 有効期間内ならネットワークに出ない
+        if entry and now - entry["fetched_at"] < entry["max_age"]:
+            self._touch(key, now)
+            return {"content": content, "content_type": entry["content_type"]}
+
+        request_headers = dict(DEFAULT_FETCH_HEADERS if headers is None else headers)
+        if entry:
+            if entry["etag"]:
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = get_http_session().get(url, headers=request_headers, timeout=timeout)
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache fetch error ({url}): {e}")
+            # 再検証できない場合は手元のコピーを使う
+            if entry:
+                return {"content": content, "content_type": entry["content_type"]}
+            return None
+
+        if response.status_code == 304 and entry:
+            with self._lock:
+                self.stats["revalidated"] += 1
+            self._update_entry(key, url, entry["etag"], entry["last_modified"], entry["content_type"], len(content), now, _max_age(response.headers))
+            return {"content": content, "content_type": entry["content_type"]}
+
+        if response.status_code != 200:
+            print(f"[DEBUG] ImageBlobCache fetch failed ({url}): status {response.status_code}")
+            return None
+
+        content = response.content
+        content_type = response.headers.get("Content-Type", "image/jpeg")
+        with self._lock:
+            self.stats["downloads"] += 1
+        self._store(key, url, content, content_type, response.headers, now)
+        return {"content": content, "content_type": content_type}
+
+    def fetch_bytes(self, url: str, headers: Dict[str, str] = None, timeout: float = 30) -> Optional[bytes]:
+        """画像のバイト列のみを取得"""
+        result = self.fetch(url, headers=headers, timeout=timeout)
+        return result["content"] if result else None
+
+    def invalidate(self, url: str):
+        """URLのキャッシュを破棄（同じURLの画像を上書きした時に呼ぶ）"""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        with self._lock:
+            previous = self._hot.pop(key, None)
+            if previous is not None:
+                self._hot_bytes -= len(previous)
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache index error: {e}")
+        try:
+            os.remove(self._blob_path(key))
+        except OSError:
+            pass
+
+    def _get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT etag, last_modified, content_type, size, fetched_at, max_age FROM blobs WHERE key = ?", (key,)
+                ).fetchone()
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache index error: {e}")
+            return None
+        if not row:
+            return None
+        return dict(zip(("etag", "last_modified", "content_type", "size", "fetched_at", "max_age"), row))
+
+    def _read_content(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            content = self._hot.get(key)
+            if content is not None:
+                self._hot.move_to_end(key)
+                self.stats["hot_hits"] += 1
+                return content
+        try:
+            with open(self._blob_path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        self._remember(key, content)
+        return content
+
+    def _remember(self, key: str, content: bytes):
+        """ホット層に追加し、上限を超えた分を古い順に捨てる"""
+        if len(content) > self.hot_max_bytes:
+            return
+        with self._lock:
+            previous = self._hot.pop(key, None)
+            if previous is not None:
+                self._hot_bytes -= len(previous)
+            self._hot[key] = content
+            self._hot_bytes += len(content)
+            while self._hot_bytes > self.hot_max_bytes:
+                _, evicted = self._hot.popitem(last=False)
+                self._hot_bytes -= len(evicted)
+
+    def _touch(self, key: str, now: float):
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE blobs SET last_accessed = ? WHERE key = ?", (now, key))
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache index error: {e}")
+
+    def _update_entry(self, key, url, etag, last_modified, content_type, size, now, max_age):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs (key, url, etag, last_modified, content_type, size, fetched_at, max_age, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, url, etag, last_modified, content_type, size, now, max_age, now)
+                )
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache index error: {e}")
+
+    def _store(self, key: str, url: str, content: bytes, content_type: str, headers, now: float):
+        """本体を書き込み（一時ファイル経由で置き換え）、容量上限を超えたらLRUで削除"""
+        path = self._blob_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[DEBUG] ImageBlobCache write error: {e}")
+            return
+        self._remember(key, content)
+        self._update_entry(key, url, headers.get("ETag"), headers.get("Last-Modified"), content_type, len(content), now, _max_age(headers))
+        self._evict()
+
+    def _evict(self):
+        try:
+            with self._lock, self._connect() as conn:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                for key, size in conn.execute("SELECT key, size FROM blobs ORDER BY last_accessed ASC").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+                    try:
+                        os.remove(self._blob_path(key))
+                    except OSError:
+                        pass
+                    evicted = self._hot.pop(key, None)
+                    if evicted is not None:
+                        self._hot_bytes -= len(evicted)
+                    total -= size
+        except Exception as e:
+            print(f"[DEBUG] ImageBlobCache evict error: {e}")
+
+
+_image_cache: Optional[ImageBlobCache] = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageBlobCache:
+    """プロセス共有の画像キャッシュを取得"""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageBlobCache()
+        return _image_cache
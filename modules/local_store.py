@@ -0,0 +1,231 @@
+"""
+ローカルJSON保存エンジン
+一時ファイルへ書いてからリネームで置き換える（書き込み途中で落ちてもファイルが壊れない）
+短時間に同じファイルへ連続で保存した場合はまとめて1回だけ書き込む（未書き込みの内容は読み込み時に優先して返す）
+"""
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 同じファイルへの保存をまとめる時間（秒）。0なら毎回すぐに書き込む
+LOCAL_WRITE_DEBOUNCE_SECONDS = float(os.environ.get("LOCAL_WRITE_DEBOUNCE_SECONDS", "0.5"))
+# 書き込みに失敗した保存を再試行する間隔の上限（秒）。間隔は失敗するたびに倍にする
+LOCAL_WRITE_RETRY_MAX_SECONDS = float(os.environ.get("LOCAL_WRITE_RETRY_MAX_SECONDS", "30"))
+# デバッグ用に整形（indent=2）して保存するか
+LOCAL_JSON_PRETTY = os.environ.get("LOCAL_JSON_PRETTY", "").lower() in ("1", "true", "yes")
+
+
+def dumps_json(data, pretty: bool = False) -> bytes:
+    """JSONをUTF-8のバイト列に変換（orjsonがあれば使う。既定は空白なしのコンパクト形式）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(data, default=str, option=option)
+        except TypeError:
+            pass  # 64bitを超える整数など、orjsonで扱えない値は標準のjsonで書く
+    if pretty:
+        text = json.dumps(data, ensure_ascii=False, indent=2, default=str)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return text.encode("utf-8")
+
+
+def loads_json(content):
+    """JSONを読み込む（orjsonがあれば使う）"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def write_atomic(path, content: bytes, durable: bool = False):
+    """一時ファイルに書いてから置き換える（durable=Trueならfsyncしてから置き換える）"""
+    path = str(path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LocalJsonStore:
+    """アトミックなJSON書き込みと、同じファイルへの連続書き込みのまとめ（デバウンス）"""
+
+    def __init__(self, debounce_seconds: float = LOCAL_WRITE_DEBOUNCE_SECONDS, pretty: bool = LOCAL_JSON_PRETTY):
+        self.debounce_seconds = debounce_seconds
+        self.pretty = pretty
+        self._lock = threading.Condition()
+        # ファイルへの書き込みは1本ずつ（古い内容が新しい内容を追い越さないように）
+        self._io_lock = threading.Lock()
+        self._pending = {}  # path -> {"content": bytes, "due": float, "attempts": int}
+        self._worker = None
+        # errors: 書き込みの失敗回数 / failing: 失敗して再試行待ちの件数 / last_error: 直近の失敗
+        self.stats = {"writes": 0, "coalesced": 0, "errors": 0, "failing": 0, "last_error": None}
+
+    def write(self, path, data, immediate: bool = False):
+        """JSONを保存（保存時点の内容で確定。immediate=Trueならまとめずにすぐ書き込む）
+
+        immediate=True（またはデバウンス無効）で書き込めなかった場合はOSErrorを送出する。
+        まとめて書き込む場合の失敗は未書き込みのまま残して再試行し、statsに記録する。
+        """
+        path = str(path)
+        content = dumps_json(data, self.pretty)
+        if immediate or self.debounce_seconds <= 0:
+            with self._io_lock:
+                with self._lock:
+                    older = self._pending.get(path)
+                    older_content = older["content"] if older else None
+                self._write_file(path, content)
+                with self._lock:
+                    # 書き込めた内容の方が新しいので、それより前の未書き込みの保存は不要
+                    if older is not None and self._pending.get(path) is older and older["content"] is older_content:
+                        self._discard_pending(path)
+            return
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending:
+                # 期限は最初の保存から数える（保存し続けても一定間隔で書き込まれる）
+                pending["content"] = content
+                self.stats["coalesced"] += 1
+            else:
+                self._pending[path] = {"content": content, "due": time.monotonic() + self.debounce_seconds, "attempts": 0}
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="local-json-writer", daemon=True)
+                self._worker.start()
+            self._lock.notify()
+
+    def read(self, path):
+        """JSONを読み込む（未書き込みの保存があればその内容。ファイルが無ければFileNotFoundError）"""
+        with self._lock:
+            pending = self._pending.get(str(path))
+            content = pending["content"] if pending else None
+        if content is None:
+            with open(path, "rb") as f:
+                content = f.read()
+        return loads_json(content)
+
+    def exists(self, path) -> bool:
+        with self._lock:
+            if str(path) in self._pending:
+                return True
+        return Path(path).exists()
+
+    def delete(self, path) -> bool:
+        """ファイルを削除（未書き込みの保存も破棄）"""
+        with self._io_lock:
+            with self._lock:
+                pending = self._discard_pending(str(path))
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return pending is not None
+
+    def delete_tree(self, directory):
+        """ディレクトリごと削除（配下の未書き込みの保存も破棄）"""
+        prefix = os.path.join(str(directory), "")
+        with self._io_lock:
+            with self._lock:
+                for path in [p for p in self._pending if p.startswith(prefix)]:
+                    self._discard_pending(path)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def flush(self, path=None) -> bool:
+        """未書き込みの保存をすぐに書き込む（省略時は全件）。書き込めないものがあればFalse"""
+        with self._lock:
+            paths = [str(path)] if path is not None else list(self._pending)
+        ok = True
+        for p in paths:
+            ok = self._write_pending(p) and ok
+        return ok
+
+    def _discard_pending(self, path: str):
+        """未書き込みの保存を破棄（_lockを取得して呼ぶ）"""
+        pending = self._pending.pop(path, None)
+        if pending and pending["attempts"]:
+            self.stats["failing"] -= 1
+        return pending
+
+    def _write_pending(self, path: str) -> bool:
+        with self._io_lock:
+            with self._lock:
+                pending = self._pending.get(path)
+            if pending is None:
+                return True
+            content = pending["content"]
+            try:
+                self._write_file(path, content)
+            except OSError:
+                with self._lock:
+                    # 失敗した保存は破棄せず、間隔を空けて再試行する
+                    if pending["attempts"] == 0:
+                        self.stats["failing"] += 1
+                    pending["attempts"] += 1
+                    delay = max(self.debounce_seconds, 0.5) * 2 ** pending["attempts"]
+                    pending["due"] = time.monotonic() + min(delay, LOCAL_WRITE_RETRY_MAX_SECONDS)
+                return False
+            with self._lock:
+                # 書き込み中に新しい保存が来ていなければ完了
+                if self._pending.get(path) is pending and pending["content"] is content:
+                    self._discard_pending(path)
+            return True
+
+    def _write_file(self, path: str, content: bytes):
+        try:
+            write_atomic(path, content)
+        except OSError as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = f"{path}: {e}"
+            print(f"Local JSON write error ({path}): {e}")
+            raise
+        with self._lock:
+            self.stats["writes"] += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    if not self._lock.wait(timeout=30):
+                        if not self._pending:
+                            self._worker = None
+                            return
+                now = time.monotonic()
+                due = [p for p, item in self._pending.items() if item["due"] <= now]
+                if not due:
+                    self._lock.wait(timeout=min(item["due"] for item in self._pending.values()) - now)
+                    continue
+            for path in due:
+                self._write_pending(path)
+
+
+_local_store = None
+_local_store_lock = threading.Lock()
+
+
+def get_local_json_store() -> LocalJsonStore:
+    """プロセス共有のローカルJSON保存エンジンを取得"""
+    global _local_store
+    with _local_store_lock:
+        if _local_store is None:
+            _local_store = LocalJsonStore()
+            # 終了時に未書き込みの保存を書き出す
+            atexit.register(_local_store.flush)
+        return _local_store
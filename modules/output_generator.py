@@ -1,6 +1,6 @@
-from typing import Dict, List
+from typing import Dict, Iterator, List
 import json
-import requests
+from modules.image_cache import get_image_cache
 import base64
 
 class OutputGenerator:
@@ -105,6 +105,21 @@ class OutputGenerator:
 
     def generate_design_instruction(self, product_data: Dict, images: List = None) -> str:
         """AIを使用してデザイナー向け指示書を生成（画像参照対応）"""
+        prompt, image_data_list = self._build_design_instruction_request(product_data, images)
+        if image_data_list:
+            return self.ai_provider.ask(prompt, task="image_analysis", images=image_data_list)
+        # 画像がない場合は従来通り
+        return self.ai_provider.ask(prompt)
+
+    def generate_design_instruction_stream(self, product_data: Dict, images: List = None) -> Iterator[str]:
+        """generate_design_instructionのストリーミング版（st.write_stream用。最後まで生成できたかは戻り値の completed）"""
+        prompt, image_data_list = self._build_design_instruction_request(product_data, images)
+        if image_data_list:
+            return self.ai_provider.ask_stream(prompt, task="image_analysis", images=image_data_list)
+        return self.ai_provider.ask_stream(prompt)
+
+    def _build_design_instruction_request(self, product_data: Dict, images: List = None):
+        """指示書生成用の (プロンプト, 参照画像リスト) を組み立てる"""
         
         # 製品名
         product_name = product_data.get('name', '製品名未設定')
@@ -181,16 +196,16 @@ class OutputGenerator:
         prompt = self.prompt_manager.get_prompt("designer_instruction_generation", variables)
         
         # 画像がある場合はビジョンAIで生成
+        image_data_list = []
         if image_urls:
-            image_data_list = []
             for img_info in image_urls:
                 img_url = img_info.get('url')
                 if img_url and img_url.startswith('http'):
                     try:
-                        resp = requests.get(img_url, timeout=30)
-                        if resp.status_code == 200:
-                            img_base64 = base64.b64encode(resp.content).decode('utf-8')
-                            mime_type = resp.headers.get('content-type', 'image/png')
+                        cached = get_image_cache().fetch(img_url, timeout=30)
+                        if cached:
+                            img_base64 = base64.b64encode(cached['content']).decode('utf-8')
+                            mime_type = cached['content_type'] or 'image/png'
                             image_data_list.append({'data': img_base64, 'mime_type': mime_type})
                     except Exception as e:
                         print(f"画像取得エラー ({img_info.get('title', '')}): {e}")
@@ -201,10 +216,5 @@ class OutputGenerator:
 画像に実際に表示されている内容（テキスト、レイアウト、要素配置）を正確に反映してください。
 
 {prompt}"""
-                response = self.ai_provider.ask(prompt, task="image_analysis", images=image_data_list)
-                return response
 
-        # 画像がない場合は従来通り
-        response = self.ai_provider.ask(prompt)
-        
-        return response
+        return prompt, image_data_list
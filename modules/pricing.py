@@ -0,0 +1,207 @@
+"""
+料金表レジストリ
+data/pricing.json をプロセス内で1回だけ読み込み、ファイルの更新（mtime）があった時だけ読み直す
+（トークン単価は円換算済みで保持し、日付・バージョン違いのモデル名は正規化した別名で引く）
+"""
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_PRICING_PATH = "data/pricing.json"
+DEFAULT_USD_TO_JPY = 150
+# 料金表に無いプロバイダー・モデルの既定料金（$/100万トークン）
+DEFAULT_TEXT_PRICING = {
+    "claude": {"input": 3.0, "output": 15.0},
+    "gpt": {"input": 2.5, "output": 10.0},
+    "gemini": {"input": 0.075, "output": 0.3}
+}
+# 1枚単価で課金される画像生成モデルの既定料金（$/枚。サイズ、HD品質は「サイズ_hd」）
+DEFAULT_IMAGE_PRICES = {
+    "dall-e-3": {"1024x1024": 0.04, "1024x1792": 0.08, "1792x1024": 0.08,
+                 "1024x1024_hd": 0.08, "1024x1792_hd": 0.12, "1792x1024_hd": 0.12},
+    "dall-e-2": {"1024x1024": 0.02, "512x512": 0.018, "256x256": 0.016}
+}
+
+# 末尾の日付・バージョン表記（-20241022 / -2025-12-11 / -06-06 / -001 / -latest）
+_MODEL_SUFFIX_RE = re.compile(r"(-\d{8}|-\d{4}-\d{2}-\d{2}|-\d{2}-\d{2}|-\d{3}|-latest)$")
+
+
+def normalize_provider(provider: str) -> str:
+    """プロバイダー名を料金表のキー（claude / gpt / gemini）に正規化"""
+    provider = (provider or "").lower()
+    if "claude" in provider or "anthropic" in provider:
+        return "claude"
+    elif "gpt" in provider or "openai" in provider:
+        return "gpt"
+    elif "gemini" in provider or "google" in provider:
+        return "gemini"
+    return provider
+
+
+def normalize_model(model: str) -> str:
+    """モデル名の別名キー（小文字化し、models/ 接頭辞と末尾の日付・バージョンを除く）"""
+    name = (model or "").strip().lower()
+    if name.startswith("models/"):
+        name = name[len("models/"):]
+    while True:
+        stripped = _MODEL_SUFFIX_RE.sub("", name)
+        if stripped == name or not stripped:
+            return name
+        name = stripped
+
+
+class _AliasIndex:
+    """モデル名 → 値 の索引（完全一致 → 正規化した別名 → 最長の前方一致の順に引く）"""
+
+    def __init__(self, entries: Dict[str, Any]):
+        self._exact = dict(entries)
+        self._aliases = {}
+        for model, value in entries.items():
+            alias = normalize_model(model)
+            # 日付なしの名前そのものが料金表にあればそちらを優先
+            if alias not in self._aliases or model.lower() == alias:
+                self._aliases[alias] = value
+        self._memo = {}
+
+    def get(self, model: str):
+        if not model:
+            return None
+        if model in self._exact:
+            return self._exact[model]
+        if model in self._memo:
+            return self._memo[model]
+        alias = normalize_model(model)
+        value = self._aliases.get(alias)
+        if value is None:
+            # 未知のモデルは同系統の最も近い名前（区切り位置での最長前方一致）を使う
+            candidates = [a for a in self._aliases if alias.startswith(a + "-") or alias.startswith(a + ".")]
+            if candidates:
+                value = self._aliases[max(candidates, key=len)]
+        self._memo[model] = value
+        return value
+
+
+class PricingRegistry:
+    """料金表（円換算済みの単価と別名索引）"""
+
+    def __init__(self, path: str = DEFAULT_PRICING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._loaded = False
+        self._data: Dict[str, Any] = {}
+        self.usd_to_jpy = DEFAULT_USD_TO_JPY
+        self._text = {}
+        self._text_defaults = {}
+        self._image_tokens = _AliasIndex({})
+        self._image_prices = {}
+
+    def _ensure_loaded(self):
+        """ファイルが更新されていれば読み直す（stat 1回だけで判定）"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if self._loaded and signature == self._signature:
+            return
+        with self._lock:
+            if self._loaded and signature == self._signature:
+                return
+            data = {}
+            if signature is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"[DEBUG] pricing load error: {e}")
+            self._build(data)
+            self._signature = signature
+            self._loaded = True
+
+    def _build(self, data: Dict[str, Any]):
+        usd_to_jpy = data.get("usd_to_jpy", DEFAULT_USD_TO_JPY)
+        per_token = usd_to_jpy / 1_000_000
+
+        def to_rates(rates):
+            return (rates.get("input", 0) * per_token, rates.get("output", 0) * per_token)
+
+        text_pricing = data.get("text_generation")
+        if text_pricing is None:
+            # 料金表が無い場合は既定料金だけを使う
+            text_pricing = {provider: {} for provider in DEFAULT_TEXT_PRICING}
+        text = {
+            provider: _AliasIndex({model: to_rates(rates) for model, rates in models.items() if isinstance(rates, dict)})
+            for provider, models in text_pricing.items()
+        }
+        text_defaults = {provider: to_rates(rates) for provider, rates in DEFAULT_TEXT_PRICING.items()}
+
+        image_pricing = data.get("image_generation", {})
+        image_tokens = _AliasIndex({model: to_rates(rates) for model, rates in image_pricing.items() if isinstance(rates, dict)})
+        # 1枚単価は料金表の値を既定料金より優先する（input/outputはトークン単価なので含めない）
+        image_prices = {}
+        for model in set(DEFAULT_IMAGE_PRICES) | set(image_pricing):
+            rates = image_pricing.get(model)
+            rates = {**DEFAULT_IMAGE_PRICES.get(model, {}), **(rates if isinstance(rates, dict) else {})}
+            image_prices[model] = {
+                key: value * usd_to_jpy for key, value in rates.items()
+                if key not in ("input", "output") and isinstance(value, (int, float))
+            }
+
+        self._data = data
+        self.usd_to_jpy = usd_to_jpy
+        self._text = text
+        self._text_defaults = text_defaults
+        self._image_tokens = image_tokens
+        self._image_prices = image_prices
+
+    def get_data(self) -> Dict[str, Any]:
+        """料金表そのもの（読み取り専用として扱うこと）"""
+        self._ensure_loaded()
+        return self._data
+
+    def get_exchange_rate(self) -> float:
+        self._ensure_loaded()
+        return self.usd_to_jpy
+
+    def text_rates(self, provider: str, model: str = None) -> Optional[Tuple[float, float]]:
+        """テキスト生成の1トークンあたりの円単価 (入力, 出力)（プロバイダーが料金表に無ければNone）"""
+        self._ensure_loaded()
+        provider_key = normalize_provider(provider)
+        index = self._text.get(provider_key)
+        if index is None:
+            return None
+        rates = index.get(model)
+        if rates is None:
+            # モデルが特定できない場合はプロバイダーの既定料金（料金表の先頭モデルは使わない）
+            rates = self._text_defaults.get(provider_key, (0.0, 0.0))
+        return rates
+
+    def image_token_rates(self, model: str) -> Optional[Tuple[float, float]]:
+        """トークン課金の画像生成モデルの円単価 (入力, 出力)（画像生成モデルでなければNone）"""
+        self._ensure_loaded()
+        return self._image_tokens.get(model)
+
+    def is_image_model(self, model: str) -> bool:
+        return self.image_token_rates(model) is not None
+
+    def image_prices(self, model_key: str) -> Optional[Dict[str, float]]:
+        """1枚あたりの円単価（サイズ・品質ごと）"""
+        self._ensure_loaded()
+        return self._image_prices.get(model_key)
+
+
+_registries: Dict[str, PricingRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_pricing_registry(path: str = DEFAULT_PRICING_PATH) -> PricingRegistry:
+    """プロセス共有の料金表レジストリを取得"""
+    with _registries_lock:
+        registry = _registries.get(path)
+        if registry is None:
+            registry = PricingRegistry(path)
+            _registries[path] = registry
+        return registry
@@ -0,0 +1,299 @@
+"""
+Supabaseへの書き込みを後回しにする同期キュー（ライトビハインド）
+製品の保存はローカルに確定させてすぐに返し、バックグラウンドでまとめてSupabaseにupsertする
+（同じ製品への連続した保存は1件にまとめる。Supabase側の方が新しければ上書きしない＝updated_atで後勝ち）
+"""
+import copy
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from modules.local_store import get_local_json_store
+
+# 1回のupsertでまとめて送る製品数
+SYNC_BATCH_SIZE = int(os.environ.get("SUPABASE_SYNC_BATCH_SIZE", "20"))
+# キューを確認する間隔（秒）
+SYNC_INTERVAL_SECONDS = float(os.environ.get("SUPABASE_SYNC_INTERVAL_SECONDS", "1.0"))
+# この回数失敗したら自動再試行をやめて「失敗」として表示する
+SYNC_MAX_ATTEMPTS = int(os.environ.get("SUPABASE_SYNC_MAX_ATTEMPTS", "5"))
+SYNC_BACKOFF_MAX_SECONDS = 60.0
+
+
+def _timestamp(value):
+    """updated_atを比較用の数値に変換（タイムゾーン無しはUTCとみなす。解釈できなければNone）"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class ProductSyncQueue:
+    """製品ごとの未同期の変更を保持し、バックグラウンドでSupabaseに書き込む"""
+
+    def __init__(self, journal_path=None, batch_size: int = SYNC_BATCH_SIZE,
+                 interval_seconds: float = SYNC_INTERVAL_SECONDS, max_attempts: int = SYNC_MAX_ATTEMPTS):
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.max_attempts = max_attempts
+        self.journal_path = str(journal_path) if journal_path else None
+        self._lock = threading.Condition()
+        # 同期処理は1本ずつ（バックグラウンドと「今すぐ同期」が同じ製品を二重に送らないように）
+        self._sync_lock = threading.Lock()
+        self._items = {}
+        self._store = None
+        self._worker = None
+        self._seq = 0
+        self.stats = {"synced": 0, "batches": 0, "conflicts": 0, "errors": 0, "last_synced_at": None}
+        self._load_journal()
+
+    def enqueue(self, store, product_id: str, changes: dict, updated_at: str = None, full: bool = False):
+        """変更をキューに追加（未同期の変更があれば上書きでまとめる）
+
+        full: changesが製品全体か（既存の行はどちらもchangesのカラムだけをPATCHし、新規の行はローカルの製品全体をupsertする）
+        """
+        changes = copy.deepcopy(changes)
+        with self._lock:
+            self._store = store
+            self._seq += 1
+            item = self._items.get(product_id)
+            if item is None:
+                item = {"changes": {}, "full": False, "restored": False, "queued_at": time.time(), "attempts": 0}
+                self._items[product_id] = item
+            item["changes"].update(changes)
+            item["full"] = item["full"] or full
+            item["updated_at"] = updated_at or changes.get("updated_at") or item.get("updated_at")
+            item["seq"] = self._seq
+            item["next_attempt"] = 0.0
+            item["failed"] = False
+            self._start_worker()
+            self._lock.notify()
+        self._save_journal()
+
+    def attach(self, store):
+        """同期に使うDataStoreを登録（再起動前の未同期分があれば同期を始める）"""
+        with self._lock:
+            if self._store is None:
+                self._store = store
+            if self._items:
+                self._start_worker()
+                self._lock.notify()
+
+    def pending_changes(self, product_id: str) -> dict:
+        """未同期の変更（読み込み時にSupabaseの古い値を上書きするため）"""
+        with self._lock:
+            item = self._items.get(product_id)
+            return copy.deepcopy(item["changes"]) if item else {}
+
+    def discard(self, product_id: str):
+        """未同期の変更を破棄（製品の削除時など）"""
+        with self._lock:
+            removed = self._items.pop(product_id, None)
+        if removed:
+            self._save_journal()
+
+    def retry_failed(self):
+        """失敗扱いになった項目を再試行する"""
+        with self._lock:
+            for item in self._items.values():
+                if item["failed"]:
+                    item["failed"] = False
+                    item["attempts"] = 0
+                    item["next_attempt"] = 0.0
+            self._start_worker()
+            self._lock.notify()
+
+    def flush(self):
+        """待機中の項目をすぐに1回ずつ同期する（失敗扱いの項目は除く）"""
+        with self._lock:
+            remaining = {pid for pid, item in self._items.items() if not item["failed"]}
+        while remaining:
+            processed = self._sync_once(only=remaining)
+            if not processed:
+                return
+            remaining -= set(processed)
+
+    def get_status(self) -> dict:
+        """同期状況（未同期件数・最も古い未同期の経過秒数・失敗した項目）"""
+        now = time.time()
+        with self._lock:
+            pending = [item for item in self._items.values() if not item["failed"]]
+            failed = [
+                {"product_id": pid, "attempts": item["attempts"], "error": item.get("last_error"), "queued_at": item["queued_at"]}
+                for pid, item in self._items.items() if item["failed"]
+            ]
+            lag = max((now - item["queued_at"] for item in self._items.values()), default=0.0)
+            return {**self.stats, "pending": len(pending), "failed": failed, "lag_seconds": lag}
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="supabase-sync", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not any(not item["failed"] for item in self._items.values()):
+                    if not self._lock.wait(timeout=30):
+                        if not any(not item["failed"] for item in self._items.values()):
+                            self._worker = None
+                            return
+                    continue
+            if not self._sync_once():
+                with self._lock:
+                    self._lock.wait(timeout=self.interval_seconds)
+
+    def _sync_once(self, only=None) -> list:
+        """送信可能な項目を1バッチ同期し、処理した製品IDを返す（送るものが無ければ空）
+
+        only: 指定した製品IDだけを待機時間に関係なく送る
+        """
+        with self._sync_lock:
+            now = time.monotonic()
+            with self._lock:
+                store = self._store
+                batch = [
+                    (pid, copy.deepcopy(item))
+                    for pid, item in self._items.items()
+                    if not item["failed"] and (pid in only if only is not None else item["next_attempt"] <= now)
+                ][:self.batch_size]
+            if not batch or store is None:
+                return []
+            processed = [pid for pid, _ in batch]
+
+            remote = store._get_updated_at_many(processed)
+            if remote is None:
+                self._mark_failed(batch, "Supabaseからupdated_atを取得できませんでした")
+                return processed
+
+            rows = []
+            for pid, item in batch:
+                remote_ts = _timestamp(remote.get(pid))
+                local_ts = _timestamp(item.get("updated_at"))
+                if remote_ts is not None and local_ts is not None and remote_ts > local_ts:
+                    # Supabase側の方が新しい（別の端末などで更新済み）ので上書きしない
+                    with self._lock:
+                        self.stats["conflicts"] += 1
+                    print(f"[DEBUG] Supabase sync skipped {pid}: remote is newer")
+                    self._done(pid, item["seq"])
+                    store._on_sync_conflict(pid)
+                    continue
+                if pid in remote and not item["restored"]:
+                    # 既存の行は変更したカラムだけをPATCHする
+                    # （部分的な行のupsertはINSERTとして扱われ、NOT NULL制約に引っかかる）
+                    changes = {key: value for key, value in item["changes"].items() if key != "id"}
+                    result = store._patch_supabase(pid, changes)
+                    with self._lock:
+                        self.stats["batches"] += 1
+                    if result is None:
+                        # 確認後に行が消えていれば、新規として全体を送る
+                        item["restored"] = True
+                    elif result:
+                        self._done(pid, item["seq"])
+                        with self._lock:
+                            self.stats["synced"] += 1
+                            self.stats["last_synced_at"] = time.time()
+                        continue
+                    else:
+                        self._mark_failed([(pid, item)], store.last_error or "Supabaseの更新に失敗しました")
+                        continue
+                # DBに行が無い（または再起動で変更内容が分からない）場合はローカルの製品全体を送る
+                product = store._read_local_product(pid)
+                if product is None and not item["full"]:
+                    self._mark_failed([(pid, item)], "ローカルに製品データがありません")
+                    continue
+                row = {**(product or {}), **item["changes"]}
+                row["id"] = pid
+                rows.append((pid, item, row))
+
+            # PostgRESTの一括upsertは全行のキーが揃っている必要があるため、キーの組み合わせごとに送る
+            groups = {}
+            for pid, item, row in rows:
+                groups.setdefault(tuple(sorted(row)), []).append((pid, item, row))
+            for group in groups.values():
+                ok, error = store._upsert_products([row for _, _, row in group])
+                with self._lock:
+                    self.stats["batches"] += 1
+                if ok:
+                    for pid, item, _ in group:
+                        self._done(pid, item["seq"])
+                    with self._lock:
+                        self.stats["synced"] += len(group)
+                        self.stats["last_synced_at"] = time.time()
+                else:
+                    self._mark_failed([(pid, item) for pid, item, _ in group], error)
+            self._save_journal()
+            return processed
+
+    def _done(self, product_id: str, seq: int):
+        """同期済みにする（同期中に新しい変更が来ていれば残す）"""
+        with self._lock:
+            item = self._items.get(product_id)
+            if item is not None and item["seq"] == seq:
+                del self._items[product_id]
+
+    def _mark_failed(self, batch, error: str):
+        with self._lock:
+            self.stats["errors"] += 1
+            for pid, snapshot in batch:
+                item = self._items.get(pid)
+                if item is None:
+                    continue
+                item["attempts"] += 1
+                item["last_error"] = error
+                if item["seq"] != snapshot["seq"]:
+                    item["next_attempt"] = 0.0  # 新しい変更が来ているのですぐに送り直す
+                elif item["attempts"] >= self.max_attempts:
+                    item["failed"] = True
+                else:
+                    item["next_attempt"] = time.monotonic() + min(SYNC_BACKOFF_MAX_SECONDS, 2 ** item["attempts"])
+        print(f"Supabase sync error: {error}")
+
+    def _save_journal(self):
+        """未同期の製品IDを記録（プロセスが落ちても再起動後にローカルの内容で同期し直す）"""
+        if not self.journal_path:
+            return
+        with self._lock:
+            journal = {pid: {"updated_at": item.get("updated_at"), "queued_at": item["queued_at"]} for pid, item in self._items.items()}
+        try:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            get_local_json_store().write(self.journal_path, journal)
+        except Exception as e:
+            print(f"Supabase sync journal write error: {e}")
+
+    def _load_journal(self):
+        if not self.journal_path:
+            return
+        store = get_local_json_store()
+        try:
+            if not store.exists(self.journal_path):
+                return
+            journal = store.read(self.journal_path)
+        except Exception as e:
+            print(f"Supabase sync journal read error: {e}")
+            return
+        for pid, entry in journal.items():
+            self._seq += 1
+            self._items[pid] = {
+                "changes": {}, "full": True, "restored": True, "updated_at": entry.get("updated_at"),
+                "queued_at": entry.get("queued_at") or time.time(), "attempts": 0,
+                "next_attempt": 0.0, "failed": False, "seq": self._seq
+            }
+
+
+_sync_queue = None
+_sync_queue_lock = threading.Lock()
+
+
+def get_sync_queue(journal_path=None) -> ProductSyncQueue:
+    """プロセス共有の同期キューを取得（journal_pathは初回のみ有効）"""
+    global _sync_queue
+    with _sync_queue_lock:
+        if _sync_queue is None:
+            _sync_queue = ProductSyncQueue(journal_path)
+        return _sync_queue
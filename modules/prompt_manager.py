@@ -1,8 +1,186 @@
 import json
 import os
-from typing import Dict, List, Any
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
 from supabase import create_client, Client
 
+# 他のプロセス・画面で変更されたプロンプトを確認する間隔（秒）
+PROMPTS_REFRESH_INTERVAL_SECONDS = float(os.environ.get("PROMPTS_REFRESH_INTERVAL_SECONDS", "30"))
+
+_supabase_client: Optional[Client] = None
+_supabase_client_ready = False
+_supabase_client_lock = threading.Lock()
+
+
+def _get_supabase_client() -> Optional[Client]:
+    """プロセス共有のSupabaseクライアント（未設定・接続失敗時はNone）"""
+    global _supabase_client, _supabase_client_ready
+    with _supabase_client_lock:
+        if not _supabase_client_ready:
+            url = os.environ.get("SUPABASE_URL")
+            key = os.environ.get("SUPABASE_KEY")
+            service_key = os.environ.get("SUPABASE_SERVICE_KEY")
+            if url and (key or service_key):
+                try:
+                    _supabase_client = create_client(url, service_key if service_key else key)
+                except Exception as e:
+                    print(f"Supabase init error in PromptManager: {e}")
+            _supabase_client_ready = True
+        return _supabase_client
+
+
+class _PromptStore:
+    """プロンプトの共有キャッシュ
+
+    全件を1クエリで読み込み、以降は一定間隔ごとに件数と最新のupdated_atだけを確認して、
+    変わっていた時だけ読み直す（ローカルファイルの場合は更新日時とサイズで判定）
+    """
+
+    def __init__(self, prompts_file: str, supabase: Optional[Client], defaults: Dict[str, Dict[str, str]]):
+        self.prompts_file = prompts_file
+        self.supabase = supabase
+        self.defaults = defaults
+        self.prompts: Dict[str, Dict[str, Any]] = {}
+        self.has_updated_at = False
+        self._signature = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def refresh(self, force: bool = False):
+        if not force and self._loaded and time.monotonic() - self._checked_at < PROMPTS_REFRESH_INTERVAL_SECONDS:
+            return
+        with self._lock:
+            if not force and self._loaded and time.monotonic() - self._checked_at < PROMPTS_REFRESH_INTERVAL_SECONDS:
+                return
+            if force or not self._loaded:
+                self._load()
+            else:
+                signature = self._current_signature()
+                if signature is None or signature != self._signature:
+                    self._load()
+            self._checked_at = time.monotonic()
+
+    def _current_signature(self):
+        """変更検知用の (件数, 最新のupdated_at)。確認できない場合はNone（読み直す）"""
+        if self.supabase is not None:
+            if not self.has_updated_at:
+                return None
+            try:
+                response = (self.supabase.table("prompts").select("updated_at", count="exact")
+                            .order("updated_at", desc=True).limit(1).execute())
+                latest = response.data[0].get("updated_at") if response.data else None
+                return (response.count, latest)
+            except Exception as e:
+                print(f"Failed to check prompts in Supabase: {e}")
+                return None
+        try:
+            stat = os.stat(self.prompts_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return ("missing",)
+
+    def _load(self):
+        """Supabase または ローカルファイルからプロンプトを読み込む"""
+        prompts = {}
+        signature = None
+        db_available = False
+
+        if self.supabase is not None:
+            try:
+                # DBから全プロンプトを1クエリで取得
+                rows = self.supabase.table("prompts").select("*").execute().data or []
+                db_available = True
+                for item in rows:
+                    prompts[item.get('id')] = {
+                        "name": item.get('name', ''),
+                        "description": item.get('description', ''),
+                        "template": item.get('template', '')
+                    }
+                self.has_updated_at = bool(rows) and "updated_at" in rows[0]
+                if self.has_updated_at:
+                    signature = (len(rows), max((r.get("updated_at") or "" for r in rows), default=None) or None)
+            except Exception as e:
+                print(f"Failed to load prompts from Supabase: {e}")
+
+        # Supabaseから読み込めなかった場合、またはDBが空の場合はローカルファイルを確認
+        if not prompts:
+            signature = self._current_signature() if self.supabase is None else signature
+            if os.path.exists(self.prompts_file):
+                try:
+                    with open(self.prompts_file, 'r', encoding='utf-8') as f:
+                        prompts = json.load(f)
+                except:
+                    prompts = {}
+
+        # デフォルトで補完し、DBに無いものはまとめて1回で保存（初期化）
+        missing = {key: value.copy() for key, value in self.defaults.items() if key not in prompts}
+        prompts.update(missing)
+        if missing and db_available:
+            self._sync_defaults_to_db(missing)
+
+        self.prompts = prompts
+        self._signature = signature
+        self._loaded = True
+
+    def _row(self, prompt_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        row = {
+            "id": prompt_id,
+            "name": data.get("name", ""),
+            "description": data.get("description", ""),
+            "template": data.get("template", "")
+        }
+        if self.has_updated_at:
+            row["updated_at"] = datetime.now(timezone.utc).isoformat()
+        return row
+
+    def _sync_defaults_to_db(self, missing: Dict[str, Dict[str, Any]]):
+        """不足しているデフォルト値をDBに一括保存（既にある行は上書きしない）"""
+        try:
+            rows = [self._row(pid, data) for pid, data in missing.items()]
+            self.supabase.table("prompts").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+        except Exception as e:
+            print(f"Error syncing defaults to DB: {e}")
+
+    def save(self, prompt_id: str, data: Dict[str, Any]) -> bool:
+        """1件を保存してキャッシュに反映"""
+        with self._lock:
+            prompts = dict(self.prompts)
+            prompts[prompt_id] = data
+            if self.supabase is not None:
+                try:
+                    self.supabase.table("prompts").upsert(self._row(prompt_id, data), on_conflict="id").execute()
+                except Exception as e:
+                    print(f"Error updating prompt in DB: {e}")
+                    return False
+                self.prompts = prompts
+                return True
+            # ローカル保存
+            dir_path = os.path.dirname(self.prompts_file)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            with open(self.prompts_file, 'w', encoding='utf-8') as f:
+                json.dump(prompts, f, ensure_ascii=False, indent=2)
+            self.prompts = prompts
+            self._signature = self._current_signature()
+            return True
+
+
+_stores: Dict[str, _PromptStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _get_prompt_store(prompts_file: str, defaults: Dict[str, Dict[str, str]]) -> _PromptStore:
+    with _stores_lock:
+        store = _stores.get(prompts_file)
+        if store is None:
+            store = _PromptStore(prompts_file, _get_supabase_client(), defaults)
+            _stores[prompts_file] = store
+        return store
+
+
 class PromptManager:
     DEFAULT_PROMPTS = {
         "ai_chat": {
@@ -545,92 +723,20 @@ JSONのみを出力し、他のテキストは含めないでください。"""
 
     def __init__(self, prompts_file: str = "data/prompts.json"):
         self.prompts_file = prompts_file
-        self.prompts = {}
-        self.use_supabase = False
-        self.supabase = None
-        
-        # Supabase接続試行
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_KEY")
-        service_key = os.environ.get("SUPABASE_SERVICE_KEY")
-        
-        if url and (key or service_key):
-            try:
-                self.supabase = create_client(url, service_key if service_key else key)
-                self.use_supabase = True
-            except Exception as e:
-                print(f"Supabase init error in PromptManager: {e}")
-        
-        # 初期読み込み
-        self._load_prompts()
-    
-    def _ensure_directory(self):
-        dir_path = os.path.dirname(self.prompts_file)
-        if dir_path:
-            os.makedirs(dir_path, exist_ok=True)
-
-    def _load_prompts(self):
-        """Supabase または ローカルファイルからプロンプトを読み込む"""
-        loaded = False
-        
-        if self.use_supabase:
-            try:
-                # DBから全プロンプト取得
-                response = self.supabase.table("prompts").select("*").execute()
-                db_prompts = response.data
-                
-                if db_prompts:
-                    for item in db_prompts:
-                        pid = item.get('id')
-                        self.prompts[pid] = {
-                            "name": item.get('name', ''),
-                            "description": item.get('description', ''),
-                            "template": item.get('template', '')
-                        }
-                    loaded = True
-            except Exception as e:
-                print(f"Failed to load prompts from Supabase: {e}")
-        
-        # Supabaseから読み込めなかった場合、またはDBが空の場合はローカル/デフォルトを確認
-        if not loaded or not self.prompts:
-            if os.path.exists(self.prompts_file):
-                try:
-                    with open(self.prompts_file, 'r', encoding='utf-8') as f:
-                        self.prompts = json.load(f)
-                except:
-                    self.prompts = {}
-            
-            # デフォルトで補完
-            updated = False
-            for key, value in self.DEFAULT_PROMPTS.items():
-                if key not in self.prompts:
-                    self.prompts[key] = value.copy()
-                    updated = True
-            
-            # Supabaseが有効なら、デフォルト値をDBに保存（初期化）
-            if self.use_supabase and updated:
-                self._sync_defaults_to_db()
+        # 読み込んだプロンプトとSupabaseクライアントはプロセス内で共有する（生成のたびにDBから読み直さない）
+        self._store = _get_prompt_store(prompts_file, self.DEFAULT_PROMPTS)
+        self.supabase = self._store.supabase
+        self.use_supabase = self.supabase is not None
+        self._store.refresh()
 
-    def _sync_defaults_to_db(self):
-        """デフォルト値をDBに保存"""
-        if not self.use_supabase:
-            return
-            
-        try:
-            for pid, data in self.prompts.items():
-                # 存在確認
-                check = self.supabase.table("prompts").select("id").eq("id", pid).execute()
-                if not check.data:
-                    # 新規挿入
-                    insert_data = {
-                        "id": pid,
-                        "name": data.get("name", ""),
-                        "description": data.get("description", ""),
-                        "template": data.get("template", "")
-                    }
-                    self.supabase.table("prompts").insert(insert_data).execute()
-        except Exception as e:
-            print(f"Error syncing defaults to DB: {e}")
+    @property
+    def prompts(self) -> Dict[str, Dict[str, Any]]:
+        self._store.refresh()
+        return self._store.prompts
+
+    def reload(self):
+        """プロンプトを強制的に読み直す"""
+        self._store.refresh(force=True)
 
     def get_prompt(self, prompt_id: str, variables: Dict[str, str] = None) -> str:
         data = self.prompts.get(prompt_id, {})
@@ -662,57 +768,18 @@ JSONのみを出力し、他のテキストは含めないでください。"""
         return result
 
     def update_prompt(self, prompt_id: str, template: str) -> bool:
-        # メモリ更新
-        if prompt_id in self.prompts:
-            self.prompts[prompt_id]["template"] = template
+        current = self.prompts.get(prompt_id)
+        if current:
+            data = {**current, "template": template}
         else:
-            self.prompts[prompt_id] = {
+            data = {
                 "name": prompt_id,
                 "description": "Custom prompt",
                 "template": template
             }
-        
-        # DB更新
-        if self.use_supabase:
-            try:
-                # 存在チェック
-                check = self.supabase.table("prompts").select("*").eq("id", prompt_id).execute()
-                if check.data:
-                    self.supabase.table("prompts").update({"template": template}).eq("id", prompt_id).execute()
-                else:
-                    self.supabase.table("prompts").insert({
-                        "id": prompt_id,
-                        "name": self.prompts[prompt_id]["name"],
-                        "description": self.prompts[prompt_id]["description"],
-                        "template": template
-                    }).execute()
-                return True
-            except Exception as e:
-                print(f"Error updating prompt in DB: {e}")
-                return False
-        else:
-            # ローカル保存
-            self._ensure_directory()
-            with open(self.prompts_file, 'w', encoding='utf-8') as f:
-                json.dump(self.prompts, f, ensure_ascii=False, indent=2)
-            return True
+        return self._store.save(prompt_id, data)
 
     def reset_to_default(self, prompt_id: str) -> bool:
         if prompt_id in self.DEFAULT_PROMPTS:
-            self.prompts[prompt_id] = self.DEFAULT_PROMPTS[prompt_id].copy()
-            template = self.prompts[prompt_id]["template"]
-            
-            # DB更新
-            if self.use_supabase:
-                try:
-                    self.supabase.table("prompts").update({"template": template}).eq("id", prompt_id).execute()
-                    return True
-                except Exception as e:
-                    print(f"Error resetting prompt in DB: {e}")
-                    return False
-            else:
-                 self._ensure_directory()
-                 with open(self.prompts_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.prompts, f, ensure_ascii=False, indent=2)
-                 return True
+            return self._store.save(prompt_id, self.DEFAULT_PROMPTS[prompt_id].copy())
         return False
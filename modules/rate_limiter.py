@@ -0,0 +1,236 @@
+"""
+レート制限スケジューラ
+プロバイダ×モデルごとのトークンバケット（RPM/TPM）でAPI呼び出しを調整し、
+429/Retry-Afterから学習してジッター付き指数バックオフで再試行する
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+DEFAULT_MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# 429以外にも一時的な障害として再試行するステータス（408はタイムアウト、409はAnthropicの競合、529は過負荷）
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_transient_error_types = None
+
+
+def _get_transient_error_types() -> tuple:
+    """HTTPステータスを持たない一時的な障害（接続エラー・タイムアウト）の例外型"""
+    global _transient_error_types
+    if _transient_error_types is None:
+        types = [ConnectionError, TimeoutError]
+        try:
+            import anthropic
+            types.append(anthropic.APIConnectionError)  # APITimeoutErrorを含む
+        except ImportError:
+            pass
+        try:
+            import openai
+            types.append(openai.APIConnectionError)  # APITimeoutErrorを含む
+        except ImportError:
+            pass
+        try:
+            import httpx
+            types.append(httpx.TransportError)
+        except ImportError:
+            pass
+        try:
+            from google.api_core import exceptions as google_exceptions
+            types += [google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded]
+        except ImportError:
+            pass
+        try:
+            import requests
+            types += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+        except ImportError:
+            pass
+        _transient_error_types = tuple(types)
+    return _transient_error_types
+
+
+def is_transient_error(error: Exception) -> bool:
+    """接続エラー・タイムアウトなど、ステータスが無くても再試行すべきエラーか"""
+    return isinstance(error, _get_transient_error_types())
+
+
+class TokenBucket:
+    """予約型トークンバケット（残量がマイナスになる予約を許し、その分の待ち時間を返す）"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """amount分を予約し、実行可能になるまでの待ち秒数を返す"""
+        self._refill(now)
+        # 1回の要求が容量を超える場合でも、容量分待てば通す
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+
+class RateLimiter:
+    """プロバイダ×モデル単位のRPM/TPM制御と429学習"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: Dict[str, Dict[str, float]] = {}
+        self._buckets: Dict[Tuple[str, str], Dict[str, TokenBucket]] = {}
+        self._blocked_until: Dict[Tuple[str, str], float] = {}
+        self.max_retries = DEFAULT_MAX_RETRIES
+        self.stats = {"requests": 0, "waited_seconds": 0.0, "rate_limited": 0, "retries": 0}
+
+    def configure(self, settings: Dict[str, Any]):
+        """settings["rate_limits"]を反映（キーは "provider" または "provider/model"）"""
+        limits = settings.get("rate_limits", {}) or {}
+        with self._lock:
+            if limits != self._limits:
+                self._limits = {k: dict(v) for k, v in limits.items()}
+                self._buckets.clear()
+            self.max_retries = int(settings.get("rate_limit_max_retries", DEFAULT_MAX_RETRIES))
+
+    def _limits_for(self, provider: str, model: str) -> Dict[str, float]:
+        return self._limits.get(f"{provider}/{model}") or self._limits.get(provider) or {}
+
+    def _buckets_for(self, key: Tuple[str, str]) -> Dict[str, TokenBucket]:
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            limits = self._limits_for(*key)
+            buckets = {}
+            if limits.get("rpm"):
+                buckets["rpm"] = TokenBucket(float(limits["rpm"]), float(limits["rpm"]) / 60.0)
+            if limits.get("tpm"):
+                buckets["tpm"] = TokenBucket(float(limits["tpm"]), float(limits["tpm"]) / 60.0)
+            self._buckets[key] = buckets
+        return buckets
+
+    def reserve(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        """1リクエスト分を予約し、送信まで待つべき秒数を返す"""
+        key = (provider, model or "")
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets_for(key)
+            wait = 0.0
+            if "rpm" in buckets:
+                wait = max(wait, buckets["rpm"].reserve(1, now))
+            if "tpm" in buckets and estimated_tokens:
+                wait = max(wait, buckets["tpm"].reserve(estimated_tokens, now))
+            blocked_until = max(self._blocked_until.get(key, 0.0), self._blocked_until.get((provider, ""), 0.0))
+            wait = max(wait, blocked_until - now)
+            self.stats["requests"] += 1
+            self.stats["waited_seconds"] += max(0.0, wait)
+        return max(0.0, wait)
+
+    def acquire(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        """送信可能になるまでブロックする"""
+        wait = self.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        """acquireの非同期版"""
+        wait = self.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def backoff_seconds(self, provider: str, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """再試行すべきエラーなら待ち秒数を返す（429の場合は同じキーの後続リクエストも止める）"""
+        status, retry_after = error_status(error)
+        if attempt >= self.max_retries:
+            return None
+        if status not in RETRYABLE_STATUS_CODES and not (status is None and is_transient_error(error)):
+            return None
+        # ジッター付き指数バックオフ（Full Jitter）
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._lock:
+            self.stats["retries"] += 1
+            if status == 429:
+                self.stats["rate_limited"] += 1
+                key = (provider, model or "")
+                self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), time.monotonic() + delay)
+        return delay
+
+    def call(self, provider: str, model: str, func: Callable[[], Any], estimated_tokens: int = 0) -> Any:
+        """レート制限を守ってfuncを呼び出し、一時的なエラーは再試行する"""
+        attempt = 0
+        while True:
+            self.acquire(provider, model, estimated_tokens)
+            try:
+                return func()
+            except Exception as e:
+                delay = self.backoff_seconds(provider, model, e, attempt)
+                if delay is None:
+                    raise
+                print(f"[DEBUG] {provider}/{model} retry {attempt + 1} in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, provider: str, model: str, func: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """callの非同期版（funcはコルーチンを返す関数）"""
+        attempt = 0
+        while True:
+            await self.acquire_async(provider, model, estimated_tokens)
+            try:
+                return await func()
+            except Exception as e:
+                delay = self.backoff_seconds(provider, model, e, attempt)
+                if delay is None:
+                    raise
+                print(f"[DEBUG] {provider}/{model} retry {attempt + 1} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def error_status(error: Exception) -> Tuple[Optional[int], Optional[float]]:
+    """SDK例外から (HTTPステータス, Retry-After秒) を取り出す"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # google.api_core.exceptions は code にHTTPステータスを持つ
+        code = getattr(error, "code", None)
+        status = code if isinstance(code, int) else None
+    if status is None and type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        status = 429
+
+    retry_after = None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                retry_after = float(value)
+            except ValueError:
+                retry_after = None
+    return status, retry_after
+
+
+def estimate_tokens(text: str, image_count: int = 0) -> int:
+    """TPM予約用の概算トークン数（日本語は概ね1文字1トークン、画像は1枚約1,000トークン）"""
+    return len(text or "") + image_count * 1000
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter(settings: Dict[str, Any] = None) -> RateLimiter:
+    """プロセス共有のRateLimiterを取得（settingsを渡すと制限値を反映）"""
+    if settings is not None:
+        _rate_limiter.configure(settings)
+    return _rate_limiter
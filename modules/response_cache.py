@@ -0,0 +1,156 @@
+"""
+LLMレスポンスキャッシュ
+プロバイダ・モデル・プロンプト・画像のハッシュをキーに応答をSQLiteへ保存する（TTL・LRU件数上限つき）
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = "data/llm_cache.sqlite3"
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_ENTRIES = 2000
+# 毎回違う案が欲しいタスク（ブラッシュアップ・バリエーション・チャット）はキャッシュしない
+DEFAULT_BYPASS_TASKS = ["brushup_copy", "chat"]
+
+
+def _resolve_image_bytes(image: str) -> Optional[bytes]:
+    """URL・ファイルパスの画像を中身のバイト列にする（base64文字列などはNone）"""
+    if image.startswith(("http://", "https://")):
+        # URLは画像キャッシュ経由（上書きされた画像は再検証で新しい内容になる）
+        from modules.image_cache import get_image_cache
+        return get_image_cache().fetch_bytes(image, timeout=30)
+    if len(image) < 4096 and os.path.isfile(image):
+        with open(image, "rb") as f:
+            return f.read()
+    return None
+
+
+def _hash_image(image: Any) -> str:
+    """画像（base64文字列 / {'data', 'mime_type'} 辞書 / bytes / URL / ファイルパス）の中身のハッシュ"""
+    if isinstance(image, dict):
+        image = image.get("data", "")
+    if isinstance(image, str):
+        try:
+            content = _resolve_image_bytes(image)
+        except Exception as e:
+            print(f"[DEBUG] response cache image read error: {e}")
+            content = None
+        # 取得できない場合は文字列そのものをハッシュする
+        image = content if content is not None else image.encode()
+    return hashlib.sha256(bytes(image or b"")).hexdigest()
+
+
+def make_cache_key(provider: str, model: str, prompt: str, images: List[Any] = None) -> str:
+    """キャッシュキー（内容アドレス）を生成"""
+    payload = json.dumps({
+        "provider": provider,
+        "model": model,
+        "prompt": prompt,
+        "images": [_hash_image(img) for img in images or []]
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLiteバックエンドのLLMレスポンスキャッシュ"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_hours: float = DEFAULT_TTL_HOURS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    task TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses(last_accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュを取得（期限切れはNone）"""
+        now = time.time()
+        try:
+            with self._lock, self._connect() as conn:
+                row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if not row:
+                    return None
+                response, created_at = row
+                if now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+                return response
+        except Exception as e:
+            print(f"[DEBUG] ResponseCache.get error: {e}")
+            return None
+
+    def put(self, key: str, response: str, task: str = None):
+        """キャッシュを保存し、上限を超えた分を最終アクセスが古い順に削除"""
+        now = time.time()
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, task, response, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, task, response, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_accessed ASC LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+        except Exception as e:
+            print(f"[DEBUG] ResponseCache.put error: {e}")
+
+    def clear(self):
+        """全キャッシュを削除"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """保存件数とタスク別件数"""
+        try:
+            with self._connect() as conn:
+                total = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                by_task = dict(conn.execute("SELECT COALESCE(task, ''), COUNT(*) FROM responses GROUP BY task").fetchall())
+            return {"entries": total, "by_task": by_task}
+        except Exception:
+            return {"entries": 0, "by_task": {}}
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(settings: Dict[str, Any]) -> Optional[ResponseCache]:
+    """設定で有効化されていればプロセス共有のキャッシュを返す（無効ならNone）"""
+    cache_settings = settings.get("response_cache", {})
+    if not cache_settings.get("enabled", False):
+        return None
+    path = cache_settings.get("path", DEFAULT_CACHE_PATH)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path)
+            _caches[path] = cache
+    # TTL・上限は設定変更を即時反映する
+    cache.ttl_seconds = float(cache_settings.get("ttl_hours", DEFAULT_TTL_HOURS)) * 3600
+    cache.max_entries = int(cache_settings.get("max_entries", DEFAULT_MAX_ENTRIES))
+    return cache
@@ -0,0 +1,393 @@
+"""
+API使用量の台帳
+呼び出しごとのイベントをSQLite（WAL）に追記し、同じトランザクションで日別・月別の集計行を加算する
+（記録は履歴の日数に関係なく一定の手間。複数セッション・複数プロセスから同時に記録しても加算が失われない）
+期間集計は月をまたぐ部分を月別集計、端の日を日別集計から引くため、1年分の履歴でも読む行数は少ない
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+DEFAULT_LEDGER_PATH = "data/usage_ledger.sqlite3"
+# 以前の形式（日付ごとの集計を1つのJSONに読み書きしていた）。初回に集計行として取り込む
+LEGACY_LOG_PATH = "data/usage_log.json"
+
+_ROLLUP_COLUMNS = ("input_tokens", "output_tokens", "cost_jpy", "calls", "image_count", "cache_hits", "cache_misses")
+
+
+# 集計の切り口 → 集計行のdimension / イベントのカラム
+GROUP_DIMENSIONS = {"task": "function", "provider": "provider", "model": "model", "product": "product"}
+_EVENT_GROUP_COLUMNS = {
+    "task": "function", "provider": "provider", "model": "model", "product": "product_id",
+    "day": "day", "month": "substr(day, 1, 7)"
+}
+
+
+def _rollups(kind: str, provider: str, function: str, input_tokens: int, output_tokens: int,
+             cost_jpy: float, image_count: int, cache_hit: Optional[bool], model: str = None, product_id: str = None):
+    """イベントから加算する集計行 [(dimension, key, {カラム: 増分})] を作る"""
+    if kind == "cache":
+        counts = {"cache_hits": 1} if cache_hit else {"cache_misses": 1}
+        return [("cache", "", counts), ("cache_function", function or "unknown", counts)]
+    rows = []
+    if kind == "text":
+        tokens = {"input_tokens": input_tokens, "output_tokens": output_tokens, "cost_jpy": cost_jpy, "calls": 1,
+                  "image_count": image_count}
+        rows += [
+            ("total", "", tokens),
+            ("function", function or "unknown", tokens),
+            ("provider", provider or "unknown", tokens),
+            ("model", model or "unknown", tokens),
+            ("product", product_id or "", tokens),
+        ]
+    else:
+        images = {"cost_jpy": cost_jpy, "image_count": image_count}
+        rows += [
+            ("total", "", images),
+            ("function", function or "unknown", images),
+            ("model", model or "unknown", images),
+            ("product", product_id or "", images),
+        ]
+    if image_count:
+        rows.append(("image", "", {"image_count": image_count, "cost_jpy": cost_jpy}))
+    return rows
+
+
+def _month_ranges(start: str, end: str):
+    """期間を (月全体の月キー一覧, 月の途中を含む端の日付範囲一覧) に分ける"""
+    start_date, end_date = date.fromisoformat(start), date.fromisoformat(end)
+    months, edges = [], []
+    first = start_date.replace(day=1)
+    while first <= end_date:
+        next_first = (first + timedelta(days=32)).replace(day=1)
+        last = next_first - timedelta(days=1)
+        if start_date <= first and last <= end_date:
+            months.append(first.strftime("%Y-%m"))
+        else:
+            edges.append((max(first, start_date).isoformat(), min(last, end_date).isoformat()))
+        first = next_first
+    return months, edges
+
+
+class UsageLedger:
+    """追記専用の使用量イベント台帳と日別集計"""
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH, legacy_log_path: str = LEGACY_LOG_PATH):
+        self.path = path
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts REAL NOT NULL,
+                    day TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    provider TEXT,
+                    model TEXT,
+                    function TEXT,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    cost_jpy REAL NOT NULL DEFAULT 0,
+                    image_count INTEGER NOT NULL DEFAULT 0,
+                    cache_hit INTEGER,
+                    product_id TEXT
+                )
+            """)
+            # 製品IDは後から追加したカラム（既存の台帳は列を足す）
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(usage_events)")]
+            if "product_id" not in columns:
+                conn.execute("ALTER TABLE usage_events ADD COLUMN product_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_events_day ON usage_events(day)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_events_product_day ON usage_events(product_id, day)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_daily (
+                    day TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    cost_jpy REAL NOT NULL DEFAULT 0,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    image_count INTEGER NOT NULL DEFAULT 0,
+                    cache_hits INTEGER NOT NULL DEFAULT 0,
+                    cache_misses INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, dimension, key)
+                )
+            """)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS usage_monthly (
+                    month TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    {", ".join(f"{c} {'REAL' if c == 'cost_jpy' else 'INTEGER'} NOT NULL DEFAULT 0" for c in _ROLLUP_COLUMNS)},
+                    PRIMARY KEY (month, dimension, key)
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS ledger_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._build_breakdown_rollups()
+        if legacy_log_path:
+            self._import_legacy_log(legacy_log_path)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, kind: str, provider: str = None, model: str = None, function: str = None,
+               input_tokens: int = 0, output_tokens: int = 0, cost_jpy: float = 0.0,
+               image_count: int = 0, cache_hit: Optional[bool] = None, ts: float = None, product_id: str = None):
+        """イベントを1件追記して日別・月別集計に加算する
+
+        kind: "text"（LLM呼び出し）/ "image"（画像生成）/ "cache"（レスポンスキャッシュのヒット・ミス）
+        function: タスク名（persona_evaluation 等）
+        """
+        ts = time.time() if ts is None else ts
+        day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        rollups = _rollups(kind, provider, function, input_tokens, output_tokens, cost_jpy, image_count, cache_hit,
+                           model, product_id)
+        conn = self._connect()
+        try:
+            # IMMEDIATEで書き込みロックを先に取り、他プロセスとの加算の取りこぼしを防ぐ
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO usage_events (ts, day, kind, provider, model, function, input_tokens, output_tokens, cost_jpy, image_count, cache_hit, product_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts, day, kind, provider, model, function, input_tokens, output_tokens, cost_jpy, image_count,
+                 None if cache_hit is None else int(bool(cache_hit)), product_id)
+            )
+            self._add_rollups(conn, day, rollups)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _add_rollups(self, conn, day: str, rollups):
+        for dimension, key, increments in rollups:
+            columns = [c for c in _ROLLUP_COLUMNS if c in increments]
+            values = [increments[c] for c in columns]
+            for table, period_column, period in (("usage_daily", "day", day), ("usage_monthly", "month", day[:7])):
+                conn.execute(
+                    f"INSERT INTO {table} ({period_column}, dimension, key, {', '.join(columns)}) "
+                    f"VALUES (?, ?, ?, {', '.join('?' for _ in columns)}) "
+                    f"ON CONFLICT({period_column}, dimension, key) DO UPDATE SET "
+                    + ", ".join(f"{c} = {c} + excluded.{c}" for c in columns),
+                    (period, dimension, key, *values)
+                )
+
+    def _build_breakdown_rollups(self):
+        """モデル別・製品別の集計と月別集計が無かった頃の台帳を一度だけ補完する"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM ledger_meta WHERE key = 'breakdown_rollups_built'").fetchone():
+                conn.rollback()
+                return
+            # 記録済みイベントからモデル別・製品別（画像生成はタスク別も）の日別集計を作る
+            for dimension, column, kinds in (("model", "COALESCE(model, 'unknown')", ("text", "image")),
+                                             ("product", "COALESCE(product_id, '')", ("text", "image")),
+                                             ("function", "COALESCE(function, 'unknown')", ("image",))):
+                conn.execute(
+                    f"INSERT INTO usage_daily (day, dimension, key, input_tokens, output_tokens, cost_jpy, calls, image_count) "
+                    f"SELECT day, ?, {column}, SUM(input_tokens), SUM(output_tokens), SUM(cost_jpy), SUM(kind = 'text'), SUM(image_count) "
+                    f"FROM usage_events WHERE kind IN ({', '.join('?' for _ in kinds)}) GROUP BY day, {column} "
+                    f"ON CONFLICT(day, dimension, key) DO UPDATE SET "
+                    + ", ".join(f"{c} = {c} + excluded.{c}" for c in ("input_tokens", "output_tokens", "cost_jpy", "calls", "image_count")),
+                    (dimension, *kinds)
+                )
+            # 月別集計は日別集計から作り直す
+            conn.execute("DELETE FROM usage_monthly")
+            conn.execute(
+                f"INSERT INTO usage_monthly (month, dimension, key, {', '.join(_ROLLUP_COLUMNS)}) "
+                f"SELECT substr(day, 1, 7), dimension, key, {', '.join(f'SUM({c})' for c in _ROLLUP_COLUMNS)} "
+                f"FROM usage_daily GROUP BY substr(day, 1, 7), dimension, key"
+            )
+            conn.execute("INSERT INTO ledger_meta (key, value) VALUES ('breakdown_rollups_built', ?)", (str(time.time()),))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DEBUG] UsageLedger rollup build error: {e}")
+        finally:
+            conn.close()
+
+    def query(self, start: str, end: str, group_by: Union[str, Sequence[str], None] = None,
+              product_id: str = None) -> List[Dict[str, Any]]:
+        """期間（両端を含む YYYY-MM-DD）の使用量を集計してコストの大きい順に返す
+
+        group_by: None（合計）/ "task" / "provider" / "model" / "product" / "day" / "month"、またはその組み合わせ
+        1つの切り口だけなら日別・月別集計から引く。製品で絞り込む・切り口を組み合わせる場合はイベントから集計する
+        （以前のusage_log.jsonから取り込んだ分はイベントが無いため、この場合は含まれない）
+        """
+        keys = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        unknown = [k for k in keys if k not in _EVENT_GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"unknown group_by: {unknown}")
+        try:
+            with self._connect() as conn:
+                if product_id is None and len(keys) <= 1:
+                    return self._query_rollups(conn, start, end, keys[0] if keys else None)
+                return self._query_events(conn, start, end, keys, product_id)
+        except Exception as e:
+            print(f"[DEBUG] UsageLedger query error: {e}")
+            return []
+
+    def _query_rollups(self, conn, start: str, end: str, group_by: Optional[str]):
+        dimension = GROUP_DIMENSIONS.get(group_by, "total")
+        months, edges = _month_ranges(start, end)
+        sums = ", ".join(f"SUM({c})" for c in _ROLLUP_COLUMNS)
+        if group_by == "day":
+            # 日ごとの推移は日別集計だけで引く
+            months, edges = [], [(start, end)]
+        queries = []
+        if months:
+            period = "month" if group_by == "month" else "key"
+            queries.append((
+                f"SELECT {period}, {sums} FROM usage_monthly WHERE dimension = ? "
+                f"AND month IN ({', '.join('?' for _ in months)}) GROUP BY {period}",
+                (dimension, *months)
+            ))
+        for edge_start, edge_end in edges:
+            period = {"day": "day", "month": "substr(day, 1, 7)"}.get(group_by, "key")
+            queries.append((
+                f"SELECT {period}, {sums} FROM usage_daily WHERE dimension = ? AND day BETWEEN ? AND ? GROUP BY {period}",
+                (dimension, edge_start, edge_end)
+            ))
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for sql, params in queries:
+            for key, *values in conn.execute(sql, params):
+                row = totals.setdefault(key, dict.fromkeys(_ROLLUP_COLUMNS, 0))
+                for column, value in zip(_ROLLUP_COLUMNS, values):
+                    row[column] += value or 0
+        rows = []
+        for key, v in totals.items():
+            row = {group_by: key} if group_by else {}
+            row.update({c: v[c] for c in ("input_tokens", "output_tokens", "calls", "image_count")})
+            row["cost_jpy"] = round(v["cost_jpy"], 2)
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["cost_jpy"], reverse=True)
+
+    def _query_events(self, conn, start: str, end: str, keys: List[str], product_id: Optional[str]):
+        selects = [_EVENT_GROUP_COLUMNS[k] for k in keys]
+        sums = ["SUM(input_tokens)", "SUM(output_tokens)", "SUM(kind = 'text')", "SUM(image_count)", "SUM(cost_jpy)"]
+        sql = f"SELECT {', '.join(selects + sums)} FROM usage_events WHERE kind != 'cache' AND day BETWEEN ? AND ?"
+        params = [start, end]
+        if product_id is not None:
+            sql += " AND product_id = ?"
+            params.append(product_id)
+        if keys:
+            sql += f" GROUP BY {', '.join(selects)}"
+        rows = []
+        for values in conn.execute(sql, params):
+            group_values = values[:len(keys)]
+            input_tokens, output_tokens, calls, image_count, cost = values[len(keys):]
+            if cost is None:
+                # 該当イベントが無い場合の空の合計行
+                continue
+            row = {k: ("" if k == "product" and g is None else g) for k, g in zip(keys, group_values)}
+            row.update({"input_tokens": input_tokens, "output_tokens": output_tokens, "calls": calls,
+                        "image_count": image_count, "cost_jpy": round(cost, 2)})
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["cost_jpy"], reverse=True)
+
+    def get_day(self, day: str) -> Optional[Dict[str, Any]]:
+        """日別の集計（以前のusage_log.jsonと同じ形。記録が無ければNone）"""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f"SELECT dimension, key, {', '.join(_ROLLUP_COLUMNS)} FROM usage_daily WHERE day = ?", (day,)
+                ).fetchall()
+        except Exception as e:
+            print(f"[DEBUG] UsageLedger read error: {e}")
+            return None
+        if not rows:
+            return None
+
+        usage = {
+            "total": {"input_tokens": 0, "output_tokens": 0, "cost_jpy": 0},
+            "by_function": {},
+            "by_provider": {},
+            "image_generation": {"count": 0, "cost_jpy": 0}
+        }
+        cache = {"hits": 0, "misses": 0, "by_function": {}}
+        for dimension, key, *values in rows:
+            v = dict(zip(_ROLLUP_COLUMNS, values))
+            cost = round(v["cost_jpy"], 2)
+            if dimension == "total":
+                usage["total"] = {"input_tokens": v["input_tokens"], "output_tokens": v["output_tokens"], "cost_jpy": cost}
+            elif dimension == "function":
+                usage["by_function"][key] = {"input": v["input_tokens"], "output": v["output_tokens"], "cost": cost}
+            elif dimension == "provider":
+                usage["by_provider"][key] = {"input": v["input_tokens"], "output": v["output_tokens"], "cost": cost}
+            elif dimension == "image":
+                usage["image_generation"] = {"count": v["image_count"], "cost_jpy": cost}
+            elif dimension == "cache":
+                cache["hits"], cache["misses"] = v["cache_hits"], v["cache_misses"]
+            elif dimension == "cache_function":
+                cache["by_function"][key] = {"hits": v["cache_hits"], "misses": v["cache_misses"]}
+        if cache["hits"] or cache["misses"]:
+            usage["cache"] = cache
+        return usage
+
+    def _import_legacy_log(self, legacy_log_path: str):
+        """以前のusage_log.jsonを日別集計として一度だけ取り込む"""
+        if not os.path.exists(legacy_log_path):
+            return
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM ledger_meta WHERE key = 'legacy_log_imported'").fetchone():
+                conn.rollback()
+                return
+            try:
+                with open(legacy_log_path, "r", encoding="utf-8") as f:
+                    log = json.load(f)
+            except Exception as e:
+                print(f"[DEBUG] UsageLedger legacy log read error: {e}")
+                log = {}
+            for day, entry in log.items():
+                self._add_rollups(conn, day, self._legacy_rollups(entry))
+            conn.execute("INSERT INTO ledger_meta (key, value) VALUES ('legacy_log_imported', ?)", (str(time.time()),))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DEBUG] UsageLedger legacy import error: {e}")
+        finally:
+            conn.close()
+
+    def _legacy_rollups(self, entry: Dict[str, Any]):
+        total = entry.get("total", {})
+        rows = [("total", "", {
+            "input_tokens": total.get("input_tokens", 0), "output_tokens": total.get("output_tokens", 0), "cost_jpy": total.get("cost_jpy", 0)
+        })]
+        for dimension, group in (("function", "by_function"), ("provider", "by_provider")):
+            for key, v in (entry.get(group) or {}).items():
+                rows.append((dimension, key, {"input_tokens": v.get("input", 0), "output_tokens": v.get("output", 0), "cost_jpy": v.get("cost", 0)}))
+        image = entry.get("image_generation") or {}
+        if image.get("count") or image.get("cost_jpy"):
+            rows.append(("image", "", {"image_count": image.get("count", 0), "cost_jpy": image.get("cost_jpy", 0)}))
+        cache = entry.get("cache") or {}
+        if cache:
+            rows.append(("cache", "", {"cache_hits": cache.get("hits", 0), "cache_misses": cache.get("misses", 0)}))
+            for key, v in (cache.get("by_function") or {}).items():
+                rows.append(("cache_function", key, {"cache_hits": v.get("hits", 0), "cache_misses": v.get("misses", 0)}))
+        return rows
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """プロセス共有の使用量台帳を取得"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
@@ -26,6 +26,11 @@ page_header("Product List", "管理している製品の一覧")
 # データストア初期化
 data_store = DataStore()
 
+# Supabaseへのバックグラウンド同期に失敗した製品があれば知らせる
+sync_status = data_store.get_sync_status()
+if sync_status and sync_status["failed"]:
+    st.warning(f"⚠️ Supabaseへの同期に失敗した製品が {len(sync_status['failed'])}件あります（ローカルには保存済み）。設定 > APIキー から再試行できます")
+
 # 新規製品作成セクション
 st.subheader("新規製品作成")
 
@@ -36,21 +41,31 @@ with st.form("new_product_form"):
     
     if submitted and product_name:
         product = data_store.create_product(product_name)
-        # 説明を追加
-        if product_description:
-            product['description'] = product_description
-            data_store.update_product(product['id'], product)
-        st.success(f"製品「{product_name}」を作成しました！")
-        st.session_state['current_product_id'] = product['id']
-        st.session_state['current_product_name'] = product_name
-        st.rerun()
+        if product is None:
+            st.error(f"製品の作成に失敗しました: {data_store.last_error}")
+        else:
+            # 説明を追加
+            if product_description:
+                product['description'] = product_description
+                data_store.update_product(product['id'], product)
+            st.success(f"製品「{product_name}」を作成しました！")
+            st.session_state['current_product_id'] = product['id']
+            st.session_state['current_product_name'] = product_name
+            st.rerun()
 
 st.markdown("---")
 
 # 既存製品一覧
 st.subheader("既存製品一覧")
 
-products = [p for p in data_store.list_products() if p.get('id') and p.get('name')]
+# 一覧用のカラムだけを更新日時の新しい順にページ単位で取得
+PRODUCTS_PER_PAGE = 50
+if 'product_list_limit' not in st.session_state:
+    st.session_state['product_list_limit'] = PRODUCTS_PER_PAGE
+list_limit = st.session_state['product_list_limit']
+summaries = data_store.list_product_summaries(limit=list_limit + 1)
+has_more = len(summaries) > list_limit
+products = [p for p in summaries[:list_limit] if p.get('id') and p.get('name')]
 
 if products:
     for idx, product in enumerate(products):
@@ -80,7 +95,7 @@ if products:
                         st.success(f"「{new_product['name']}」を作成しました")
                         st.rerun()
                     else:
-                        st.error("複製に失敗しました")
+                        st.error(f"複製に失敗しました: {data_store.last_error}" if data_store.last_error else "複製に失敗しました")
             
             with col4:
                 delete_key = f"delete_{idx}_{product_id}"
@@ -103,13 +118,15 @@ if products:
                                 
                                 # 競合分析データの画像（v2形式）
                                 comp_analysis = prod_data.get('competitor_analysis_v2') or {}
-                                for comp in comp_analysis.get('competitors', []):
+                                for comp in comp_analysis.get('competitors') or []:
+                                    urls_to_delete.extend(comp.get('file_urls') or [])
                                     urls_to_delete.extend(comp.get('image_urls') or [])
                                 
                                 # 旧形式やその他の場所にある可能性のあるURLも考慮（必要に応じて）
                                 
                                 if urls_to_delete:
-                                    data_store.delete_storage_files(urls_to_delete)
+                                    # 画像はバケットごとにまとめてバックグラウンドで削除する
+                                    data_store.delete_storage_files(urls_to_delete, background=True)
                             
                             # DBから製品を削除
                             data_store.delete_product(product_id)
@@ -126,6 +143,11 @@ if products:
                         st.rerun()
             
             st.markdown("---")
+    
+    if has_more:
+        if st.button("さらに表示", key="load_more_products", use_container_width=True):
+            st.session_state['product_list_limit'] = list_limit + PRODUCTS_PER_PAGE
+            st.rerun()
 else:
     st.info("製品がまだありません。上のフォームから新規作成してください。")
 
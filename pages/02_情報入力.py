@@ -25,6 +25,7 @@ from modules.image_analyzer import ImageAnalyzer
 from modules.ai_provider import AIProvider
 from modules.prompt_manager import PromptManager
 from modules.settings_manager import SettingsManager
+from modules.image_cache import get_image_cache
 import base64
 import uuid
 import requests
@@ -395,6 +396,17 @@ def render_input_page():
     render_sheets_upload(data_store, product_id)
     render_reference_images_upload(data_store, product_id)
 
+def upload_files_to_storage(data_store, uploaded_files, folder):
+    """アップロードされたファイルをまとめてStorageへ並列送信し、(ファイル名, URL)を入力順に返す"""
+    batch = []
+    for uploaded_file in uploaded_files:
+        # ファイル名をサニタイズ（UUID + 拡張子）
+        ext = uploaded_file.name.split('.')[-1].lower() if '.' in uploaded_file.name else 'jpg'
+        safe_name = f"{uuid.uuid4().hex[:12]}.{ext}"
+        batch.append((uploaded_file.getvalue(), f"{folder}/{safe_name}"))
+    urls = data_store.upload_images(batch, bucket_name="lp-generator-images")
+    return [(uploaded_file.name, url) for uploaded_file, url in zip(uploaded_files, urls)]
+
 def handle_product_images_upload(product_id, data_store):
     """製品画像アップロード時のコールバック処理"""
     if "uploader_key_product" not in st.session_state:
@@ -427,20 +439,11 @@ def handle_product_images_upload(product_id, data_store):
         # Supabaseへアップロード
         if data_store.use_supabase:
             remote_urls = product.get('product_image_urls') or []
-            for uploaded_file in uploaded_files:
-                try:
-                    uploaded_file.seek(0)
-                    file_bytes = uploaded_file.read()
-                    
-                    ext = uploaded_file.name.split('.')[-1].lower() if '.' in uploaded_file.name else 'jpg'
-                    safe_name = f"{uuid.uuid4().hex[:12]}.{ext}"
-                    remote_path = f"{product_id}/product_images/{safe_name}"
-                    
-                    url = data_store.upload_image(file_bytes, remote_path, bucket_name="lp-generator-images")
-                    if url and url not in remote_urls:
-                        remote_urls.append(url)
-                except Exception as e:
-                    st.error(f"Upload failed for {uploaded_file.name}: {e}")
+            for file_name, url in upload_files_to_storage(data_store, uploaded_files, f"{product_id}/product_images"):
+                if not url:
+                    st.error(f"Upload failed for {file_name}")
+                elif url not in remote_urls:
+                    remote_urls.append(url)
             
             remote_urls = list(dict.fromkeys(remote_urls))
             product['product_image_urls'] = remote_urls
@@ -600,21 +603,11 @@ def handle_competitor_upload(product_id, data_store, comp_idx):
             comp_data = competitors[comp_idx]
 
             remote_urls = (comp_data.get("file_urls") or [])
-            for uf in uploaded_files:
-                try:
-                    uf.seek(0)
-                    file_bytes = uf.read()
-                    
-                    # ファイル名をサニタイズ（UUID + 拡張子）
-                    ext = uf.name.split('.')[-1].lower() if '.' in uf.name else 'jpg'
-                    safe_name = f"{uuid.uuid4().hex[:12]}.{ext}"
-                    remote_path = f"{product_id}/competitors/comp_{comp_idx}/{safe_name}"
-                    
-                    url = data_store.upload_image(file_bytes, remote_path, bucket_name="lp-generator-images")
-                    if url and url not in remote_urls:
-                        remote_urls.append(url)
-                except Exception as e:
-                    st.error(f"Supabaseアップロード失敗: {e}")
+            for file_name, url in upload_files_to_storage(data_store, uploaded_files, f"{product_id}/competitors/comp_{comp_idx}"):
+                if not url:
+                    st.error(f"Supabaseアップロード失敗: {file_name}")
+                elif url not in remote_urls:
+                    remote_urls.append(url)
             comp_data["file_urls"] = remote_urls
         
         competitors[comp_idx] = comp_data
@@ -664,9 +657,8 @@ def save_competitor_field(product_id, data_store, comp_idx, field_name):
     competitors[comp_idx][field_name] = new_value
 
     current_data["competitors"] = competitors
-    product["competitor_analysis_v2"] = current_data
     
-    if data_store.update_product(product_id, product):
+    if data_store.patch_product(product_id, {"competitor_analysis_v2": current_data}):
         st.toast(f"保存完了: {competitors[comp_idx].get('name', '競合')}")
 
 def save_competitor_text(product_id, competitor_index, data_store):
@@ -690,9 +682,8 @@ def save_competitor_text(product_id, competitor_index, data_store):
             
             competitors[competitor_index]['text'] = text
             current_data["competitors"] = competitors
-            product["competitor_analysis_v2"] = current_data
             
-            if data_store.update_product(product_id, product):
+            if data_store.patch_product(product_id, {"competitor_analysis_v2": current_data}):
                 st.toast(f"テキストを保存しました: {competitors[competitor_index].get('name', '競合')}")
 
 def render_competitor_analysis(data_store, product_id):
@@ -1262,17 +1253,13 @@ def render_competitor_analysis_results(analysis_data):
 
 
 def save_product_sheet(product_id, data_store):
-    product = data_store.get_product(product_id)
-    if product and "edit_organized" in st.session_state:
-        product["product_sheet_organized"] = st.session_state.edit_organized
-        if data_store.update_product(product_id, product):
+    if "edit_organized" in st.session_state:
+        if data_store.patch_product(product_id, {"product_sheet_organized": st.session_state.edit_organized}):
             st.toast("製品シート情報を保存しました")
 
 def save_keyword_sheet(product_id, data_store):
-    product = data_store.get_product(product_id)
-    if product and "edit_keyword" in st.session_state:
-        product["keyword_organized"] = st.session_state.edit_keyword
-        if data_store.update_product(product_id, product):
+    if "edit_keyword" in st.session_state:
+        if data_store.patch_product(product_id, {"keyword_organized": st.session_state.edit_keyword}):
             st.toast("キーワード情報を保存しました")
 
 def handle_product_sheet_upload(product_id, data_store):
@@ -1470,29 +1457,13 @@ def handle_lp_upload(product_id, data_store):
         if data_store.use_supabase:
             remote_urls = product.get('reference_lp_image_urls') or []
             uploaded_count = 0
-            for uploaded_file in lp_images:
-                try:
-                    uploaded_file.seek(0)
-                    file_bytes = uploaded_file.read()
-                    
-                    # ファイル名をサニタイズ（UUID + 拡張子）
-                    ext = uploaded_file.name.split('.')[-1].lower() if '.' in uploaded_file.name else 'jpg'
-                    safe_name = f"{uuid.uuid4().hex[:12]}.{ext}"
-                    remote_path = f"{product_id}/reference_lp/{safe_name}"
-                    
-                    url = data_store.upload_image(file_bytes, remote_path, bucket_name="lp-generator-images")
-                    
-                    if url:
-                        # 文字列であることを保証
-                        if not isinstance(url, str) and hasattr(url, 'public_url'):
-                            url = url.public_url
-                        
-                        # 重複チェック
-                        if url and url not in remote_urls:
-                            remote_urls.append(url)
-                            uploaded_count += 1
-                except Exception as e:
-                    st.error(f"Supabaseへのアップロードに失敗しました ({uploaded_file.name}): {e}")
+            for file_name, url in upload_files_to_storage(data_store, lp_images, f"{product_id}/reference_lp"):
+                if not url:
+                    st.error(f"Supabaseへのアップロードに失敗しました ({file_name})")
+                # 重複チェック
+                elif url not in remote_urls:
+                    remote_urls.append(url)
+                    uploaded_count += 1
             
             if uploaded_count > 0:
                 st.toast(f"{uploaded_count}枚の画像をクラウドに保存しました")
@@ -1545,29 +1516,13 @@ def handle_tone_upload(product_id, data_store):
             product = data_store.get_product(product_id) or {} # Re-fetch product if not already fetched for Supabase
             remote_urls = product.get('tone_manner_image_urls') or []
             uploaded_count = 0
-            for uploaded_file in tone_images:
-                try:
-                    uploaded_file.seek(0)
-                    file_bytes = uploaded_file.read()
-                    
-                    # ファイル名をサニタイズ（UUID + 拡張子）
-                    ext = uploaded_file.name.split('.')[-1].lower() if '.' in uploaded_file.name else 'jpg'
-                    safe_name = f"{uuid.uuid4().hex[:12]}.{ext}"
-                    remote_path = f"{product_id}/tone_manner/{safe_name}"
-                    
-                    url = data_store.upload_image(file_bytes, remote_path, bucket_name="lp-generator-images")
-                    
-                    if url:
-                        # 文字列であることを保証
-                        if not isinstance(url, str) and hasattr(url, 'public_url'):
-                            url = url.public_url
-
-                        # 重複チェック
-                        if url and url not in remote_urls:
-                            remote_urls.append(url)
-                            uploaded_count += 1
-                except Exception as e:
-                    st.error(f"Supabaseへのアップロードに失敗しました ({uploaded_file.name}): {e}")
+            for file_name, url in upload_files_to_storage(data_store, tone_images, f"{product_id}/tone_manner"):
+                if not url:
+                    st.error(f"Supabaseへのアップロードに失敗しました ({file_name})")
+                # 重複チェック
+                elif url not in remote_urls:
+                    remote_urls.append(url)
+                    uploaded_count += 1
             
             if uploaded_count > 0:
                 st.toast(f"{uploaded_count}枚の画像をクラウドに保存しました")
@@ -1674,28 +1629,11 @@ def render_reference_images_upload(data_store, product_id):
                                 preset_folder = f"presets/{preset_id_short}"
                                 
                                 # 現在の画像をプリセットフォルダにコピー
-                                copied_urls = []
-                                for img_url in valid_lp_images:
-                                    try:
-                                        # 画像をダウンロード
-                                        response = requests.get(img_url)
-                                        if response.status_code == 200:
-                                            # 新しいファイル名を生成
-                                            extension = img_url.split('.')[-1].split('?')[0]
-                                            if len(extension) > 5: extension = 'jpg' # 異常な拡張子対策
-                                            new_filename = f"{uuid.uuid4().hex[:12]}.{extension}"
-                                            new_path = f"{preset_folder}/{new_filename}"
-                                            
-                                            # プリセットフォルダにアップロード
-                                            new_url = data_store.upload_image(
-                                                response.content, 
-                                                new_path, 
-                                                bucket_name="lp-generator-images"
-                                            )
-                                            if new_url:
-                                                copied_urls.append(new_url)
-                                    except Exception as e:
-                                        st.warning(f"画像のコピーに失敗: {e}")
+                                jobs = [(img_url, preset_folder) for img_url in valid_lp_images]
+                                copied = data_store.copy_storage_images(jobs)
+                                copied_urls = [url for url in copied if url]
+                                if len(copied_urls) < len(jobs):
+                                    st.warning(f"画像のコピーに失敗: {len(jobs) - len(copied_urls)}枚")
                                 
                                 if copied_urls:
                                     # コピーしたURLでプリセットを保存
@@ -1882,28 +1820,11 @@ def render_reference_images_upload(data_store, product_id):
                                 preset_folder = f"presets/{preset_id_short}"
                                 
                                 # 現在の画像をプリセットフォルダにコピー
-                                copied_urls = []
-                                for img_url in valid_tm_images:
-                                    try:
-                                        # 画像をダウンロード
-                                        response = requests.get(img_url)
-                                        if response.status_code == 200:
-                                            # 新しいファイル名を生成
-                                            extension = img_url.split('.')[-1].split('?')[0]
-                                            if len(extension) > 5: extension = 'jpg' # 異常な拡張子対策
-                                            new_filename = f"{uuid.uuid4().hex[:12]}.{extension}"
-                                            new_path = f"{preset_folder}/{new_filename}"
-                                            
-                                            # プリセットフォルダにアップロード
-                                            new_url = data_store.upload_image(
-                                                response.content, 
-                                                new_path, 
-                                                bucket_name="lp-generator-images"
-                                            )
-                                            if new_url:
-                                                copied_urls.append(new_url)
-                                    except Exception as e:
-                                        st.warning(f"画像のコピーに失敗: {e}")
+                                jobs = [(img_url, preset_folder) for img_url in valid_tm_images]
+                                copied = data_store.copy_storage_images(jobs)
+                                copied_urls = [url for url in copied if url]
+                                if len(copied_urls) < len(jobs):
+                                    st.warning(f"画像のコピーに失敗: {len(jobs) - len(copied_urls)}枚")
                                 
                                 if copied_urls:
                                     # コピーしたURLでプリセットを保存
@@ -2103,7 +2024,7 @@ def analyze_tone_manner_images(image_paths, product_id, data_store):
             image_path = image_paths[0]
             prompt = prompt_manager.get_prompt("tone_manner_analysis", {})
             
-            result = ai_provider.analyze_image(image_path, prompt)
+            result = ai_provider.analyze_image(image_path, prompt, task="tone_manner_analysis")
             
             # JSON抽出
             try:
@@ -2166,7 +2087,7 @@ def reanalyze_lp_image(product, data_store, product_id, index):
             prompt = prompt_manager.get_prompt("lp_image_analysis", {})
             
             # 【修正】URLとローカルパスの両方に対応した analyze_image を使用
-            result_str = ai_provider.analyze_image(img_path, prompt)
+            result_str = ai_provider.analyze_image(img_path, prompt, task="lp_image_analysis")
             
             # JSON抽出
             try:
@@ -2214,14 +2135,59 @@ def reanalyze_lp_image(product, data_store, product_id, index):
         except Exception as e:
             st.error(f"再分析エラー: {e}")
 
+def _download_reference_image(image_path):
+    """参考LP画像を取得（戻り値: (URLならバイト列・ローカルならパス, エラー)）"""
+    if not image_path.startswith("http"):
+        if not os.path.exists(image_path):
+            return None, "not_found"
+        return image_path, None
+    try:
+        content = get_image_cache().fetch_bytes(image_path, timeout=30)
+        if content is None:
+            return None, "画像ダウンロード失敗"
+        return content, None
+    except Exception as dl_err:
+        return None, f"画像ダウンロードエラー: {dl_err}"
+
+
+def _analyze_reference_image(ai_provider, prompt, download_futures, index):
+    """ダウンロード完了を待って1枚分析し、JSONを解析する（ワーカースレッドで実行）"""
+    import json
+    
+    # 参照を外して、分析後に画像データが解放されるようにする
+    download_future, download_futures[index] = download_futures[index], None
+    source, error = download_future.result()
+    del download_future
+    if error:
+        return {"error": error}
+    # ダウンロードした画像は一時ファイルに書き出さずメモリから直接渡す
+    if isinstance(source, bytes):
+        result = ai_provider.analyze_image_bytes(source, prompt, task="lp_image_analysis")
+    else:
+        result = ai_provider.analyze_image(source, prompt, task="lp_image_analysis")
+    
+    if not result:
+        return {"warning": "画像分析に失敗しました（結果なし）"}
+    
+    # JSON抽出
+    try:
+        if "```json" in result:
+            result = result.split("```json")[1].split("```")[0]
+        elif "```" in result:
+            result = result.split("```")[1].split("```")[0]
+        return {"parsed": json.loads(result.strip())}
+    except Exception as e:
+        return {"parsed": {"raw": result, "parse_error": True}, "warning": f"JSON解析エラー - {e}"}
+
+
 def analyze_reference_images(image_analyzer, image_paths, product_id, data_store):
-    """参考LP画像を1枚ずつ詳細分析"""
+    """参考LP画像を詳細分析（ダウンロードを先読みしつつ並列で分析し、最後に一括保存）"""
+    from concurrent.futures import ThreadPoolExecutor
     from modules.trace_viewer import save_with_trace
     from modules.prompt_manager import PromptManager
     from modules.settings_manager import SettingsManager
     from modules.ai_provider import AIProvider
-    import json
-    import time
+    from modules.concurrency import run_parallel, DEFAULT_MAX_WORKERS
     
     with st.spinner('参考LP画像を分析中...'):
         try:
@@ -2229,139 +2195,67 @@ def analyze_reference_images(image_analyzer, image_paths, product_id, data_store
             settings = settings_manager.get_settings()
             ai_provider = AIProvider(settings)
             prompt_manager = PromptManager()
+            prompt = prompt_manager.get_prompt("lp_image_analysis", {})
+            max_workers = int(settings.get("reference_analysis_max_workers", DEFAULT_MAX_WORKERS))
             
-            # 【修正】分析開始時に既にある分析結果をクリアする
-            product = data_store.get_product(product_id)
-            if product:
-                product['lp_analyses'] = []
-                product['lp_analyses_dict'] = {}
-                data_store.update_product(product_id, product)
-            
-            # 既存の分析結果を空の状態から開始
-            existing_analyses = {}
-            
-            analyses = []
+            file_names = [
+                image_path.split('/')[-1].split('?')[0] if image_path.startswith('http') else Path(image_path).name
+                for image_path in image_paths
+            ]
+            total = len(image_paths)
             status_text = st.empty()
             progress_bar = st.progress(0)
+            status_text.text(f"分析中: 0/{total}枚")
+            
+            def on_progress(done, total, index, outcome):
+                status_text.text(f"分析中: {done}/{total}枚完了... ({file_names[index]})")
+                progress_bar.progress(done / total)
+            
+            # ダウンロードは分析より多めの並列度で先読みし、分析の待ち時間と重ねる
+            with ThreadPoolExecutor(max_workers=max_workers * 2) as download_pool:
+                download_futures = [download_pool.submit(_download_reference_image, path) for path in image_paths]
+                outcomes = run_parallel(
+                    lambda i: _analyze_reference_image(ai_provider, prompt, download_futures, i),
+                    range(total),
+                    max_workers=max_workers,
+                    on_progress=on_progress
+                )
             
-            for i, image_path in enumerate(image_paths):
-                file_name = image_path.split('/')[-1].split('?')[0] if image_path.startswith('http') else Path(image_path).name
-                
-                status_text.text(f"分析中: {i+1}/{len(image_paths)}枚目... ({file_name})")
-                progress_bar.progress((i) / len(image_paths))
-                
-                # パスによる存在確認（URLでない、かつローカルファイルが存在しない場合）
-                if not image_path.startswith("http") and not os.path.exists(image_path):
-                    st.error(f"画像ファイルが見つかりません: {Path(image_path).name}")
+            # 結果を入力順に集約（警告・エラーはここでまとめて表示）
+            lp_analyses_dict = {}
+            for i, (image_path, file_name, outcome) in enumerate(zip(image_paths, file_names, outcomes)):
+                if outcome is None:
+                    st.error(f"❌ 画像分析失敗（{file_name}）")
+                    continue
+                if outcome.get("error") == "not_found":
+                    st.error(f"画像ファイルが見つかりません: {file_name}")
                     st.warning("クラウド環境では過去のアップロードファイルが保持されない場合があります。お手数ですが、再度画像をアップロードし直してください。")
                     continue
+                if outcome.get("error"):
+                    st.warning(f"{outcome['error']}: {file_name}")
+                    continue
+                if outcome.get("warning"):
+                    st.warning(f"{outcome['warning']}: {file_name}")
+                if "parsed" not in outcome:
+                    continue
                 
-                try:
-                    # プロンプト取得
-                    prompt = prompt_manager.get_prompt("lp_image_analysis", {})
-                    
-                    target_path = image_path
-                    is_temp = False
-                    
-                    # URLの場合は一時ファイルにダウンロード
-                    if image_path.startswith("http"):
-                        try:
-                            import requests
-                            import tempfile
-                            
-                            response = requests.get(image_path, timeout=30)
-                            if response.status_code == 200:
-                                suffix = "." + image_path.split("/")[-1].split("?")[0].split(".")[-1]
-                                if len(suffix) > 5 or "/" in suffix: # 拡張子取得失敗時のフォールバック
-                                    suffix = ".jpg"
-                                    
-                                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                                    tmp.write(response.content)
-                                    target_path = tmp.name
-                                    is_temp = True
-                            else:
-                                st.warning(f"画像ダウンロード失敗（Status {response.status_code}）: {file_name}")
-                                continue
-                        except Exception as dl_err:
-                            st.warning(f"画像ダウンロードエラー: {dl_err}")
-                            continue
-
-                    # 画像分析（Vision API）
-                    # 画像分析（Vision API）
-                    # レート制限対策：2枚目以降は2秒待機
-                    if i > 0:
-                        status_text.text(f"API制限対策: 2秒待機中... (次: {i+1}/{len(image_paths)}枚目)")
-                        time.sleep(2)
-
-                    result = ai_provider.analyze_image(target_path, prompt)
-                    
-                    # 一時ファイルの削除
-                    if is_temp and os.path.exists(target_path):
-                        try:
-                            os.unlink(target_path)
-                        except:
-                            pass
-
-                    # 結果チェック
-                    if not result:
-                        st.warning(f"画像分析に失敗しました（結果なし）: {file_name}")
-                        continue
-                    
-                    # JSON抽出
-                    try:
-                        if "```json" in result:
-                            result = result.split("```json")[1].split("```")[0]
-                        elif "```" in result:
-                            result = result.split("```")[1].split("```")[0]
-                        parsed = json.loads(result.strip())
-                    except Exception as e:
-                        st.warning(f"JSON解析エラー: {file_name} - {e}")
-                        parsed = {"raw": result, "parse_error": True}
-                    
-                    # トレース付きで保存
-                    traced = save_with_trace(
-                        result=parsed,
-                        prompt_id="lp_image_analysis",
-                        input_refs={"画像": Path(image_path).name, "順番": i+1},
-                        model=settings.get("llm_model", "unknown")
-                    )
-                    
-                    # メモリ上のリストに追加
-                    analyses.append(traced)
-                    
-                    # 【重要】1枚ごとに即時保存
-                    product = data_store.get_product(product_id)
-                    if product is None:
-                        product = {}
-
-                    current_dict = product.get('lp_analyses_dict') or {}
-                    if current_dict is None:
-                        current_dict = {}
-
-                    current_dict[file_name] = traced
-                    
-                    product['lp_analyses_dict'] = current_dict
-                    product['lp_analyses'] = list(current_dict.values())
-                    
-                    if data_store.update_product(product_id, product):
-                         existing_analyses[file_name] = traced # ループ内キャッシュも更新
-                    else:
-                         # 保存失敗時もエラーを出さず続行（ログ出力等は検討）
-                         pass
-                         
-                except Exception as e:
-                    st.error(f"❌ 画像分析失敗（{Path(image_path).name}）: {e}")
-                    st.info("💡 連続エラーの場合はAPIレート制限の可能性があります。少し時間を置いて再実行してください。")
-                    # エラー時も一時ファイルがあれば削除
-                    if 'is_temp' in locals() and is_temp and 'target_path' in locals() and os.path.exists(target_path):
-                        try:
-                            os.unlink(target_path)
-                        except:
-                            pass
-
+                lp_analyses_dict[file_name] = save_with_trace(
+                    result=outcome["parsed"],
+                    prompt_id="lp_image_analysis",
+                    input_refs={"画像": Path(image_path).name, "順番": i+1},
+                    model=settings.get("llm_model", "unknown")
+                )
+            
+            # 全件まとめて1回で保存（既存の分析結果は置き換える）
+            product = data_store.get_product(product_id) or {}
+            product['lp_analyses_dict'] = lp_analyses_dict
+            product['lp_analyses'] = list(lp_analyses_dict.values())
+            if not data_store.update_product(product_id, product):
+                st.error("分析結果の保存に失敗しました")
+            
             # 最終的な完了処理
             st.session_state.processing_reference_analysis = False
-            st.success(f"全{len(image_paths)}枚の処理が完了しました")
+            st.success(f"全{total}枚の処理が完了しました（成功 {len(lp_analyses_dict)}枚）")
             st.rerun()
                 
         except Exception as e:
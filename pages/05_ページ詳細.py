@@ -24,9 +24,10 @@ from modules.settings_manager import SettingsManager
 from modules.prompt_manager import PromptManager
 from modules.element_types import ElementTypes
 
-def generate_page_content(product_id, product, selected_page):
+def generate_page_content(product_id, product, selected_page, stream=False):
     """
     指定されたページのコンテンツをAIで生成し、DBを更新する
+    stream=Trueの場合は生成中のテキストを画面に逐次表示する
     """
     from modules.settings_manager import SettingsManager
     from modules.ai_provider import AIProvider
@@ -145,7 +146,15 @@ def generate_page_content(product_id, product, selected_page):
         "product_info": product_info
     })
     
-    result = ai_provider.ask(prompt, "page_content")
+    if stream:
+        response_stream = ai_provider.ask_stream(prompt, "page_content")
+        result = st.write_stream(response_stream)
+        if not response_stream.completed:
+            # 途中で失敗した応答（エラー文を含む）は保存しない
+            st.error("コンテンツの生成が途中で失敗したため、保存していません。再度お試しください。")
+            return False
+    else:
+        result = ai_provider.ask(prompt, "page_content")
     
     # JSON形式の場合はパース
     parsed_content = result
@@ -322,9 +331,9 @@ with btn_c2:
 if gen_content:
     with st.spinner("コンテンツを生成中..."):
         try:
-            generate_page_content(product_id, product, selected_page)
-            st.success("生成完了！")
-            st.rerun()
+            if generate_page_content(product_id, product, selected_page, stream=True):
+                st.success("生成完了！")
+                st.rerun()
         except Exception as e:
             st.error(f"生成エラー: {e}")
 
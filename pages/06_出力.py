@@ -22,6 +22,8 @@ from modules.output_generator import OutputGenerator
 from modules.ai_provider import AIProvider
 from modules.prompt_manager import PromptManager
 from modules.settings_manager import SettingsManager
+from modules.concurrency import DEFAULT_IMAGE_MAX_WORKERS, gather_limited, run_sync
+from modules.budget import BudgetRun
 from pathlib import Path
 
 def render_lp_image(image_path, label=None, column_ratio=[1, 1]):
@@ -156,7 +158,7 @@ def apply_fix(parsed, issue, new_value, page_contents, page_id, data_store, prod
         # 保存
         page_contents[page_id]['result']['parsed'] = parsed
         product_data['page_contents'] = page_contents
-        data_store.update_product(product_id, product_data)
+        data_store.patch_product(product_id, {"page_contents": page_contents})
         st.success("修正を適用しました")
         st.rerun()
 
@@ -194,8 +196,9 @@ def render_output_page():
     with tab3:
         render_download_section(output_generator, product_data, product_id)
 
-def generate_page_image_logic(ai_provider, prompt_manager, page, parsed_content, tone_manner, ref_image_path, product_data, data_store, product_id, variation_of=None, custom_prompt=None):
-    """画像生成のコアロジック（個別・一括共通）"""
+def generate_page_image_logic(ai_provider, prompt_manager, page, parsed_content, tone_manner, ref_image_path, product_data, data_store, product_id, variation_of=None, custom_prompt=None, generated_result=None):
+    """画像生成のコアロジック（個別・一括共通）
+    generated_result: 生成済みのgenerate_image()結果（一括生成で並列生成した場合に渡す）"""
     import uuid
     from datetime import datetime
     
@@ -206,7 +209,10 @@ def generate_page_image_logic(ai_provider, prompt_manager, page, parsed_content,
         prompt = build_image_prompt(prompt_manager, page, parsed_content, tone_manner)
     
     # 画像生成
-    result = ai_provider.generate_image(prompt, reference_image_path=ref_image_path)
+    if generated_result is not None:
+        result = generated_result
+    else:
+        result = ai_provider.generate_image(prompt, reference_image_path=ref_image_path)
     
     if result and 'path' in result:
         page_id = page.get('id', f"page_{page.get('order', 1)}")
@@ -292,14 +298,21 @@ def render_lp_generation_section(output_generator, ai_provider, prompt_manager,
 
     # 一括生成ボタン
     st.markdown("### 一括操作")
+    # 予算の上限で止まった一括処理の結果（st.rerun()後に表示する）
+    budget_notice = st.session_state.pop("output_budget_notice", None)
+    if budget_notice:
+        st.warning(budget_notice)
+    budget_summary = st.session_state.pop("output_budget_summary", None)
+    if budget_summary:
+        st.info(budget_summary)
     if st.button("全ページを一括生成", type="primary", use_container_width=True):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
+        # 1. 各ページのプロンプトと参照画像を準備
+        jobs = []
         for i, page in enumerate(pages):
             page_id = page.get('id', 'unknown')
-            page_title = page.get('title', '無題')
-            status_text.text(f"P{i+1}: {page_title} を生成中...")
             
             # 必要なデータを取得
             content_data = page_contents.get(page_id, {})
@@ -318,16 +331,58 @@ def render_lp_generation_section(output_generator, ai_provider, prompt_manager,
                 ref_images = product_data.get('reference_lp_images', [])
                 if ref_images and ref_page <= len(ref_images):
                     ref_path = ref_images[ref_page - 1]
-
+            
+            jobs.append({
+                'page': page,
+                'parsed': parsed,
+                'ref_path': ref_path,
+                'prompt': build_image_prompt(prompt_manager, page, parsed, tone_manner)
+            })
+        
+        # 2. 画像生成APIを並列に呼び出す
+        def _on_progress(done, total, index, result):
+            progress_bar.progress(done / total)
+            status_text.text(f"P{index+1}: {jobs[index]['page'].get('title', '無題')} の生成完了（{done}/{total}）")
+        
+        # 実行前に概算コストを見積もり、予算の上限に達したら以降のページは生成しない
+        budget = BudgetRun(settings, product_id, "全ページ画像生成")
+        estimates = [ai_provider.estimate_image_cost([job['prompt']], 1 if job['ref_path'] else 0) for job in jobs]
+        st.info(f"概算コスト: ¥{sum(estimates):,.2f}（{len(jobs)}枚）")
+        over_limit = budget.check_estimate(sum(estimates))
+        if over_limit:
+            st.warning(f"見積もりが{over_limit}を超えるため、上限に達した時点で残りのページの生成を止めます")
+        
+        status_text.text(f"{len(jobs)}ページの画像を生成中...")
+        ai_provider.budget_run = budget
+        try:
+            results = run_sync(gather_limited(
+                [budget.call_async(estimate, ai_provider.generate_image_async, job['prompt'], reference_image_path=job['ref_path'])
+                 for job, estimate in zip(jobs, estimates)],
+                max_concurrency=settings.get("image_generation_max_workers", DEFAULT_IMAGE_MAX_WORKERS),
+                on_progress=_on_progress
+            ))
+        finally:
+            ai_provider.budget_run = None
+        # 概算と実績はst.rerun()後に表示する
+        budget_result = f"{budget.message()}（概算 ¥{sum(estimates):,.2f}）"
+        st.session_state["output_budget_notice" if budget.stopped_reason else "output_budget_summary"] = budget_result
+        
+        # 3. アップロードと保存はproduct_dataを更新するため順番に行う
+        for i, (job, result) in enumerate(zip(jobs, results)):
+            if result is None and budget.stopped_reason:
+                continue
+            if not result or 'path' not in result:
+                error = result.get('error') if isinstance(result, dict) else None
+                st.warning(f"P{i+1} の生成でエラー: {error or '画像が生成されませんでした'}")
+                continue
             try:
                 generate_page_image_logic(
-                    ai_provider, prompt_manager, page, parsed, tone_manner, 
-                    ref_path, product_data, data_store, product_id
+                    ai_provider, prompt_manager, job['page'], job['parsed'], tone_manner, 
+                    job['ref_path'], product_data, data_store, product_id,
+                    custom_prompt=job['prompt'], generated_result=result
                 )
             except Exception as e:
                 st.warning(f"P{i+1} の生成でエラー: {e}")
-            
-            progress_bar.progress((i + 1) / len(pages))
         
         status_text.text("")
         st.success("全ページの画像生成が完了しました！")
@@ -374,46 +429,62 @@ def render_lp_generation_section(output_generator, ai_provider, prompt_manager,
             st.warning("画像が生成されているページがありません。先に画像を生成してください。")
         else:
             wf_prompt = prompt_manager.get_prompt("wireframe_generation")
-            for i, item in enumerate(pages_to_process):
-                p = item['page']
-                p_id = p.get('id', 'unknown')
-                p_title = p.get('title', '無題')
-                v_id = item['v_id']
-                v_data = item['v_data']
-                
-                status_text.text(f"P{item['index']+1}: {p_title} のワイヤーフレームを生成中...")
-                
-                # 画像ソースを取得（URL優先、なければローカルパス）
-                source = v_data.get('url') or v_data.get('path')
-                
-                if source:
-                    try:
-                        result = ai_provider.generate_wireframe(source, wf_prompt)
-                        if result:
-                            # Supabaseにアップロード
-                            with open(result['local_path'], "rb") as f:
-                                wf_bytes = f.read()
-                            
-                            storage_path = f"{product_id}/wireframes/{result['filename']}"
-                            wf_url = data_store.upload_image(wf_bytes, storage_path)
-                            
-                            if wf_url:
-                                # セッションステートに保存
-                                st.session_state[f'wireframe_{p_id}_{v_id}'] = wf_url
+            budget = BudgetRun(settings, product_id, "ワイヤーフレーム一括生成")
+            wf_estimate = ai_provider.estimate_image_cost([wf_prompt], 1)
+            # 画像ソースを取得（URL優先、なければローカルパス）
+            sources = [item['v_data'].get('url') or item['v_data'].get('path') for item in pages_to_process]
+            wf_count = sum(1 for source in sources if source)
+            wf_total_estimate = wf_estimate * wf_count
+            st.info(f"概算コスト: ¥{wf_total_estimate:,.2f}（{wf_count}枚）")
+            stopped_at = None
+            ai_provider.budget_run = budget
+            try:
+                for i, (item, source) in enumerate(zip(pages_to_process, sources)):
+                    p = item['page']
+                    p_id = p.get('id', 'unknown')
+                    p_title = p.get('title', '無題')
+                    v_id = item['v_id']
+                    
+                    status_text.text(f"P{item['index']+1}: {p_title} のワイヤーフレームを生成中...")
+                    
+                    if source:
+                        try:
+                            result = budget.call(wf_estimate, ai_provider.generate_wireframe, source, wf_prompt)
+                            if result is None and budget.stopped_reason:
+                                stopped_at = i
+                                break
+                            if result:
+                                # Supabaseにアップロード
+                                with open(result['local_path'], "rb") as f:
+                                    wf_bytes = f.read()
                                 
-                                # lp_wireframesテーブルに保存（永続化）
-                                data_store.save_wireframe(
-                                    product_id=product_id,
-                                    page_id=p_id,
-                                    version_id=v_id,
-                                    wireframe_url=wf_url,
-                                    source_image_url=source
-                                )
-                    except Exception as e:
-                        st.warning(f"P{item['index']+1} のワイヤーフレーム生成でエラー: {e}")
-                
-                progress_bar.progress((i + 1) / len(pages_to_process))
-            
+                                storage_path = f"{product_id}/wireframes/{result['filename']}"
+                                wf_url = data_store.upload_image(wf_bytes, storage_path)
+                                
+                                if wf_url:
+                                    # セッションステートに保存
+                                    st.session_state[f'wireframe_{p_id}_{v_id}'] = wf_url
+                                    
+                                    # lp_wireframesテーブルに保存（永続化）
+                                    data_store.save_wireframe(
+                                        product_id=product_id,
+                                        page_id=p_id,
+                                        version_id=v_id,
+                                        wireframe_url=wf_url,
+                                        source_image_url=source
+                                    )
+                        except Exception as e:
+                            st.warning(f"P{item['index']+1} のワイヤーフレーム生成でエラー: {e}")
+                    
+                    progress_bar.progress((i + 1) / len(pages_to_process))
+            finally:
+                ai_provider.budget_run = None
+            if stopped_at is not None:
+                # 上限で止めたページ（reserve時に計上済み）以降で、実行しなかったページ数を通知する
+                budget.skipped += sum(1 for source in sources[stopped_at + 1:] if source)
+            # 概算と実績はst.rerun()後に表示する
+            budget_result = f"{budget.message()}（概算 ¥{wf_total_estimate:,.2f}）"
+            st.session_state["output_budget_notice" if budget.stopped_reason else "output_budget_summary"] = budget_result
             status_text.text("")
             st.success("全ページのワイヤーフレーム生成が完了しました！")
             st.rerun()
@@ -964,9 +1035,15 @@ def render_design_instruction_section(output_generator, product_data, data_store
     if instr_clicked:
         with st.spinner("AIが指示書を生成中..."):
             try:
-                instruction = output_generator.generate_design_instruction(product_data)
+                # 生成中のテキストを逐次表示する
+                with st.container(height=400):
+                    instruction_stream = output_generator.generate_design_instruction_stream(product_data)
+                    instruction = st.write_stream(instruction_stream)
                 
-                if instruction:
+                if not instruction_stream.completed:
+                    # 途中で失敗した応答（エラー文を含む）は保存しない
+                    st.error("指示書の生成が途中で失敗したため、保存していません。再度お試しください。")
+                elif instruction:
                     # DBに保存
                     st.session_state[instruction_key] = instruction
                     product_data['designer_instruction'] = instruction
@@ -18,6 +18,8 @@ from modules.data_store import DataStore
 from modules.ai_provider import AIProvider
 from modules.settings_manager import SettingsManager
 from modules.prompt_manager import PromptManager
+from modules.concurrency import run_parallel, DEFAULT_MAX_WORKERS
+from modules.budget import BudgetRun
 
 # 製品選択チェック
 require_product()
@@ -102,7 +104,10 @@ def generate_personas(ai_provider, prompt_manager, product, exposure_type):
         return []
 
 def evaluate_by_persona(ai_provider, prompt_manager, product, exposure_type, persona, lp_content):
-    """各ペルソナ視点でLPを評価"""
+    """各ペルソナ視点でLPを評価
+
+    並列実行のワーカースレッドから呼ばれるためst.*は呼ばず、解析に失敗した場合は{"error", "raw"}を返す
+    """
     
     # 競合情報を取得
     comp_v2 = product.get('competitor_analysis_v2', {})
@@ -159,15 +164,10 @@ def evaluate_by_persona(ai_provider, prompt_manager, product, exposure_type, per
             
         return json.loads(json_str.strip())
     except Exception as e:
-        st.error(f"評価の解析に失敗しました: {e}")
-        st.code(response)
-        return None
+        return {"error": f"評価の解析に失敗しました: {e}", "raw": response}
 
-def evaluate_by_employee(ai_provider, prompt_manager, data_store, product, exposure_type, employee, lp_content):
-    """特定のメンバーAIとしてLPを評価"""
-    
-    # 過去のフィードバックを取得
-    past_feedback_list = data_store.get_employee_feedback(employee['id'], limit=20)
+def build_employee_prompt(prompt_manager, exposure_type, employee, lp_content, past_feedback_list):
+    """メンバーAI評価のプロンプトを組み立てる（見積もりと評価で同じプロンプトを使う）"""
     
     # フィードバックを文字列に整形
     if past_feedback_list:
@@ -195,7 +195,16 @@ def evaluate_by_employee(ai_provider, prompt_manager, data_store, product, expos
         "lp_content": lp_content
     }
     
-    prompt = prompt_manager.get_prompt("employee_evaluation", variables)
+    return prompt_manager.get_prompt("employee_evaluation", variables)
+
+def evaluate_by_employee(ai_provider, prompt_manager, data_store, product, exposure_type, employee, lp_content, past_feedback_list=None, prompt=None):
+    """特定のメンバーAIとしてLPを評価（past_feedback_listを渡せばフィードバック取得を、promptを渡せば組み立てを省略）"""
+    
+    if prompt is None:
+        # 過去のフィードバックを取得
+        if past_feedback_list is None:
+            past_feedback_list = data_store.get_employee_feedback(employee['id'], limit=20)
+        prompt = build_employee_prompt(prompt_manager, exposure_type, employee, lp_content, past_feedback_list)
     
     response = ai_provider.ask(prompt, "employee_evaluation")
     
@@ -418,13 +427,26 @@ def run_diagnosis(product, exposure_type, diagnosis_target):
         st.error("ペルソナの生成に失敗しました")
         return
 
-    evaluations = []
+    # 各ペルソナの評価は互いに独立しているため並列に実行する
     progress_bar = st.progress(0)
-    for i, persona in enumerate(personas):
-        with st.spinner(f"ペルソナ「{persona['name']}」視点で評価中..."):
-            eval_result = evaluate_by_persona(ai_provider, prompt_manager, product, exposure_type, persona, lp_content)
-            evaluations.append(eval_result)
-        progress_bar.progress((i + 1) / len(personas))
+
+    def _on_progress(done, total, index, result):
+        progress_bar.progress(done / total, text=f"ペルソナ評価 {done}/{total} 完了（{personas[index]['name']}）")
+
+    with st.spinner(f"{len(personas)}人のペルソナ視点で評価中..."):
+        evaluations = run_parallel(
+            lambda persona: evaluate_by_persona(ai_provider, prompt_manager, product, exposure_type, persona, lp_content),
+            personas,
+            max_workers=settings.get("diagnosis_max_workers", DEFAULT_MAX_WORKERS),
+            on_progress=_on_progress
+        )
+    
+    # 解析エラーはメインスレッドで表示し、評価結果からは除く
+    for i, evaluation in enumerate(evaluations):
+        if isinstance(evaluation, dict) and "error" in evaluation and "raw" in evaluation:
+            st.error(f"{personas[i]['name']}: {evaluation['error']}")
+            st.code(evaluation["raw"])
+            evaluations[i] = None
     
     with st.spinner("総合分析中..."):
         summary = generate_summary(ai_provider, prompt_manager, evaluations, exposure_type)
@@ -568,6 +590,11 @@ def render_employee_diagnosis_tab(product, exposure_type, diagnosis_target):
         if latest_emp_diag:
             st.session_state.employee_diagnosis_results = latest_emp_diag.get('results', [])
 
+    # 予算の上限で止まった診断の結果（st.rerun()後に表示する）
+    budget_notice = st.session_state.pop("employee_budget_notice", None)
+    if budget_notice:
+        st.warning(budget_notice)
+
     # 保存された結果があれば表示
     if 'employee_diagnosis_results' in st.session_state:
         # Build LP content text from product data
@@ -592,8 +619,8 @@ def render_employee_diagnosis_tab(product, exposure_type, diagnosis_target):
         results = st.session_state.employee_diagnosis_results
         display_employee_results(results, product['id'], employees, exposure_type, lp_content_text)
 
-def run_employee_diagnosis(product, exposure_type, diagnosis_target, employee_ids):
-    """メンバーAI診断を実行"""
+def run_employee_diagnosis(product, exposure_type, diagnosis_target, employee_ids, parallel=None):
+    """メンバーAI診断を実行（parallel=Trueでメンバーごとの評価を並列実行）"""
     ds = DataStore()
     settings = SettingsManager().get_settings()
     ai_provider = AIProvider(settings)
@@ -611,18 +638,68 @@ def run_employee_diagnosis(product, exposure_type, diagnosis_target, employee_id
             pass
     lp_content = get_lp_content(product, target_index)
     
+    if parallel is None:
+        parallel = settings.get("employee_diagnosis_parallel", True)
+    
+    # 全メンバーのフィードバックを1クエリで先読みし、実際に送るプロンプトを組み立てる
+    feedback_map = ds.get_employee_feedback_batch([e['id'] for e in selected_employees], limit=20)
+    prompts = [
+        build_employee_prompt(prompt_manager, exposure_type, emp, lp_content, feedback_map.get(emp['id'], []))
+        for emp in selected_employees
+    ]
+    
+    # 実行前に概算コストを見積もり、予算の上限に達したら以降のメンバーは評価しない
+    budget = BudgetRun(settings, product.get('id'), "メンバーAI診断")
+    estimates = [ai_provider.estimate_text_cost([prompt]) for prompt in prompts]
+    st.info(f"概算コスト: ¥{sum(estimates):,.2f}（{len(selected_employees)}人）")
+    over_limit = budget.check_estimate(sum(estimates))
+    if over_limit:
+        st.warning(f"見積もりが{over_limit}を超えるため、上限に達した時点で残りのメンバーの評価を止めます")
+    ai_provider.budget_run = budget
+    
     results = []
     progress_bar = st.progress(0)
-    for i, emp in enumerate(selected_employees):
-        with st.spinner(f"{emp['name']} が評価中..."):
-            eval_result = evaluate_by_employee(ai_provider, prompt_manager, ds, product, exposure_type, emp, lp_content)
+    if parallel:
+        # 評価を並列実行
+        def _on_progress(done, total, index, result):
+            progress_bar.progress(done / total, text=f"{selected_employees[index]['name']} の評価完了（{done}/{total}）")
+        
+        with st.spinner(f"{len(selected_employees)}人のメンバーが評価中..."):
+            eval_results = run_parallel(
+                lambda i: budget.call(
+                    estimates[i], evaluate_by_employee,
+                    ai_provider, prompt_manager, ds, product, exposure_type, selected_employees[i], lp_content,
+                    prompt=prompts[i]
+                ),
+                range(len(selected_employees)),
+                max_workers=settings.get("diagnosis_max_workers", DEFAULT_MAX_WORKERS),
+                on_progress=_on_progress
+            )
+        # run_parallelは入力順で返すため、保存順は選択順のまま
+        for emp, eval_result in zip(selected_employees, eval_results):
             if eval_result:
                 results.append({
                     "employee": emp,
                     "evaluation": eval_result
                 })
-        progress_bar.progress((i + 1) / len(selected_employees))
+    else:
+        for i, emp in enumerate(selected_employees):
+            with st.spinner(f"{emp['name']} が評価中..."):
+                eval_result = budget.call(estimates[i], evaluate_by_employee, ai_provider, prompt_manager, ds, product, exposure_type, emp, lp_content,
+                                          prompt=prompts[i])
+                if eval_result is None and budget.stopped_reason:
+                    budget.skipped = len(selected_employees) - i
+                    break
+                if eval_result:
+                    results.append({
+                        "employee": emp,
+                        "evaluation": eval_result
+                    })
+            progress_bar.progress((i + 1) / len(selected_employees))
     
+    ai_provider.budget_run = None
+    if budget.stopped_reason:
+        st.session_state["employee_budget_notice"] = budget.message()
     st.session_state.employee_diagnosis_results = results
     
     # Supabaseに保存
@@ -15,6 +15,9 @@ render_ai_sidebar()
 import json
 import os
 from modules.settings_manager import SettingsManager
+from modules.response_cache import get_response_cache, DEFAULT_TTL_HOURS, DEFAULT_MAX_ENTRIES, DEFAULT_BYPASS_TASKS
+from modules.rate_limiter import DEFAULT_MAX_RETRIES
+from modules.concurrency import DEFAULT_IMAGE_MAX_WORKERS
 
 MODELS_FILE = "data/models.json"
 
@@ -37,12 +40,104 @@ def load_models():
     return {"llm": {}, "image": {}}
 
 
+def render_usage_breakdown(tracker):
+    """期間を指定した使用量の内訳（製品別・タスク別・モデル別・プロバイダー別）"""
+    from datetime import date
+    from modules.data_store import DataStore
+
+    st.subheader("📈 期間別の使用状況")
+
+    today = date.today()
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        period = st.date_input("期間", value=(today.replace(day=1), today), max_value=today, key="usage_period")
+    with col2:
+        group_labels = {"product": "製品別", "task": "タスク別", "model": "モデル別", "provider": "プロバイダー別", "month": "月別", "day": "日別"}
+        group_by = st.selectbox("集計単位", list(group_labels), format_func=group_labels.get, key="usage_group_by")
+
+    # 期間の片側だけ選択中の間は1日分として扱う
+    start, end = (period[0], period[-1]) if isinstance(period, (tuple, list)) and period else (period, period)
+    if start > end:
+        start, end = end, start
+
+    total = tracker.get_usage_summary(start.isoformat(), end.isoformat())
+    rows = tracker.get_usage_summary(start.isoformat(), end.isoformat(), group_by)
+    total = total[0] if total else {"input_tokens": 0, "output_tokens": 0, "cost_jpy": 0}
+
+    days = (end - start).days + 1
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("期間合計コスト", f"¥{total.get('cost_jpy', 0):,.2f}")
+    with col2:
+        st.metric("1日平均", f"¥{total.get('cost_jpy', 0) / days:,.2f}")
+    with col3:
+        st.metric("トークン（入力 / 出力）", f"{total.get('input_tokens', 0):,} / {total.get('output_tokens', 0):,}")
+
+    if not rows:
+        st.info("この期間の使用データがありません")
+        return
+
+    names = {}
+    if group_by == "product":
+        try:
+            names = {p.get("id"): p.get("name", "名称未設定") for p in DataStore().list_products(columns=["id", "name"])}
+        except Exception as e:
+            print(f"[DEBUG] usage breakdown product names error: {e}")
+
+    table = []
+    for row in rows:
+        key = row[group_by]
+        if group_by == "product":
+            label = names.get(key, key) if key else "（製品未選択）"
+        else:
+            label = key
+        table.append({
+            group_labels[group_by]: label,
+            "コスト(円)": row["cost_jpy"],
+            "呼び出し": row["calls"],
+            "画像": row["image_count"],
+            "入力トークン": row["input_tokens"],
+            "出力トークン": row["output_tokens"]
+        })
+    if group_by in ("day", "month"):
+        table.sort(key=lambda r: r[group_labels[group_by]])
+        st.bar_chart(table, x=group_labels[group_by], y="コスト(円)")
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+
+def render_budget_settings(settings_manager, settings):
+    """一括処理（画像一括生成・ワイヤーフレーム一括生成・メンバーAI診断）の予算設定"""
+    from modules.budget import get_budget_limits
+
+    st.subheader("💴 予算")
+    st.caption("一括処理の実行前に概算コストを表示し、実行中に上限に達したら残りの処理を止めます。0は無制限")
+
+    limits = get_budget_limits(settings)
+    col1, col2 = st.columns(2)
+    with col1:
+        per_run = st.number_input("1回の実行あたり（円）", min_value=0, step=100, value=int(limits["per_run_jpy"]), key="budget_per_run")
+        per_day = st.number_input("1日あたり（円）", min_value=0, step=100, value=int(limits["per_day_jpy"]), key="budget_per_day")
+    with col2:
+        per_product = st.number_input("製品ごとの今月（円）", min_value=0, step=100, value=int(limits["per_product_month_jpy"]), key="budget_per_product")
+        per_run_seconds = st.number_input("1回の実行の所要時間（秒）", min_value=0, step=60, value=int(limits["per_run_seconds"]), key="budget_per_run_seconds")
+
+    if st.button("予算設定を保存", key="save_budget_settings", type="primary"):
+        settings["budget"] = {
+            "per_run_jpy": int(per_run),
+            "per_day_jpy": int(per_day),
+            "per_product_month_jpy": int(per_product),
+            "per_run_seconds": int(per_run_seconds)
+        }
+        settings_manager.update_settings(settings)
+        st.success("保存しました")
+
+
 def render_usage_stats(settings_manager, settings):
     """API使用状況を表示"""
-    from modules.usage_tracker import UsageTracker
+    from modules.usage_tracker import get_usage_tracker
     import json
     
-    tracker = UsageTracker()
+    tracker = get_usage_tracker()
     
     # 料金データを読み込み
     try:
@@ -84,6 +179,28 @@ def render_usage_stats(settings_manager, settings):
     else:
         st.info("まだ使用データがありません")
     
+    # レスポンスキャッシュ
+    cache_stats = today.get("cache")
+    if cache_stats:
+        hits = cache_stats.get("hits", 0)
+        misses = cache_stats.get("misses", 0)
+        hit_rate = hits / (hits + misses) * 100 if (hits + misses) else 0
+        st.caption(f"🗃️ レスポンスキャッシュ: ヒット {hits:,} / ミス {misses:,}（ヒット率 {hit_rate:.0f}%）")
+
+    # 製品キャッシュ（このプロセスの起動以降）
+    from modules.data_store import DataStore
+    product_cache = DataStore().get_cache_stats()
+    if product_cache["hits"] or product_cache["misses"]:
+        st.caption(f"📦 製品キャッシュ: ヒット {product_cache['hits']:,} / ミス {product_cache['misses']:,}（ヒット率 {product_cache['hit_rate'] * 100:.0f}%、保持 {product_cache['entries']}件）")
+
+    st.markdown("---")
+
+    render_usage_breakdown(tracker)
+
+    st.markdown("---")
+
+    render_budget_settings(settings_manager, settings)
+
     st.markdown("---")
     
     # 料金設定
@@ -144,7 +261,7 @@ def render_usage_stats(settings_manager, settings):
     
     # 画像生成料金（編集可能）
     with st.expander("🖼️ 画像生成料金 ($/100万トークン)", expanded=False):
-        st.caption("※ 最新APIはトークンベース料金です")
+        st.caption("※ 最新APIはトークンベース料金です（input/output）。サイズ別の項目（例: 1024x1024、HDは _hd）はDALL-Eの1枚あたりの料金（$/枚）です")
         image_pricing = pricing_data.get("image_generation", {})
         img_pricing_changed = False
         
@@ -817,6 +934,135 @@ def render_llm_settings(settings_manager, settings, models_config):
         st.caption(f"画像分析: {task_models.get('image_analysis_provider', '')} / {task_models.get('image_analysis')}")
     else:
         st.caption("画像分析: デフォルトモデルを使用")
+    
+    # 並列実行設定
+    st.markdown("---")
+    st.subheader("⚡ 並列実行設定")
+    st.caption("LP診断のペルソナ評価・メンバーAI評価、参考LP画像分析、全ページ画像生成を同時に実行する数の上限です（APIのレート制限に応じて調整）")
+    
+    max_workers = st.number_input(
+        "同時実行数の上限",
+        min_value=1,
+        max_value=16,
+        value=int(settings.get("diagnosis_max_workers", 4)),
+        key="diagnosis_max_workers_input"
+    )
+    reference_workers = st.number_input(
+        "参考LP画像分析の同時実行数",
+        min_value=1,
+        max_value=16,
+        value=int(settings.get("reference_analysis_max_workers", 4)),
+        key="reference_analysis_max_workers_input"
+    )
+    image_workers = st.number_input(
+        "画像生成の同時実行数",
+        min_value=1,
+        max_value=8,
+        value=int(settings.get("image_generation_max_workers", DEFAULT_IMAGE_MAX_WORKERS)),
+        key="image_generation_max_workers_input"
+    )
+    employee_parallel = st.checkbox(
+        "メンバーAI診断を並列実行する",
+        value=settings.get("employee_diagnosis_parallel", True),
+        key="employee_diagnosis_parallel_check"
+    )
+    
+    if st.button("並列実行設定を保存", key="save_parallel_settings", type="primary"):
+        settings["diagnosis_max_workers"] = int(max_workers)
+        settings["employee_diagnosis_parallel"] = employee_parallel
+        settings["reference_analysis_max_workers"] = int(reference_workers)
+        settings["image_generation_max_workers"] = int(image_workers)
+        settings_manager.update_settings(settings)
+        st.success("保存しました")
+
+    # レート制限設定
+    st.markdown("---")
+    st.subheader("🚦 レート制限")
+    st.caption("プロバイダごとの1分あたりのリクエスト数（RPM）・トークン数（TPM）の上限です。0は無制限。429エラー時はRetry-Afterに従って自動で待機・再試行します")
+
+    rate_limits = settings.get("rate_limits", {})
+    new_rate_limits = {}
+    for provider_key, provider_label in [("gemini", "Gemini"), ("openai", "OpenAI"), ("anthropic", "Anthropic")]:
+        limits = rate_limits.get(provider_key, {})
+        col1, col2 = st.columns(2)
+        with col1:
+            rpm = st.number_input(f"{provider_label} RPM", min_value=0, value=int(limits.get("rpm", 0)), key=f"rate_limit_rpm_{provider_key}")
+        with col2:
+            tpm = st.number_input(f"{provider_label} TPM", min_value=0, step=10000, value=int(limits.get("tpm", 0)), key=f"rate_limit_tpm_{provider_key}")
+        if rpm or tpm:
+            new_rate_limits[provider_key] = {"rpm": int(rpm), "tpm": int(tpm)}
+    max_retries = st.number_input(
+        "最大再試行回数",
+        min_value=0,
+        max_value=10,
+        value=int(settings.get("rate_limit_max_retries", DEFAULT_MAX_RETRIES)),
+        key="rate_limit_max_retries_input"
+    )
+
+    if st.button("レート制限設定を保存", key="save_rate_limit_settings", type="primary"):
+        # モデル個別の上限（"provider/model"キー）は画面から消さずに残す
+        for key, value in rate_limits.items():
+            if "/" in key:
+                new_rate_limits[key] = value
+        settings["rate_limits"] = new_rate_limits
+        settings["rate_limit_max_retries"] = int(max_retries)
+        settings_manager.update_settings(settings)
+        st.success("保存しました")
+
+    # レスポンスキャッシュ設定
+    st.markdown("---")
+    st.subheader("🗃️ レスポンスキャッシュ")
+    st.caption("同じプロバイダ・モデル・プロンプト（・画像）の問い合わせは保存済みの応答を返します")
+    
+    cache_settings = settings.get("response_cache", {})
+    cache_enabled = st.checkbox(
+        "レスポンスキャッシュを有効にする",
+        value=cache_settings.get("enabled", False),
+        key="response_cache_enabled"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        cache_ttl = st.number_input(
+            "有効期間（時間）",
+            min_value=1,
+            value=int(cache_settings.get("ttl_hours", DEFAULT_TTL_HOURS)),
+            key="response_cache_ttl"
+        )
+    with col2:
+        cache_max_entries = st.number_input(
+            "最大保存件数",
+            min_value=100,
+            step=100,
+            value=int(cache_settings.get("max_entries", DEFAULT_MAX_ENTRIES)),
+            key="response_cache_max_entries"
+        )
+    bypass_tasks = st.text_input(
+        "キャッシュしないタスク（カンマ区切り）",
+        value=", ".join(cache_settings.get("bypass_tasks", DEFAULT_BYPASS_TASKS)),
+        help="ブラッシュアップやバリエーションなど、毎回違う結果が欲しいタスク",
+        key="response_cache_bypass"
+    )
+    
+    cache = get_response_cache(settings)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("キャッシュ設定を保存", key="save_response_cache", type="primary"):
+            settings["response_cache"] = {
+                **cache_settings,
+                "enabled": cache_enabled,
+                "ttl_hours": int(cache_ttl),
+                "max_entries": int(cache_max_entries),
+                "bypass_tasks": [t.strip() for t in bypass_tasks.split(",") if t.strip()]
+            }
+            settings_manager.update_settings(settings)
+            st.success("保存しました")
+    with col2:
+        if cache and st.button("キャッシュをクリア", key="clear_response_cache"):
+            cache.clear()
+            st.success("キャッシュをクリアしました")
+    
+    if cache:
+        st.caption(f"保存件数: {cache.stats()['entries']:,}件")
 
 def render_image_settings(settings_manager, settings, models_config):
     st.subheader("画像生成AI設定")
@@ -949,6 +1195,27 @@ def render_api_key_status():
                 st.caption(res.text)
         except Exception as e:
             st.error(f"❌ Supabase接続: 通信エラー ({e})")
+
+        # 製品保存の同期状況（ライトビハインド時のみ）
+        sync_status = ds.get_sync_status()
+        if sync_status is None:
+            st.caption("保存方式: 即時書き込み（環境変数 SUPABASE_WRITE_BEHIND=1 でバックグラウンド同期）")
+        else:
+            st.caption(
+                f"🔄 バックグラウンド同期: 未同期 {sync_status['pending']}件"
+                f"（最大遅延 {sync_status['lag_seconds']:.0f}秒）/ 同期済み {sync_status['synced']:,}件"
+                f" / 競合でスキップ {sync_status['conflicts']}件"
+            )
+            if sync_status["failed"]:
+                st.error(f"❌ Supabaseへの同期に失敗した製品が {len(sync_status['failed'])}件あります（ローカルには保存済み）")
+                for item in sync_status["failed"]:
+                    st.caption(f"{item['product_id']}: {item['error']}（{item['attempts']}回失敗）")
+                if st.button("失敗した同期を再試行", key="retry_failed_sync"):
+                    ds.retry_failed_sync()
+                    st.rerun()
+            if sync_status["pending"] and st.button("今すぐ同期", key="flush_sync"):
+                ds.flush_sync()
+                st.rerun()
     else:
         st.error("❌ Supabase設定: 無効（環境変数が設定されていません）")
     
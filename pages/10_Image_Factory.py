@@ -121,7 +121,7 @@ with tab1:
             st.success("✅ 生成準備完了")
             
             # 製品選択
-            products = data_store.list_products()
+            products = data_store.list_products(columns=["id", "name"], order_by="updated_at")
             if products:
                 product_options = {p['id']: p['name'] for p in products}
                 selected_product_id = st.selectbox(
@@ -0,0 +1,88 @@
+import sys
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.ai_provider import AIProvider
+from modules.budget import BudgetRun, estimate_image_cost
+from modules.usage_ledger import UsageLedger
+from modules.usage_tracker import UsageTracker
+
+class TestBudgetRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = UsageLedger(os.path.join(self.tmp.name, "ledger.sqlite3"), legacy_log_path=None)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run_limit_stops_remaining_items(self):
+        """Items are skipped once actual spend plus the next estimate exceeds the per-run limit"""
+        run = BudgetRun({"budget": {"per_run_jpy": 25}}, label="batch", ledger=self.ledger)
+        calls = []
+
+        def generate(i):
+            calls.append(i)
+            run.add_cost(10.0)
+            return i
+
+        results = [run.call(8.0, generate, i) for i in range(5)]
+        self.assertEqual(results, [0, 1, None, None, None])
+        self.assertEqual(calls, [0, 1])
+        self.assertIn("1回の実行の上限", run.stopped_reason)
+        self.assertEqual(run.summary()["skipped"], 3)
+
+    def test_day_and_product_limits_use_recorded_spend(self):
+        """Spend already in the ledger counts against the daily and per-product limits"""
+        self.ledger.record("text", provider="gpt", function="chat", cost_jpy=90.0, product_id="p1")
+        self.assertIsNone(BudgetRun({"budget": {"per_day_jpy": 100}}, ledger=self.ledger).check_estimate(10.0))
+        self.assertIn("1日の上限", BudgetRun({"budget": {"per_day_jpy": 100}}, ledger=self.ledger).check_estimate(11.0))
+
+        settings = {"budget": {"per_product_month_jpy": 50}}
+        self.assertIsNotNone(BudgetRun(settings, product_id="p1", ledger=self.ledger).check_estimate(1.0))
+        self.assertIsNone(BudgetRun(settings, product_id="p2", ledger=self.ledger).check_estimate(1.0))
+
+    def test_ledger_is_read_once_and_run_spend_counts_against_day_limit(self):
+        """Reservations do not query the ledger; spend during the run is added to the starting day total"""
+        self.ledger.record("text", provider="gpt", function="chat", cost_jpy=80.0, product_id="p1")
+        run = BudgetRun({"budget": {"per_day_jpy": 100, "per_product_month_jpy": 100}}, product_id="p1", ledger=self.ledger)
+        with patch.object(self.ledger, "query", side_effect=AssertionError("ledger queried under the lock")):
+            self.assertTrue(run.reserve(5.0))
+            run.add_cost(10.0)
+            run.release(5.0)
+            self.assertTrue(run.reserve(5.0))
+            run.add_cost(6.0)
+            run.release(5.0)
+            self.assertFalse(run.reserve(5.0))
+        self.assertIn("1日の上限", run.stopped_reason)
+
+    def test_dalle_images_are_charged_per_image(self):
+        """DALL-E results without token usage are charged the per-image price from the shipped pricing table"""
+        run = BudgetRun({}, ledger=self.ledger)
+        provider = AIProvider({}, product_id="p1")
+        provider.budget_run = run
+        with patch("modules.usage_tracker.get_usage_ledger", return_value=self.ledger):
+            tracker = UsageTracker()
+        session = MagicMock()
+        session.get.return_value = SimpleNamespace(status_code=200, content=b"png")
+        response = SimpleNamespace(data=[SimpleNamespace(url="https://example.com/a.png")], usage=None)
+
+        with patch("modules.ai_provider.get_usage_tracker", return_value=tracker), \
+             patch("modules.ai_provider.get_http_session", return_value=session), \
+             patch("builtins.open", unittest.mock.mock_open()):
+            result = provider._save_dalle_result(response, "1024x1024")
+
+        per_image = 0.04 * tracker.pricing.get_exchange_rate()
+        self.assertEqual(result["url"], "https://example.com/a.png")
+        self.assertAlmostEqual(run.spent_jpy, per_image)
+        self.assertAlmostEqual(self.ledger.query("2000-01-01", "2999-12-31", "product")[0]["cost_jpy"], per_image)
+        with patch("modules.budget.get_usage_tracker", return_value=tracker):
+            self.assertAlmostEqual(estimate_image_cost("openai", "dall-e-3", ["a", "b"]), per_image * 2)
+
+if __name__ == "__main__":
+    unittest.main()
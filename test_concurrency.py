@@ -0,0 +1,72 @@
+import sys
+import os
+import time
+import asyncio
+import unittest
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules import ai_clients
+from modules.concurrency import run_parallel, gather_limited, run_sync
+
+class TestRunParallel(unittest.TestCase):
+    def test_results_keep_input_order(self):
+        """Results are returned in input order even when tasks finish out of order"""
+        delays = [0.05, 0.01, 0.03, 0.0]
+        results = run_parallel(lambda d: (time.sleep(d), d)[1], delays, max_workers=4)
+        self.assertEqual(results, delays)
+
+    def test_failed_task_yields_none_and_progress_reports_all(self):
+        """A raising task becomes None and progress is reported for every item"""
+        progress = []
+
+        def task(x):
+            if x == 2:
+                raise ValueError("boom")
+            return x * 10
+
+        results = run_parallel(task, [1, 2, 3], max_workers=2,
+                               on_progress=lambda done, total, i, r: progress.append((done, total)))
+        self.assertEqual(results, [10, None, 30])
+        self.assertEqual(sorted(progress), [(1, 3), (2, 3), (3, 3)])
+
+    def test_runs_concurrently(self):
+        """Wall time is close to the slowest task rather than the sum"""
+        start = time.time()
+        run_parallel(lambda _: time.sleep(0.2), range(4), max_workers=4)
+        self.assertLess(time.time() - start, 0.6)
+
+class TestGatherLimited(unittest.TestCase):
+    def test_order_and_concurrency_limit(self):
+        """Results keep input order and no more than max_concurrency coroutines run at once"""
+        running = {"now": 0, "peak": 0}
+
+        async def task(x):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01 * (5 - x))
+            running["now"] -= 1
+            return x
+
+        results = run_sync(gather_limited([task(x) for x in range(5)], max_concurrency=2))
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual(running["peak"], 2)
+
+    def test_run_sync_closes_loop_clients(self):
+        """Async clients created inside run_sync are closed and dropped before it returns"""
+        closed = []
+
+        class FakeClient:
+            async def close(self):
+                closed.append(self)
+
+        async def use_client():
+            return ai_clients._get_or_create_async(("fake", "key"), FakeClient)
+
+        client = run_sync(use_client())
+        self.assertEqual(closed, [client])
+        self.assertEqual(len(ai_clients._async_clients), 0)
+
+if __name__ == "__main__":
+    unittest.main()
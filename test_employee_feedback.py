@@ -0,0 +1,78 @@
+import sys
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.data_store import DataStore
+
+class FakeQuery:
+    def __init__(self, client):
+        self.client = client
+        self.ids = None
+        self.max_rows = None
+
+    def select(self, columns):
+        return self
+
+    def in_(self, column, values):
+        self.ids = list(values)
+        return self
+
+    def eq(self, column, value):
+        self.ids = [value]
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    def execute(self):
+        self.client.calls.append((self.ids, self.max_rows))
+        rows = [r for r in self.client.rows if r["employee_id"] in self.ids]
+        rows.sort(key=lambda r: r["created_at"], reverse=True)
+        return SimpleNamespace(data=rows[:self.max_rows])
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def table(self, name):
+        return FakeQuery(self)
+
+class TestEmployeeFeedbackBatch(unittest.TestCase):
+    def setUp(self):
+        with patch.object(DataStore, "__init__", return_value=None):
+            self.ds = DataStore()
+
+    def test_batch_is_capped_and_refetches_truncated_members(self):
+        """The batch query is limited to limit x members; members starved by truncation are fetched individually"""
+        rows = [{"employee_id": "busy", "created_at": f"2025-02-{d:02d}"} for d in range(1, 11)]
+        rows += [{"employee_id": "quiet", "created_at": "2025-01-01"}]
+        self.ds.supabase = FakeSupabase(rows)
+
+        feedback = self.ds.get_employee_feedback_batch(["busy", "quiet"], limit=3)
+
+        self.assertEqual(self.ds.supabase.calls, [(["busy", "quiet"], 6), (["quiet"], 3)])
+        self.assertEqual([r["created_at"] for r in feedback["busy"]], ["2025-02-10", "2025-02-09", "2025-02-08"])
+        self.assertEqual(len(feedback["quiet"]), 1)
+
+    def test_untruncated_batch_uses_one_query(self):
+        """When the capped query returns fewer rows than the cap, no extra queries are made"""
+        rows = [{"employee_id": "a", "created_at": "2025-01-01"}, {"employee_id": "b", "created_at": "2025-01-02"}]
+        self.ds.supabase = FakeSupabase(rows)
+
+        feedback = self.ds.get_employee_feedback_batch(["a", "b"], limit=3)
+
+        self.assertEqual(len(self.ds.supabase.calls), 1)
+        self.assertEqual({k: len(v) for k, v in feedback.items()}, {"a": 1, "b": 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import sys
+import os
+import hashlib
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.image_cache import ImageBlobCache
+
+def _response(status, content=b"", headers=None):
+    response = MagicMock(status_code=status, content=content)
+    response.headers = headers or {}
+    return response
+
+class TestImageBlobCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.session = MagicMock()
+        patcher = patch("modules.image_cache.get_http_session", return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fresh_entry_skips_network(self):
+        """Within max-age the image is served without any request"""
+        cache = ImageBlobCache(self.tmp.name)
+        self.session.get.return_value = _response(200, b"img", {"Content-Type": "image/png", "Cache-Control": "max-age=3600"})
+        self.assertEqual(cache.fetch("https://x/a.png")["content"], b"img")
+        self.assertEqual(cache.fetch("https://x/a.png")["content"], b"img")
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_stale_entry_revalidates_with_etag(self):
+        """A stale entry is revalidated with If-None-Match and reused on 304, even from a new process"""
+        cache = ImageBlobCache(self.tmp.name)
+        self.session.get.return_value = _response(200, b"img", {"ETag": '"v1"'})
+        cache.fetch("https://x/a.png")
+
+        self.session.get.return_value = _response(304)
+        fresh_process = ImageBlobCache(self.tmp.name)
+        self.assertEqual(fresh_process.fetch_bytes("https://x/a.png"), b"img")
+        self.assertEqual(self.session.get.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(fresh_process.stats["revalidated"], 1)
+
+    def test_storage_urls_are_served_locally_within_max_age(self):
+        """Supabase Storage URLs trust max-age like any other URL; overwrites go through invalidate()"""
+        url = "https://p.supabase.co/storage/v1/object/public/b/p1/lp.png"
+        cache = ImageBlobCache(self.tmp.name)
+        self.session.get.return_value = _response(200, b"old", {"ETag": '"v1"', "Cache-Control": "max-age=3600"})
+        cache.fetch(url)
+        self.assertEqual(cache.fetch_bytes(url), b"old")
+        self.assertEqual(self.session.get.call_count, 1)
+
+        cache.invalidate(url)
+        self.session.get.return_value = _response(200, b"new", {"ETag": '"v2"', "Cache-Control": "max-age=3600"})
+        self.assertEqual(cache.fetch_bytes(url), b"new")
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_invalidate_drops_entry(self):
+        """invalidate() removes the index row, blob and hot copy"""
+        cache = ImageBlobCache(self.tmp.name)
+        self.session.get.return_value = _response(200, b"img", {"Cache-Control": "max-age=3600"})
+        cache.fetch("https://x/a.png")
+        cache.invalidate("https://x/a.png")
+
+        key = hashlib.sha256(b"https://x/a.png").hexdigest()
+        self.assertIsNone(cache._get_entry(key))
+        self.assertNotIn(key, cache._hot)
+        cache.fetch("https://x/a.png")
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_lru_eviction_by_size(self):
+        """The least recently used blob is evicted once the size limit is exceeded"""
+        cache = ImageBlobCache(self.tmp.name, max_bytes=10)
+        with patch("modules.image_cache.time.time", side_effect=[1.0, 2.0, 3.0]):
+            for name in ("a", "b", "c"):
+                self.session.get.return_value = _response(200, name.encode() * 4)
+                cache.fetch(f"https://x/{name}.png")
+        key_a = hashlib.sha256(b"https://x/a.png").hexdigest()
+        key_c = hashlib.sha256(b"https://x/c.png").hexdigest()
+        self.assertIsNone(cache._get_entry(key_a))
+        self.assertFalse(os.path.exists(cache._blob_path(key_a)))
+        self.assertIsNotNone(cache._get_entry(key_c))
+
+if __name__ == "__main__":
+    unittest.main()
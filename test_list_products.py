@@ -0,0 +1,43 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.data_store import DataStore
+
+class TestListProducts(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ds = DataStore(data_dir=self.tmp.name)
+        self.ds.use_supabase = False
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_supabase_query_uses_projection_order_and_paging(self):
+        """Projection, ordering and paging are pushed down to PostgREST"""
+        self.ds.use_supabase = True
+        self.ds._get_all_from_supabase = MagicMock(return_value=[{"id": "p1", "name": "A"}])
+        self.ds.list_products(columns=["id", "name"], order_by="updated_at", limit=20, offset=40)
+        params = self.ds._get_all_from_supabase.call_args.args[0]
+        self.assertEqual(params, {"select": "id,name", "order": "updated_at.desc.nullslast", "limit": 20, "offset": 40})
+
+    def test_local_summaries_are_projected_sorted_and_paged(self):
+        """The local fallback applies the same projection, order and paging"""
+        for i, updated_at in enumerate(["2024-01-02", "2024-01-03", "2024-01-01"]):
+            product = {"id": f"p{i}", "name": f"P{i}", "updated_at": updated_at, "lp_analyses": ["big"]}
+            with open(os.path.join(self.tmp.name, f"p{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(product, f)
+
+        page = self.ds.list_product_summaries(limit=2)
+        self.assertEqual([p["id"] for p in page], ["p1", "p0"])
+        self.assertNotIn("lp_analyses", page[0])
+        self.assertEqual([p["id"] for p in self.ds.list_product_summaries(updated_before="2024-01-02")], ["p2"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.local_store import LocalJsonStore
+
+class TestLocalJsonStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "p1.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rapid_writes_are_coalesced_and_readable_before_flush(self):
+        """Successive saves within the window become one compact atomic write"""
+        store = LocalJsonStore(debounce_seconds=60)
+        for i in range(5):
+            store.write(self.path, {"id": "p1", "name": "日本語", "n": i})
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(store.read(self.path)["n"], 4)
+        store.flush()
+
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read()
+        self.assertEqual(json.loads(content), {"id": "p1", "name": "日本語", "n": 4})
+        self.assertNotIn("\n", content)
+        self.assertEqual(store.stats["writes"], 1)
+        self.assertEqual(store.stats["coalesced"], 4)
+        self.assertEqual(os.listdir(self.tmp.name), ["p1.json"])
+
+    def test_failed_write_keeps_previous_file(self):
+        """A crash while writing leaves the old file intact; pretty output is opt-in"""
+        store = LocalJsonStore(debounce_seconds=0, pretty=True)
+        store.write(self.path, {"v": 1})
+        with patch("modules.local_store.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                store.write(self.path, {"v": 2})
+
+        self.assertEqual(store.read(self.path), {"v": 1})
+        self.assertEqual(store.stats["errors"], 1)
+        self.assertEqual(os.listdir(self.tmp.name), ["p1.json"])
+        with open(self.path, encoding="utf-8") as f:
+            self.assertIn("\n", f.read())
+
+    def test_failed_debounced_write_is_kept_for_retry(self):
+        """A failed background write stays pending with backoff and is reported in stats"""
+        store = LocalJsonStore(debounce_seconds=60)
+        store.write(self.path, {"v": 1})
+        with patch("modules.local_store.os.replace", side_effect=OSError("disk full")):
+            self.assertFalse(store.flush())
+
+        self.assertEqual(store.read(self.path), {"v": 1})
+        self.assertEqual(store.stats["failing"], 1)
+        self.assertIn("disk full", store.stats["last_error"])
+        self.assertFalse(os.path.exists(self.path))
+
+        self.assertTrue(store.flush())
+        self.assertEqual(store.stats["failing"], 0)
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"v": 1})
+
+if __name__ == "__main__":
+    unittest.main()
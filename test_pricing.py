@@ -0,0 +1,62 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.pricing import PricingRegistry, normalize_model
+
+class TestPricingRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "pricing.json")
+        self.write({
+            "usd_to_jpy": 100,
+            "text_generation": {
+                "claude": {"claude-3-opus-20240229": {"input": 15.0, "output": 75.0}, "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0}},
+                "gpt": {"gpt-5.2": {"input": 1.0, "output": 10.0}}
+            },
+            "image_generation": {"dall-e-3": {"input": 0, "output": 40.0, "default": 0.04}}
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def test_aliases_resolve_dated_and_unknown_models(self):
+        """Dated names and newer point releases resolve to their family instead of the first entry"""
+        registry = PricingRegistry(self.path)
+        self.assertEqual(normalize_model("models/Claude-Sonnet-4-20250514"), "claude-sonnet-4")
+        sonnet = registry.text_rates("anthropic", "claude-sonnet-4-latest")
+        self.assertAlmostEqual(sonnet[0], 3e-4)
+        self.assertAlmostEqual(sonnet[1], 1.5e-3)
+        self.assertEqual(registry.text_rates("anthropic", "claude-sonnet-4-5"), registry.text_rates("claude", "claude-sonnet-4"))
+        gpt = registry.text_rates("openai", "gpt-5.2-2025-12-11")
+        self.assertAlmostEqual(gpt[0], 1e-4)
+        self.assertAlmostEqual(gpt[1], 1e-3)
+        # 料金表に無いモデルは先頭のモデル（opus）ではなくプロバイダーの既定料金
+        self.assertEqual(registry.text_rates("claude", "unknown-model"), sonnet)
+        self.assertIsNone(registry.text_rates("mistral", "x"))
+        self.assertTrue(registry.is_image_model("dall-e-3"))
+        self.assertEqual(registry.image_prices("dall-e-3")["default"], 4.0)
+
+    def test_reloads_only_when_file_changes(self):
+        """The file is parsed once and re-read after its mtime changes"""
+        registry = PricingRegistry(self.path)
+        registry.get_exchange_rate()
+        signature = registry._signature
+        registry.get_exchange_rate()
+        self.assertIs(registry._signature, signature)
+
+        self.write({"usd_to_jpy": 160, "text_generation": {}})
+        os.utime(self.path, ns=(signature[0] + 10**9, signature[0] + 10**9))
+        self.assertEqual(registry.get_exchange_rate(), 160)
+
+if __name__ == "__main__":
+    unittest.main()
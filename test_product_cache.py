@@ -0,0 +1,129 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules import data_store
+from modules.data_store import DataStore, ProductCache
+from modules.local_store import get_local_json_store
+
+class TestProductCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        data_store._product_cache = ProductCache()
+        self.ds = DataStore(data_dir=self.tmp.name)
+        self.ds.use_supabase = False
+
+    def tearDown(self):
+        get_local_json_store().flush()
+        self.tmp.cleanup()
+
+    def test_repeated_reads_hit_cache_and_writes_invalidate(self):
+        """Repeated get_product calls load once; update_product forces a reload"""
+        self.ds.save_product({"id": "p1", "name": "A"})
+        self.ds._load_product = MagicMock(wraps=self.ds._load_product)
+
+        first = self.ds.get_product("p1")
+        first["name"] = "mutated by caller"
+        self.assertEqual(self.ds.get_product("p1")["name"], "A")
+        self.assertEqual(self.ds._load_product.call_count, 1)
+
+        self.ds.update_product("p1", {"id": "p1", "name": "B"})
+        self.assertEqual(self.ds.get_product("p1")["name"], "B")
+        self.assertEqual(self.ds._load_product.call_count, 2)
+        self.assertEqual(self.ds.get_cache_stats()["hits"], 1)
+
+    def test_validation_probe_detects_remote_update(self):
+        """With validation on, a changed updated_at on the server is a miss"""
+        self.ds.save_product({"id": "p1", "name": "A"})
+        self.ds.use_supabase = True
+        self.ds.cache_validate = True
+        self.ds._load_product = MagicMock(return_value={"id": "p1", "updated_at": "t1"})
+        self.ds._get_updated_at_from_supabase = MagicMock(return_value="t1")
+
+        self.ds.get_product("p1")
+        self.ds.get_product("p1")
+        self.assertEqual(self.ds._load_product.call_count, 1)
+
+        self.ds._get_updated_at_from_supabase.return_value = "t2"
+        self.ds.get_product("p1")
+        self.assertEqual(self.ds._load_product.call_count, 2)
+
+    def test_patch_product_sends_only_changed_columns(self):
+        """patch_product PATCHes only the given columns and keeps the cache warm"""
+        self.ds.save_product({"id": "p1", "name": "A", "page_contents": {"big": "doc"}})
+        self.ds.get_product("p1")
+        self.ds.use_supabase = True
+        self.ds._patch_supabase = MagicMock(return_value=True)
+        self.ds._load_product = MagicMock()
+
+        self.assertTrue(self.ds.patch_product("p1", {"name": "B"}))
+        sent = self.ds._patch_supabase.call_args.args[1]
+        self.assertEqual(set(sent), {"name", "updated_at"})
+        self.assertEqual(self.ds.get_product("p1")["name"], "B")
+        self.assertEqual(self.ds.get_product("p1")["page_contents"], {"big": "doc"})
+        self.ds._load_product.assert_not_called()
+
+    def test_sections_load_lazily_and_legacy_blob_is_split(self):
+        """A legacy single-file product is migrated; heavy sections load on first access only"""
+        legacy = {"id": "p1", "name": "A", "page_contents": {"top": "x"}, "review_sheet_data": {"rows": [1]}}
+        with open(Path(self.tmp.name) / "p1.json", "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        self.ds._load_sections = MagicMock(wraps=self.ds._load_sections)
+
+        product = self.ds.get_product("p1")
+        self.assertEqual(product["name"], "A")
+        self.ds._load_sections.assert_not_called()
+        self.assertEqual(product["page_contents"], {"top": "x"})
+        self.assertEqual(self.ds._load_sections.call_args.args[1], ["page_contents"])
+
+        # 読み込んでいないセクションは保存しても失われない
+        product["page_contents"] = {"top": "y"}
+        self.ds.update_product("p1", product)
+        get_local_json_store().flush()
+        with open(Path(self.tmp.name) / "p1.json", encoding="utf-8") as f:
+            self.assertNotIn("review_sheet_data", json.load(f))
+        reloaded = self.ds.get_product("p1", sections="all")
+        self.assertEqual(dict(reloaded)["review_sheet_data"], {"rows": [1]})
+        self.assertEqual(reloaded["page_contents"], {"top": "y"})
+        self.assertNotIn("generated_versions", reloaded)
+
+    def test_first_full_row_fetch_keeps_sections(self):
+        """When the column list is unknown, sections from the select=* response are not downloaded again"""
+        self.ds.use_supabase = True
+        self.ds.write_behind = False
+        self.ds._get_from_supabase = MagicMock(return_value={"id": "p1", "name": "A", "page_contents": {"top": "x"}})
+        saved_columns = data_store._product_columns
+        data_store._product_columns = None
+        try:
+            product = self.ds.get_product("p1")
+            self.assertEqual(product["page_contents"], {"top": "x"})
+            self.assertEqual(self.ds.get_product("p1")["page_contents"], {"top": "x"})
+            self.assertEqual(self.ds._get_from_supabase.call_count, 1)
+        finally:
+            data_store._product_columns = saved_columns
+
+    def test_legacy_migration_keeps_newer_section_files(self):
+        """A stale section left in the core file never overwrites an existing section file"""
+        section_dir = Path(self.tmp.name) / "p1"
+        section_dir.mkdir()
+        with open(section_dir / "page_contents.json", "w", encoding="utf-8") as f:
+            json.dump({"top": "new"}, f)
+        with open(Path(self.tmp.name) / "p1.json", "w", encoding="utf-8") as f:
+            json.dump({"id": "p1", "name": "A", "page_contents": {"top": "old"}}, f)
+
+        self.assertEqual(self.ds.get_product("p1")["page_contents"], {"top": "new"})
+        get_local_json_store().flush()
+        with open(section_dir / "page_contents.json", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"top": "new"})
+        with open(Path(self.tmp.name) / "p1.json", encoding="utf-8") as f:
+            self.assertNotIn("page_contents", json.load(f))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules import data_store
+from modules.data_store import DataStore, ProductCache
+from modules.local_store import get_local_json_store
+from modules.product_sync import ProductSyncQueue
+
+class TestProductSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        data_store._product_cache = ProductCache()
+        self.queue = ProductSyncQueue(max_attempts=2)
+        self.ds = DataStore(data_dir=self.tmp.name)
+        self.ds.use_supabase = True
+        self.ds.write_behind = True
+        self.ds._sync_queue = MagicMock(return_value=self.queue)
+        self.ds._save_to_supabase = MagicMock()
+        self.ds._get_updated_at_many = MagicMock(return_value={})
+        self.ds._upsert_products = MagicMock(return_value=(True, None))
+        self.ds._patch_supabase = MagicMock(return_value=True)
+        self.queue._start_worker = MagicMock()  # テストでは flush() で同期する
+
+    def tearDown(self):
+        get_local_json_store().flush()
+        self.tmp.cleanup()
+
+    def test_writes_return_immediately_and_are_coalesced(self):
+        """Saves commit locally without touching Supabase; the worker sends one upsert per product"""
+        self.assertTrue(self.ds.update_product("p1", {"id": "p1", "name": "A"}))
+        self.assertTrue(self.ds.patch_product("p1", {"name": "B", "review_sheet_data": {"x": 1}}))
+        self.ds._save_to_supabase.assert_not_called()
+        self.assertEqual(self.ds.get_product("p1")["name"], "B")
+        self.assertEqual(self.ds.get_sync_status()["pending"], 1)
+
+        self.ds.flush_sync()
+        rows = self.ds._upsert_products.call_args.args[0]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "B")
+        self.assertNotIn("review_sheet_data", rows[0])
+        self.assertEqual(self.ds.get_sync_status()["pending"], 0)
+
+    def test_existing_rows_are_patched_and_new_rows_upserted_in_full(self):
+        """Rows already in Supabase get a PATCH of the changed columns; new rows get the full local row"""
+        self.ds.update_product("p1", {"id": "p1", "name": "A", "description": "d"})
+        self.ds.update_product("p2", {"id": "p2", "name": "B", "description": "e"})
+        self.ds.flush_sync()
+        self.ds._upsert_products.reset_mock()
+
+        self.ds._get_updated_at_many.return_value = {"p1": "2000-01-01T00:00:00+00:00"}
+        self.ds.patch_product("p1", {"description": "changed"})
+        self.ds.patch_product("p2", {"description": "changed"})
+        self.ds.flush_sync()
+
+        pid, changes = self.ds._patch_supabase.call_args.args
+        self.assertEqual(pid, "p1")
+        self.assertEqual(set(changes), {"description", "updated_at"})
+        self.ds._patch_supabase.assert_called_once()
+        rows = self.ds._upsert_products.call_args.args[0]
+        self.assertEqual([(r["id"], r["name"], r["description"]) for r in rows], [("p2", "B", "changed")])
+        self.assertEqual(self.ds.get_sync_status()["pending"], 0)
+
+    def test_remote_newer_wins_and_failures_are_reported(self):
+        """A newer remote updated_at skips the write; repeated failures surface as failed items"""
+        self.ds.update_product("p1", {"id": "p1", "name": "A"})
+        self.ds._get_updated_at_many.return_value = {"p1": "2999-01-01T00:00:00+00:00"}
+        self.ds.flush_sync()
+        self.ds._upsert_products.assert_not_called()
+        self.assertEqual(self.ds.get_sync_status()["conflicts"], 1)
+
+        self.ds._get_updated_at_many.return_value = {}
+        self.ds._upsert_products.return_value = (False, "Status: 500")
+        self.ds.update_product("p2", {"id": "p2", "name": "B"})
+        self.ds.flush_sync()
+        self.ds.flush_sync()
+        failed = self.ds.get_sync_status()["failed"]
+        self.assertEqual([(f["product_id"], f["error"]) for f in failed], [("p2", "Status: 500")])
+
+        self.ds._upsert_products.return_value = (True, None)
+        self.ds.retry_failed_sync()
+        self.ds.flush_sync()
+        self.assertEqual(self.ds.get_sync_status()["failed"], [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import sys
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+import modules.prompt_manager as prompt_manager
+from modules.prompt_manager import PromptManager
+
+class FakeQuery:
+    def __init__(self, client):
+        self.client = client
+        self.op = None
+
+    def select(self, columns, count=None):
+        self.op = "select_all" if columns == "*" else "poll"
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        self.op = "upsert"
+        rows = rows if isinstance(rows, list) else [rows]
+        for row in rows:
+            if not (ignore_duplicates and row["id"] in self.client.rows):
+                self.client.rows[row["id"]] = dict(row)
+        return self
+
+    def execute(self):
+        self.client.calls.append(self.op)
+        rows = list(self.client.rows.values())
+        if self.op == "poll":
+            latest = max(r["updated_at"] for r in rows) if rows else None
+            return SimpleNamespace(data=[{"updated_at": latest}] if rows else [], count=len(rows))
+        return SimpleNamespace(data=rows if self.op == "select_all" else [], count=None)
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = {r["id"]: r for r in rows}
+        self.calls = []
+
+    def table(self, name):
+        return FakeQuery(self)
+
+class TestPromptManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.prompts_file = os.path.join(self.tmp.name, "prompts.json")
+        self.client = FakeSupabase([
+            {"id": "ai_chat", "name": "custom", "description": "", "template": "custom {user_input}", "updated_at": "2025-01-01T00:00:00+00:00"}
+        ])
+        patcher = patch.object(prompt_manager, "_get_supabase_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_shared_load_and_bulk_default_sync(self):
+        """Managers share one load and missing defaults are written in a single upsert"""
+        first = PromptManager(self.prompts_file)
+        second = PromptManager(self.prompts_file)
+
+        self.assertEqual(second.get_prompt("ai_chat", {"user_input": "x"}), "custom x")
+        self.assertEqual(self.client.calls, ["select_all", "upsert"])
+        # 既存の行は上書きせず、不足分だけを保存
+        self.assertEqual(self.client.rows["ai_chat"]["name"], "custom")
+        self.assertEqual(set(self.client.rows), set(PromptManager.DEFAULT_PROMPTS))
+        self.assertIs(first.prompts, second.prompts)
+
+    def test_reload_only_when_remote_changes(self):
+        """Polling checks count/updated_at and reloads only after another writer changes a prompt"""
+        with patch.object(prompt_manager, "PROMPTS_REFRESH_INTERVAL_SECONDS", 0):
+            manager = PromptManager(self.prompts_file)
+            manager.get_prompt("ai_chat")
+            manager.get_prompt("ai_chat")
+            loads = self.client.calls.count("select_all")
+            manager.get_prompt("ai_chat")
+            self.assertEqual(self.client.calls.count("select_all"), loads)
+
+            self.client.rows["ai_chat"] = {**self.client.rows["ai_chat"], "template": "edited", "updated_at": "2099-01-01T00:00:00+00:00"}
+            self.assertEqual(manager.get_prompt("ai_chat"), "edited")
+            self.assertEqual(self.client.calls.count("select_all"), loads + 1)
+
+if __name__ == "__main__":
+    unittest.main()
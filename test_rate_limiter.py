@@ -0,0 +1,64 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.rate_limiter import RateLimiter, error_status
+
+class RateLimitError(Exception):
+    """SDKの429例外を模したもの"""
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.response = MagicMock(headers={"retry-after": retry_after} if retry_after else {})
+
+class TestRateLimiter(unittest.TestCase):
+    def test_rpm_bucket_spaces_requests(self):
+        """Requests beyond the RPM burst are told to wait for the refill"""
+        limiter = RateLimiter()
+        limiter.configure({"rate_limits": {"gemini": {"rpm": 60}}})
+        with patch("modules.rate_limiter.time.monotonic", return_value=100.0):
+            waits = [limiter.reserve("gemini", "m") for _ in range(62)]
+        self.assertEqual(waits[:60], [0.0] * 60)
+        self.assertAlmostEqual(waits[60], 1.0)
+        self.assertAlmostEqual(waits[61], 2.0)
+
+    def test_model_specific_limit_overrides_provider(self):
+        """A provider/model key takes precedence over the provider-wide limit"""
+        limiter = RateLimiter()
+        limiter.configure({"rate_limits": {"gemini": {"rpm": 60}, "gemini/pro": {"rpm": 1}}})
+        with patch("modules.rate_limiter.time.monotonic", return_value=100.0):
+            self.assertEqual(limiter.reserve("gemini", "pro"), 0.0)
+            self.assertAlmostEqual(limiter.reserve("gemini", "pro"), 60.0)
+            self.assertEqual(limiter.reserve("gemini", "flash"), 0.0)
+
+    def test_429_is_retried_and_honours_retry_after(self):
+        """A 429 is retried after at least Retry-After and other errors are raised"""
+        self.assertEqual(error_status(RateLimitError("3")), (429, 3.0))
+        limiter = RateLimiter()
+        func = MagicMock(side_effect=[RateLimitError("3"), "ok"])
+        with patch("modules.rate_limiter.time.sleep") as mock_sleep:
+            self.assertEqual(limiter.call("openai", "gpt", func), "ok")
+        self.assertGreaterEqual(mock_sleep.call_args_list[0].args[0], 3.0)
+        self.assertEqual(limiter.stats["rate_limited"], 1)
+
+        with self.assertRaises(ValueError):
+            limiter.call("openai", "gpt", MagicMock(side_effect=ValueError("bad request")))
+
+    def test_connection_errors_without_status_are_retried(self):
+        """Connection and timeout errors carry no HTTP status but are still retried"""
+        import httpx
+        import openai
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        limiter = RateLimiter()
+        func = MagicMock(side_effect=[openai.APIConnectionError(request=request), httpx.ReadTimeout("timeout"), "ok"])
+        with patch("modules.rate_limiter.time.sleep"):
+            self.assertEqual(limiter.call("openai", "gpt", func), "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(limiter.stats["retries"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.response_cache import ResponseCache, make_cache_key
+from modules.ai_provider import AIProvider, StreamInterrupted
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_depends_on_images(self):
+        """Same prompt with different images must not share a cache entry"""
+        k1 = make_cache_key("gemini", "m", "p", [{"data": "AAAA", "mime_type": "image/png"}])
+        k2 = make_cache_key("gemini", "m", "p", [{"data": "BBBB", "mime_type": "image/png"}])
+        self.assertNotEqual(k1, k2)
+        self.assertEqual(k1, make_cache_key("gemini", "m", "p", ["AAAA"]))
+
+    def test_key_hashes_image_content_for_paths_and_urls(self):
+        """Overwriting an image at the same path or URL changes the cache key"""
+        image_path = os.path.join(self.tmp.name, "lp.png")
+        with open(image_path, "wb") as f:
+            f.write(b"old")
+        k1 = make_cache_key("gemini", "m", "p", [image_path])
+        with open(image_path, "wb") as f:
+            f.write(b"new")
+        self.assertNotEqual(k1, make_cache_key("gemini", "m", "p", [image_path]))
+
+        url = "https://example.supabase.co/storage/v1/object/public/b/lp.png"
+        with patch("modules.image_cache.get_image_cache") as mock_cache:
+            mock_cache.return_value.fetch_bytes.return_value = b"old"
+            k2 = make_cache_key("gemini", "m", "p", [url])
+            mock_cache.return_value.fetch_bytes.return_value = b"new"
+            k3 = make_cache_key("gemini", "m", "p", [url])
+        self.assertNotEqual(k2, k3)
+        self.assertEqual(k3, make_cache_key("gemini", "m", "p", [image_path]))
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are treated as misses"""
+        cache = ResponseCache(self.path, ttl_hours=1)
+        with patch("modules.response_cache.time.time", return_value=1000.0):
+            cache.put("k", "v")
+        with patch("modules.response_cache.time.time", return_value=1000.0 + 1800):
+            self.assertEqual(cache.get("k"), "v")
+        with patch("modules.response_cache.time.time", return_value=1000.0 + 7200):
+            self.assertIsNone(cache.get("k"))
+
+    def test_lru_eviction(self):
+        """The least recently accessed entry is evicted when over capacity"""
+        cache = ResponseCache(self.path, max_entries=2)
+        now = time.time()
+        with patch("modules.response_cache.time.time", side_effect=[now - 4, now - 3, now - 2, now - 1]):
+            cache.put("a", "A")
+            cache.put("b", "B")
+            cache.get("a")      # aを最近使用にする
+            cache.put("c", "C")
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "C")
+
+class TestAskWithCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = {
+            "llm_provider": "gemini",
+            "llm_model": "gemini-test",
+            "response_cache": {"enabled": True, "path": os.path.join(self.tmp.name, "cache.sqlite3")}
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("modules.ai_provider.get_usage_tracker")
+    def test_second_call_is_served_from_cache(self, mock_tracker):
+        """Identical prompts hit the cache; bypass tasks and errors always call the API"""
+        provider = AIProvider(self.settings)
+        provider.google_api_key = "test-key"
+        provider._ask_gemini = MagicMock(return_value="answer")
+
+        self.assertEqual(provider.ask("prompt", "diagnosis_summary"), "answer")
+        self.assertEqual(provider.ask("prompt", "diagnosis_summary"), "answer")
+        self.assertEqual(provider._ask_gemini.call_count, 1)
+        events = [c.args for c in mock_tracker.return_value.record_cache_event.call_args_list]
+        self.assertEqual(events, [("diagnosis_summary", False), ("diagnosis_summary", True)])
+
+        provider.ask("prompt", "brushup_copy")
+        self.assertEqual(provider._ask_gemini.call_count, 2)
+
+        provider._ask_gemini = MagicMock(return_value="Gemini APIエラー: boom")
+        provider.ask("other", "diagnosis_summary")
+        provider.ask("other", "diagnosis_summary")
+        self.assertEqual(provider._ask_gemini.call_count, 2)
+
+    @patch("modules.ai_provider.get_usage_tracker")
+    def test_interrupted_stream_is_not_cached(self, mock_tracker):
+        """A stream that fails midway is flagged incomplete and never cached"""
+        provider = AIProvider(self.settings)
+        provider.google_api_key = "test-key"
+
+        def broken_stream(prompt, images, task):
+            yield "partial "
+            yield "Gemini APIエラー: reset"
+            raise StreamInterrupted("reset")
+        provider._ask_gemini_stream = MagicMock(side_effect=broken_stream)
+
+        stream = provider.ask_stream("prompt", "diagnosis_summary")
+        self.assertEqual("".join(stream), "partial Gemini APIエラー: reset")
+        self.assertFalse(stream.completed)
+
+        provider._ask_gemini_stream = MagicMock(side_effect=lambda prompt, images, task: iter(["full ", "answer"]))
+        stream = provider.ask_stream("prompt", "diagnosis_summary")
+        self.assertEqual("".join(stream), "full answer")
+        self.assertTrue(stream.completed)
+        self.assertEqual(provider._ask_gemini_stream.call_count, 1)
+
+        cached = provider.ask_stream("prompt", "diagnosis_summary")
+        self.assertEqual("".join(cached), "full answer")
+        self.assertTrue(cached.completed)
+        self.assertEqual(provider._ask_gemini_stream.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
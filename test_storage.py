@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules import data_store
+from modules.data_store import DataStore
+
+class TestStorageBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ds = DataStore(data_dir=self.tmp.name)
+        self.ds.supabase = MagicMock()
+        self.ds.supabase_url = "https://proj.supabase.co"
+        self.bucket = self.ds.supabase.storage.from_.return_value
+        data_store._known_buckets.clear()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_upload_images_keeps_order_and_checks_bucket_once(self):
+        """Uploads run concurrently, URLs come back in input order, failures are None"""
+        bucket = MagicMock()
+        bucket.name = "lp-generator-images"
+        self.ds.supabase.storage.list_buckets.return_value = [bucket]
+
+        def upload(path, file, file_options):
+            time.sleep(0.02 if path.endswith("a.png") else 0)
+            if path.endswith("bad.png"):
+                raise RuntimeError("boom")
+        self.bucket.upload.side_effect = upload
+
+        with patch("modules.image_cache.get_image_cache"):
+            urls = self.ds.upload_images([(b"1", "p/a.png"), (b"2", "p/bad.png"), (b"3", "p/c.png")])
+            self.ds.upload_images([(b"4", "p/d.png")])
+
+        self.assertEqual(urls, [
+            "https://proj.supabase.co/storage/v1/object/public/lp-generator-images/p/a.png",
+            None,
+            "https://proj.supabase.co/storage/v1/object/public/lp-generator-images/p/c.png",
+        ])
+        self.assertEqual(self.ds.supabase.storage.list_buckets.call_count, 1)
+        self.ds.supabase.storage.create_bucket.assert_not_called()
+
+    def test_duplicate_uses_server_side_copy_and_never_keeps_old_urls(self):
+        """Storage images are copied server-side; any failure aborts and cleans up the copies"""
+        data_store._known_buckets.add("lp-generator-images")
+        self.ds.use_supabase = True
+        base = "https://proj.supabase.co/storage/v1/object/public/lp-generator-images"
+        original = {
+            "id": "p1", "name": "A",
+            "product_image_urls": [f"{base}/p1/product_images/a.png"],
+            "competitor_analysis_v2": {"competitors": [{"file_urls": [f"{base}/p1/competitors/0/b.png"]}]},
+        }
+        self.ds.get_product = MagicMock(return_value=original)
+        self.ds.supabase.table.return_value.insert.return_value.execute.return_value.data = [{"id": "new"}]
+
+        self.assertEqual(self.ds.duplicate_product("p1"), {"id": "new"})
+        sources = sorted(c.args[0] for c in self.bucket.copy.call_args_list)
+        self.assertEqual(sources, ["p1/competitors/0/b.png", "p1/product_images/a.png"])
+        saved = self.ds.supabase.table.return_value.insert.call_args.args[0]
+        self.assertTrue(saved["product_image_urls"][0].startswith(f"{base}/prod_"))
+        self.assertEqual(original["competitor_analysis_v2"]["competitors"][0]["file_urls"], [f"{base}/p1/competitors/0/b.png"])
+
+        # コピーも再アップロードも失敗した場合は複製しない
+        self.bucket.copy.side_effect = [None, RuntimeError("copy failed")]
+        self.ds.delete_storage_files = MagicMock()
+        with patch("modules.image_cache.get_image_cache") as mock_cache:
+            mock_cache.return_value.fetch_bytes.return_value = None
+            self.assertIsNone(self.ds.duplicate_product("p1"))
+        self.assertEqual(len(self.ds.delete_storage_files.call_args.args[0]), 1)
+        self.assertIn("1/2", self.ds.last_error)
+
+    def test_batch_delete_groups_by_bucket_and_chunks(self):
+        """Paths are removed per bucket in chunks and reported per URL"""
+        base = "https://proj.supabase.co/storage/v1/object/public"
+        urls = [f"{base}/lp-generator-images/p1/{i}.png" for i in range(150)] + [f"{base}/other/x%20y.png"]
+        self.bucket.remove.side_effect = lambda paths: [{"name": p} for p in paths if p != "p1/3.png"]
+
+        report = self.ds.delete_storage_files(urls, background=True).result()
+
+        sizes = [len(c.args[0]) for c in self.bucket.remove.call_args_list]
+        self.assertEqual(sizes, [100, 50, 1])
+        self.assertEqual([c.args[0] for c in self.ds.supabase.storage.from_.call_args_list], ["lp-generator-images", "lp-generator-images", "other"])
+        self.assertEqual(self.bucket.remove.call_args_list[-1].args[0], ["x y.png"])
+        self.assertFalse(report[urls[3]])
+        self.assertEqual(sum(report.values()), 150)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from modules.usage_ledger import UsageLedger
+
+class TestUsageLedger(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "ledger.sqlite3")
+        self.legacy_path = os.path.join(self.tmp.name, "usage_log.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_records_are_not_lost(self):
+        """Parallel writers through separate ledger instances all land in the daily rollup"""
+        ledgers = [UsageLedger(self.path, legacy_log_path=None) for _ in range(4)]
+
+        def record(i):
+            ledgers[i % 4].record("text", provider="claude", function="chat", input_tokens=10, output_tokens=5, cost_jpy=0.5, ts=86400 * 10)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(record, range(200)))
+        ledgers[0].record("image", model="dall-e-3", cost_jpy=6.0, image_count=1, ts=86400 * 10)
+        ledgers[0].record("cache", function="chat", cache_hit=True, ts=86400 * 10)
+
+        day = ledgers[0].get_day(datetime.fromtimestamp(86400 * 10).strftime("%Y-%m-%d"))
+        self.assertEqual(day["total"], {"input_tokens": 2000, "output_tokens": 1000, "cost_jpy": 106.0})
+        self.assertEqual(day["by_function"]["chat"], {"input": 2000, "output": 1000, "cost": 100.0})
+        self.assertEqual(day["by_provider"]["claude"]["input"], 2000)
+        self.assertEqual(day["image_generation"], {"count": 1, "cost_jpy": 6.0})
+        self.assertEqual(day["cache"], {"hits": 1, "misses": 0, "by_function": {"chat": {"hits": 1, "misses": 0}}})
+
+    def test_range_queries_use_rollups_and_breakdowns(self):
+        """Range totals over whole and partial months match per-product and per-task breakdowns"""
+        ledger = UsageLedger(self.path, legacy_log_path=None)
+        events = [
+            (datetime(2025, 1, 20, 12).timestamp(), "persona_evaluation", "p1", 1.0),
+            (datetime(2025, 2, 10, 12).timestamp(), "persona_evaluation", "p1", 2.0),
+            (datetime(2025, 2, 28, 12).timestamp(), "lp_image_analysis", "p2", 4.0),
+            (datetime(2025, 3, 1, 12).timestamp(), "lp_image_analysis", None, 8.0),
+        ]
+        for ts, task, product_id, cost in events:
+            ledger.record("text", provider="gpt", model="gpt-4o", function=task, input_tokens=10, output_tokens=5,
+                          cost_jpy=cost, ts=ts, product_id=product_id)
+        ledger.record("image", model="dall-e-3", function="image_generation", cost_jpy=16.0, image_count=1,
+                      ts=datetime(2025, 2, 15, 12).timestamp(), product_id="p1")
+
+        self.assertEqual(ledger.query("2025-01-20", "2025-03-01")[0]["cost_jpy"], 31.0)
+        by_product = {r["product"]: r["cost_jpy"] for r in ledger.query("2025-01-25", "2025-03-01", "product")}
+        self.assertEqual(by_product, {"p1": 18.0, "p2": 4.0, "": 8.0})
+        by_month = {r["month"]: r["calls"] for r in ledger.query("2025-01-01", "2025-03-31", "month")}
+        self.assertEqual(by_month, {"2025-01": 1, "2025-02": 2, "2025-03": 1})
+        by_task = ledger.query("2025-02-01", "2025-02-28", ["product", "task"], product_id="p1")
+        self.assertEqual([(r["task"], r["cost_jpy"]) for r in by_task], [("image_generation", 16.0), ("persona_evaluation", 2.0)])
+        with self.assertRaises(ValueError):
+            ledger.query("2025-01-01", "2025-01-31", "weekday")
+
+    def test_legacy_log_is_imported_once(self):
+        """Existing usage_log.json totals become rollups exactly once"""
+        legacy = {"2024-01-01": {
+            "total": {"input_tokens": 100, "output_tokens": 50, "cost_jpy": 3.0},
+            "by_function": {"api_call": {"input": 100, "output": 50, "cost": 3.0}},
+            "by_provider": {"gpt": {"input": 100, "output": 50, "cost": 3.0}},
+            "image_generation": {"count": 0, "cost_jpy": 0}
+        }}
+        with open(self.legacy_path, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+
+        UsageLedger(self.path, self.legacy_path)
+        ledger = UsageLedger(self.path, self.legacy_path)
+
+        self.assertEqual(ledger.get_day("2024-01-01"), legacy["2024-01-01"])
+        self.assertIsNone(ledger.get_day("2024-01-02"))
+
+if __name__ == "__main__":
+    unittest.main()